@@ -0,0 +1,68 @@
+"""
+Measures UserRAGVectorDB.add_records latency as a tenant's corpus grows,
+then upsert latency (replacing existing answers) and the compaction that
+drops the replaced vectors. Embeddings are random vectors so only indexing
+and persistence are timed.
+
+    python benchmarks/bench_append.py [total_chunks] [batch_size]
+"""
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot.rag_client import UserRAGVectorDB
+
+
+class RandomEmbeddings:
+    def __init__(self, dim=768):
+        self.dim = dim
+        self.rng = np.random.default_rng(0)
+
+    def embed_documents(self, texts):
+        return self.rng.standard_normal((len(texts), self.dim)).astype("float32")
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def bench_append(total_chunks=20000, batch_size=10):
+    folder = tempfile.mkdtemp(prefix="bench_append_")
+    db = UserRAGVectorDB(folder, RandomEmbeddings())
+    timings = []
+    for start in range(0, total_chunks, batch_size):
+        chunks = [
+            {"chunk_type": "qa", "question": f"Question {start + i}?", "answer": f"Answer {start + i}. " * 20}
+            for i in range(batch_size)
+        ]
+        t0 = time.perf_counter()
+        db.add_records([{"uid": "bench", "meta": {"name": "Bench"}, "chunks": chunks}])
+        timings.append(time.perf_counter() - t0)
+
+    print(f"{'corpus size':>12} {'p50 ms':>8} {'p95 ms':>8}")
+    window = max(1, len(timings) // 10)
+    for i in range(0, len(timings), window):
+        part = np.array(timings[i:i + window]) * 1000
+        print(f"{(i + window) * batch_size:>12} {np.percentile(part, 50):>8.2f} {np.percentile(part, 95):>8.2f}")
+    bench_upsert(db, total_chunks)
+
+
+def bench_upsert(db, total_chunks, count=200):
+    timings = []
+    for i in np.random.default_rng(1).choice(total_chunks, size=min(count, total_chunks), replace=False):
+        t0 = time.perf_counter()
+        db.upsert("bench", None, f"Question {i}?", f"Updated answer {i}.")
+        timings.append(time.perf_counter() - t0)
+    part = np.array(timings) * 1000
+    print(f"\nupsert of {len(timings)} answers: p50 {np.percentile(part, 50):.2f} ms, p95 {np.percentile(part, 95):.2f} ms")
+    t0 = time.perf_counter()
+    db.compact()
+    print(f"compaction dropping {len(timings)} tombstones: {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    bench_append(*args)
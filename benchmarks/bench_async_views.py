@@ -0,0 +1,100 @@
+"""
+Compares sync (one thread per in-flight request) and async (one event loop)
+RAG answering against the stub OpenAI server. Retrieval is replaced by canned
+chunks and the semantic answer cache is off (it would embed every question
+and answer repeats without an LLM call), so only LLM-call concurrency is
+measured.
+
+    python benchmarks/bench_async_views.py [requests] [concurrency] [token_delay_ms]
+"""
+import os
+import sys
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_openai_server import make_server
+
+PORT = 8017
+
+
+CANNED_DOCS = [{"content": f"Q: Question {i}?\nA: Answer {i}.", "meta": {}, "score": 1.0} for i in range(3)]
+
+
+def canned_pipeline():
+    # Imported late so the OPENAI_* and SEMANTIC_CACHE_* settings below are picked up.
+    from chatbot.rag_pipeline import RAGPipeline
+
+    class CannedPipeline(RAGPipeline):
+        def retrieve(self, question, top_k=3):
+            return CANNED_DOCS
+
+    return CannedPipeline("bench", "bench")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def report(label, latencies, elapsed, threads):
+    print(
+        f"{label:<6} {len(latencies) / elapsed:8.1f} req/s  p50 {percentile(latencies, 0.5) * 1000:7.1f}ms  "
+        f"p95 {percentile(latencies, 0.95) * 1000:7.1f}ms  peak threads {threads}"
+    )
+
+
+def bench_sync(pipeline, requests, concurrency):
+    latencies = []
+    peak = [threading.active_count()]
+
+    def one(i):
+        t0 = time.perf_counter()
+        pipeline(f"question {i}")
+        latencies.append(time.perf_counter() - t0)
+        peak[0] = max(peak[0], threading.active_count())
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    report("sync", latencies, time.perf_counter() - t0, peak[0])
+
+
+async def bench_async(pipeline, requests, concurrency):
+    latencies = []
+    peak = [threading.active_count()]
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with slots:
+            t0 = time.perf_counter()
+            await pipeline.acall(f"question {i}")
+            latencies.append(time.perf_counter() - t0)
+            peak[0] = max(peak[0], threading.active_count())
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    report("async", latencies, time.perf_counter() - t0, peak[0])
+
+
+def main(requests=400, concurrency=200, token_delay_ms=5):
+    server = make_server(PORT, tokens=40, token_delay_ms=token_delay_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OPENAI_API_BASE"] = f"http://127.0.0.1:{PORT}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ["OPENAI_MAX_CONNECTIONS"] = str(concurrency)
+    os.environ["OPENAI_MAX_KEEPALIVE_CONNECTIONS"] = str(concurrency)
+    os.environ["SEMANTIC_CACHE_PER_TENANT"] = "0"
+    pipeline = canned_pipeline()
+    print(f"{requests} requests, concurrency {concurrency}, {token_delay_ms}ms/token upstream")
+    bench_sync(pipeline, requests, concurrency)
+    asyncio.run(bench_async(pipeline, requests, concurrency))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
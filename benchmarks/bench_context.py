@@ -0,0 +1,91 @@
+"""
+Prompt context size with build_context vs the old "\\n\\n".join of every
+retrieved chunk. Retrieval results are synthesized the way the file
+splitter produces them (1000-char chunks, 200-char overlap) from a few
+files across field DBs, with the same chunk sometimes returned by more
+than one DB, plus Q&A chunks. Reports context tokens per request, how many
+chunks were merged / deduplicated / dropped, and packing time.
+
+    python benchmarks/bench_context.py [requests] [candidates] [token_budget]
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot.context_builder import build_context, count_tokens, context_metrics
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+def split(text):
+    chunks, start = [], 0
+    while start < len(text):
+        end = min(len(text), start + CHUNK_SIZE)
+        if end < len(text):
+            cut = text.rfind(" ", start, end)
+            end = cut if cut > start else end
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = text.find(" ", max(start + 1, end - CHUNK_OVERLAP)) + 1
+    return chunks
+
+
+def make_corpus(rng, files=6, words=2500):
+    vocabulary = [f"term{i}" for i in range(800)]
+    corpus = []
+    for f in range(files):
+        text = " ".join(rng.choice(vocabulary) for _ in range(words))
+        for index, chunk in enumerate(split(text)):
+            corpus.append({"uid": "bench", "content": chunk, "chunk": {
+                "chunk_type": "file_chunk", "file_name": f"file{f}.pdf", "chunk_index": index, "content": chunk,
+            }})
+    for q in range(40):
+        corpus.append({"uid": "bench", "content": f"Q: Question {q}?\nA: Answer {q} " * 3, "chunk": {"chunk_type": "qa"}})
+    return corpus
+
+
+def retrieved(rng, corpus, candidates):
+    # Hits cluster around a few spots in a file, the way a question matches neighbouring chunks.
+    docs = []
+    while len(docs) < candidates:
+        anchor = rng.randrange(len(corpus))
+        for doc in corpus[anchor:anchor + rng.randint(1, 3)]:
+            docs.append(dict(doc, score=1.0 / (60 + len(docs))))
+            if rng.random() < 0.15:  # same chunk from a second DB
+                docs.append(dict(doc, score=1.0 / (61 + len(docs))))
+    return docs[:candidates]
+
+
+def main(requests=500, candidates=12, token_budget=1500):
+    rng = random.Random(0)
+    corpus = make_corpus(rng)
+    naive_tokens, packed_tokens, seconds = [], [], 0.0
+    for _ in range(requests):
+        docs = retrieved(rng, corpus, candidates)
+        naive_tokens.append(count_tokens("\n\n".join(d["content"] for d in docs)))
+        start = time.perf_counter()
+        packed = build_context(docs, token_budget)
+        seconds += time.perf_counter() - start
+        context_metrics.record(packed.tokens, packed)
+        packed_tokens.append(packed.tokens)
+    stats = context_metrics.stats()
+    naive_tokens.sort()
+    packed_tokens.sort()
+    print(f"{requests} requests, {candidates} candidates, budget {token_budget} tokens ({stats['tokenizer']})")
+    print(f"{'':<14} {'p50 tokens':>11} {'p95 tokens':>11} {'max tokens':>11}")
+    for name, values in (("join all", naive_tokens), ("build_context", packed_tokens)):
+        print(f"{name:<14} {values[len(values) // 2]:11d} {values[int(len(values) * 0.95)]:11d} {values[-1]:11d}")
+    print(
+        f"per request: {stats['duplicates_dropped'] / requests:.2f} duplicates dropped, "
+        f"{stats['chunks_merged'] / requests:.2f} chunks merged, {stats['over_budget'] / requests:.2f} over budget, "
+        f"{stats['truncated'] / requests:.2f} truncated; {seconds / requests * 1000:.3f} ms to pack"
+    )
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,49 @@
+"""
+Throughput of fine-tuned field generation with and without micro-batching.
+Runs `concurrency` simulated users against one field, first calling the HF
+pipeline per prompt (the old behaviour) and then through the registry's
+GenerationBatcher.
+
+    python benchmarks/bench_field_batching.py [model_dir_or_hub_id] [requests] [concurrency] [max_new_tokens]
+"""
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot.llm_registry import FieldLLMRegistry
+
+
+def bench(label, call, requests, concurrency):
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, [f"Question {i}: what do you offer?" for i in range(requests)]))
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<10} {requests / elapsed:6.2f} req/s  ({elapsed:.1f}s for {requests} requests)")
+
+
+def main(model="sshleifer/tiny-gpt2", requests=32, concurrency=8, max_new_tokens=32):
+    registry = FieldLLMRegistry(model_paths={"bench": model}, tokenizer_paths={"bench": model})
+    llm_pipe = registry.get("bench")
+    lock = threading.Lock()
+
+    def unbatched(prompt):
+        # HF pipelines aren't thread-safe; the old view effectively ran one call at a time.
+        with lock:
+            return llm_pipe(prompt, max_new_tokens=max_new_tokens)[0]["generated_text"]
+
+    def batched(prompt):
+        return registry.generate("bench", prompt, max_new_tokens=max_new_tokens)
+
+    print(f"{model}: {requests} requests, {concurrency} concurrent, {max_new_tokens} new tokens")
+    bench("unbatched", unbatched, requests, concurrency)
+    bench("batched", batched, requests, concurrency)
+    print(registry.stats()["batching"])
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(*args[:1], *[int(a) for a in args[1:]])
@@ -0,0 +1,59 @@
+"""
+Recall and latency of each index type in chatbot.index_types against the
+exact flat baseline, on synthetic vectors shaped like bge-base output.
+
+    python benchmarks/bench_index_types.py [vectors] [queries] [dim]
+"""
+import os
+import sys
+import time
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot.index_types import INDEX_TYPES, build_index
+
+TOP_K = 10
+
+
+def embedding_like_vectors(n, dim, rng, latent_dim=64, clusters=200):
+    # Sentence embeddings sit near a low-dimensional manifold; isotropic noise
+    # in all 768 dims would make every neighbour nearly equidistant.
+    projection = np.random.default_rng(1).standard_normal((latent_dim, dim)).astype("float32")
+    centers = np.random.default_rng(2).standard_normal((clusters, latent_dim)).astype("float32")
+    latent = centers[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, latent_dim)).astype("float32")
+    vectors = latent @ projection + 0.05 * rng.standard_normal((n, dim)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main(n=100000, n_queries=200, dim=768):
+    rng = np.random.default_rng(0)
+    vectors = embedding_like_vectors(n, dim, rng)
+    queries = embedding_like_vectors(n_queries, dim, rng)
+    truth = None
+    print(f"{n} vectors, {dim} dims, {n_queries} queries, recall@{TOP_K} vs flat")
+    print(f"{'type':<6} {'build s':>8} {'size MB':>8} {'p50 ms':>7} {'p95 ms':>7} {'recall':>7}")
+    for kind in INDEX_TYPES:
+        t0 = time.perf_counter()
+        index = build_index(kind, vectors, np.arange(n))
+        build_seconds = time.perf_counter() - t0
+        size_mb = faiss.serialize_index(index).nbytes / 1024 / 1024
+        latencies = []
+        found = []
+        for query in queries:
+            t0 = time.perf_counter()
+            _, ids = index.search(query[None, :], TOP_K)
+            latencies.append(time.perf_counter() - t0)
+            found.append(ids[0])
+        if truth is None:
+            truth = found
+        recall = np.mean([len(set(a) & set(b)) / TOP_K for a, b in zip(found, truth)])
+        print(
+            f"{kind:<6} {build_seconds:8.1f} {size_mb:8.1f} {np.percentile(latencies, 50) * 1000:7.2f} "
+            f"{np.percentile(latencies, 95) * 1000:7.2f} {recall:7.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,92 @@
+"""
+Per-request latency of onboarding profile writes (name, contact, email,
+field) in each WriteBehindBuffer mode, against a mongomock collection that
+sleeps `rtt_ms` per round trip to stand in for a remote MongoDB. After each
+run the collection is checked against the expected documents, so the
+benchmark doubles as a correctness check for coalescing and flushing.
+
+    pip install mongomock
+    python benchmarks/bench_profile_writes.py [users] [concurrency] [rtt_ms]
+"""
+import os
+import sys
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("MONGO_URI", "mongodb://bench.invalid")
+
+import mongomock
+from chatbot.profile_writes import WriteBehindBuffer
+
+
+class RemoteCollection:
+    """mongomock collection with a fixed network round trip per call."""
+
+    def __init__(self, rtt_ms):
+        self.collection = mongomock.MongoClient().db.users
+        self.rtt = rtt_ms / 1000
+        self.round_trips = 0
+
+    def bulk_write(self, operations, ordered=True):
+        time.sleep(self.rtt)
+        self.round_trips += 1
+        return self.collection.bulk_write(operations, ordered=ordered)
+
+
+def onboard(buffer, user):
+    uid = f"user-{user}"
+    latencies = []
+    for fields, upsert in (
+        ({"name": f"Company {user}"}, True),
+        ({"contact": f"07{user:08d}"}, False),
+        ({"email": f"owner{user}@example.com"}, False),
+        ({"field": ("agriculture", "tourism", "transport")[user % 3]}, False),
+    ):
+        start = time.perf_counter()
+        buffer.set(uid, fields, upsert=upsert)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def expected(user):
+    return {
+        "uid": f"user-{user}",
+        "name": f"Company {user}",
+        "contact": f"07{user:08d}",
+        "email": f"owner{user}@example.com",
+        "field": ("agriculture", "tourism", "transport")[user % 3],
+    }
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main(users=500, concurrency=16, rtt_ms=2.0):
+    print(f"{users} onboardings x 4 writes, {concurrency} threads, {rtt_ms} ms Mongo round trip")
+    print(f"{'mode':<10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'round trips':>12} {'drain s':>8}")
+    for mode in ("sync", "buffered", "journaled"):
+        remote = RemoteCollection(rtt_ms)
+        journal = os.path.join(tempfile.mkdtemp(prefix="bench_profile_"), "journal.sqlite3")
+        buffer = WriteBehindBuffer(lambda: remote, mode=mode, journal_path=journal)
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = [ms for result in pool.map(lambda u: onboard(buffer, u), range(users)) for ms in result]
+        start = time.perf_counter()
+        buffer.close()
+        drain = time.perf_counter() - start
+        documents = {doc["uid"]: doc for doc in remote.collection.find({}, {"_id": 0})}
+        wrong = sum(documents.get(f"user-{user}") != expected(user) for user in range(users))
+        print(
+            f"{mode:<10} {percentile(latencies, 0.5):8.3f} {percentile(latencies, 0.95):8.3f} "
+            f"{percentile(latencies, 0.99):8.3f} {remote.round_trips:12d} {drain:8.2f}"
+            + (f"  {wrong} wrong documents" if wrong else "")
+        )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(*[int(a) for a in args[:2]], *[float(a) for a in args[2:3]])
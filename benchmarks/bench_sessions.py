@@ -0,0 +1,148 @@
+"""
+Onboarding session load/save under concurrent users, for each
+SESSION_BACKEND (db, checkpoint, cache, cookie). Each thread plays users
+through the chatbot_api turns (name, contact, email, field, question
+answers, smart-assistant entries) and the session is loaded and saved
+once per turn, as the session middleware does. Reports per-turn latency,
+throughput, and the SQLite writes each mode issued. Every mode runs in
+its own process against a fresh SQLite file.
+
+    python benchmarks/bench_sessions.py [users] [threads] [answers]
+"""
+import os
+import sys
+import time
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ENGINES = {
+    "db": "django.contrib.sessions.backends.db",
+    "checkpoint": "chatbot.session_backend",
+    "cache": "django.contrib.sessions.backends.cache",
+    "cookie": "django.contrib.sessions.backends.signed_cookies",
+}
+
+
+def turns(user, answers):
+    """(session updates, checkpoint) per request of one onboarding."""
+    yield {"uid": f"uid-{user}", "name": f"Company {user}", "company_name": f"Company {user}", "answers": {},
+           "field": None, "contact": None, "email": None, "dual_agents_ready": False}, False
+    yield {"contact": f"07{user:08d}"}, False
+    yield {"email": f"owner{user}@example.com"}, False
+    yield {"field": "tourism"}, False
+    for i in range(answers):
+        yield {("answers", f"Question {i} for a tourism business?"): f"Answer {i} " * 8}, False
+    yield {"answers": None, "llm_data": [], "llm_data_active": True}, True
+    for i in range(answers // 2):
+        yield {("llm_data", i): (f"More detail {i}", f"Assistant reply {i} " * 6)}, False
+    yield {"llm_data": [], "llm_data_active": False, "dual_agents_prompt": True}, True
+
+
+def apply(session, updates):
+    for key, value in updates.items():
+        if isinstance(key, tuple):
+            name, item = key
+            container = session.get(name)
+            if isinstance(container, list):
+                container.append(value)
+            else:
+                container[item] = value
+            session[name] = container
+        elif value is None and key in session:
+            del session[key]
+        else:
+            session[key] = value
+    session.modified = True
+
+
+def run_mode(mode, users, threads, answers, results):
+    import django
+    from django.conf import settings
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench_sessions_"), "db.sqlite3")
+    settings.configure(
+        SECRET_KEY="bench",
+        INSTALLED_APPS=["django.contrib.contenttypes", "django.contrib.sessions"],
+        DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": db_path, "OPTIONS": {"timeout": 30}}},
+        SESSION_ENGINE=ENGINES[mode],
+        SESSION_CACHE_ALIAS="sessions",
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "sessions": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "OPTIONS": {"MAX_ENTRIES": 100000}},
+        },
+    )
+    django.setup()
+    from importlib import import_module
+    from django.core.management import call_command
+    from django.db import connection
+    from chatbot.session_backend import checkpoint
+
+    call_command("migrate", verbosity=0)
+    store_class = import_module(settings.SESSION_ENGINE).SessionStore
+    writes = [0]
+    writes_lock = threading.Lock()
+
+    def count_writes(execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE")):
+            with writes_lock:
+                writes[0] += 1
+        return execute(sql, params, many, context)
+
+    def onboard(user):
+        latencies, errors = [], 0
+        key = None
+        with connection.execute_wrapper(count_writes):
+            for updates, milestone in turns(user, answers):
+                start = time.perf_counter()
+                try:
+                    session = store_class(session_key=key)
+                    apply(session, updates)
+                    if milestone:
+                        checkpoint(session)
+                    session.save()
+                    key = session.session_key
+                except Exception:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+        connection.close()
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        outcomes = list(pool.map(onboard, range(users)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(ms for result, _ in outcomes for ms in result)
+    results.put({
+        "mode": mode,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95)],
+        "p99": latencies[int(len(latencies) * 0.99)],
+        "turns_per_s": len(latencies) / elapsed,
+        "db_writes": writes[0],
+        "errors": sum(errors for _, errors in outcomes),
+    })
+
+
+def main(users=400, threads=16, answers=10):
+    print(f"{users} onboardings ({answers} answers each), {threads} threads")
+    print(f"{'mode':<11} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'turns/s':>9} {'db writes':>10} {'errors':>7}")
+    context = multiprocessing.get_context("spawn")
+    for mode in ENGINES:
+        results = context.Queue()
+        process = context.Process(target=run_mode, args=(mode, users, threads, answers, results))
+        process.start()
+        row = results.get()
+        process.join()
+        print(
+            f"{row['mode']:<11} {row['p50']:8.3f} {row['p95']:8.3f} {row['p99']:8.3f} "
+            f"{row['turns_per_s']:9.0f} {row['db_writes']:10d} {row['errors']:7d}"
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,138 @@
+"""
+Per-tenant folders vs one shared DB per field (RAG_SHARED_FIELDS) for many
+small tenants: build time, resident memory, open files, files on disk, and
+vector / keyword search latency for random tenants. Each layout runs in its
+own process so memory and file handles are measured separately. Embeddings
+are random vectors, so only storage and search are timed.
+
+    python benchmarks/bench_shared_index.py [tenants] [chunks_per_tenant] [dim] [queries]
+"""
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("RAG_FSYNC", "0")
+
+
+class RandomEmbeddings:
+    model_name = "random"
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.rng = np.random.default_rng(0)
+
+    def embed_documents(self, texts):
+        return self.rng.standard_normal((len(texts), self.dim)).astype("float32")
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def open_files():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return -1
+
+
+def run_layout(shared, tenants, chunks, dim, queries, results):
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+    from chatbot.rag_client import UserRAGDBManager
+
+    base = tempfile.mkdtemp(prefix="bench_shared_")
+    manager = UserRAGDBManager(base_dir=base, embeddings=RandomEmbeddings(dim), shared_fields=shared)
+    rss_before = rss_mb()
+    files_before = open_files()
+    layout = "shared" if shared else "per-folder"
+    t0 = time.perf_counter()
+    for tenant in range(tenants):
+        try:
+            db = manager.get_user_db("Bench", f"tenant{tenant}", "field")
+            db.add_records([{
+                "uid": f"tenant{tenant}",
+                "meta": {"name": f"Tenant {tenant}"},
+                "chunks": [
+                    {"chunk_type": "qa", "question": f"Question {i} of tenant {tenant}?", "answer": f"Answer {i} about topic{i % 7}."}
+                    for i in range(chunks)
+                ],
+            }])
+        except Exception as e:
+            # e.g. EMFILE: every resident per-tenant DB holds SQLite file handles.
+            results.put({"layout": layout, "error": f"failed at tenant {tenant}: {e}"})
+            return
+    build_seconds = time.perf_counter() - t0
+
+    rng = np.random.default_rng(1)
+    vector_ms, keyword_ms = [], []
+    for _ in range(queries):
+        tenant = int(rng.integers(tenants))
+        vector = rng.standard_normal(dim).astype("float32")
+        t0 = time.perf_counter()
+        dbs = manager.get_all_user_dbs("Bench", f"tenant{tenant}")
+        for db in dbs:
+            db.search_by_vector(vector, 6)
+        vector_ms.append((time.perf_counter() - t0) * 1000)
+        t0 = time.perf_counter()
+        for db in dbs:
+            db.keyword_search(f"topic{tenant % 7} question", 6)
+        keyword_ms.append((time.perf_counter() - t0) * 1000)
+
+    disk_files = sum(len(files) for _, _, files in os.walk(base))
+    results.put({
+        "layout": layout,
+        "build_s": build_seconds,
+        "rss_mb": rss_mb() - rss_before,
+        "open_files": open_files() - files_before,
+        "disk_files": disk_files,
+        "vector_p50": np.percentile(vector_ms, 50),
+        "vector_p95": np.percentile(vector_ms, 95),
+        "keyword_p50": np.percentile(keyword_ms, 50),
+        "keyword_p95": np.percentile(keyword_ms, 95),
+    })
+
+
+def main(tenants=10000, chunks=20, dim=384, queries=500):
+    print(f"{tenants} tenants x {chunks} chunks, {dim} dims, {queries} queries (get_all_user_dbs + search)")
+    print(f"{'layout':<11} {'build s':>8} {'RSS MB':>8} {'open fds':>9} {'files':>7} "
+          f"{'vec p50':>8} {'vec p95':>8} {'kw p50':>8} {'kw p95':>8}")
+    context = multiprocessing.get_context("spawn")
+    for shared in (False, True):
+        results = context.Queue()
+        process = context.Process(target=run_layout, args=(shared, tenants, chunks, dim, queries, results))
+        process.start()
+        row = results.get()
+        process.join()
+        if "error" in row:
+            print(f"{row['layout']:<11} {row['error']}")
+            continue
+        print(
+            f"{row['layout']:<11} {row['build_s']:8.1f} {row['rss_mb']:8.1f} {row['open_files']:9d} {row['disk_files']:7d} "
+            f"{row['vector_p50']:8.3f} {row['vector_p95']:8.3f} {row['keyword_p50']:8.3f} {row['keyword_p95']:8.3f}"
+        )
+    print("latencies in ms")
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
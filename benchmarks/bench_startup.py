@@ -0,0 +1,78 @@
+"""
+Cold-start latency of the Django app: wall time of fresh interpreters that
+run django.setup() and then import chatbot.views (what every worker and
+manage.py command pays), the slowest imports by cumulative time from
+`python -X importtime`, and which heavy libraries got imported at boot
+(they should all be deferred to first use).
+
+    python benchmarks/bench_startup.py [runs] [top_imports]
+"""
+import os
+import sys
+import time
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "langchain", "langchain_core",
+                 "langchain_community", "langchain_huggingface", "langchain_openai", "httpx", "pymongo", "faiss")
+
+SETUP = (
+    "import os, django; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chatbot_project.settings'); django.setup()"
+)
+TARGETS = [
+    ("interpreter", "pass"),
+    ("django.setup", SETUP),
+    ("chatbot.views", SETUP + "; import chatbot.views"),
+]
+REPORT = "; import sys; print(','.join(m for m in {heavy!r} if m in sys.modules))"
+
+
+def run(code, importtime=False):
+    env = dict(os.environ, APP_WARMUP="", FIELD_LLM_PREWARM="", PYTHONDONTWRITEBYTECODE="")
+    args = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    start = time.perf_counter()
+    proc = subprocess.run(args, cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}")
+    return elapsed, proc.stdout.strip(), proc.stderr
+
+
+def slowest_imports(stderr, top):
+    # "import time: self [us] | cumulative | imported package", indented by depth.
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name[1:].startswith(" "):  # top-level imports only
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(runs=5, top=10):
+    print(f"{'target':<15} {'p50 ms':>8} {'min ms':>8} {'max ms':>8}  heavy modules imported")
+    views_stderr = None
+    for name, code in TARGETS:
+        try:
+            run(code)  # warm the OS page cache and .pyc files
+            times = []
+            for _ in range(runs):
+                elapsed, heavy, _ = run(code + REPORT.format(heavy=HEAVY_MODULES))
+                times.append(elapsed * 1000)
+        except RuntimeError as e:
+            print(f"{name:<15} failed: {e}")
+            continue
+        times.sort()
+        print(f"{name:<15} {times[len(times) // 2]:8.1f} {times[0]:8.1f} {times[-1]:8.1f}  {heavy or '-'}")
+        if name == "chatbot.views":
+            views_stderr = run(code, importtime=True)[2]
+    if views_stderr:
+        print("\nslowest top-level imports for chatbot.views (cumulative ms)")
+        for cumulative, module in slowest_imports(views_stderr, top):
+            print(f"  {cumulative / 1000:8.1f}  {module}")
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
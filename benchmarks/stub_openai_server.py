@@ -0,0 +1,85 @@
+"""
+Minimal OpenAI-compatible /v1/chat/completions server for local testing of
+streaming and load behaviour without calling OpenRouter.
+
+    python benchmarks/stub_openai_server.py [port] [tokens] [token_delay_ms]
+    OPENAI_API_BASE=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub python manage.py runserver
+"""
+import sys
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOKENS = 40
+TOKEN_DELAY = 0.02
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        words = [f"word{i} " for i in range(TOKENS)]
+        created = int(time.time())
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for word in words:
+                time.sleep(TOKEN_DELAY)
+                self._send_chunk({
+                    "id": "stub", "object": "chat.completion.chunk", "created": created, "model": body.get("model"),
+                    "choices": [{"index": 0, "delta": {"role": "assistant", "content": word}, "finish_reason": None}],
+                })
+            self._send_chunk({
+                "id": "stub", "object": "chat.completion.chunk", "created": created, "model": body.get("model"),
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            })
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+            return
+        time.sleep(TOKEN_DELAY * TOKENS)
+        payload = json.dumps({
+            "id": "stub", "object": "chat.completion", "created": created, "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": TOKENS, "total_tokens": TOKENS},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_chunk(self, data):
+        self._write_chunk(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    # The socketserver default backlog of 5 refuses connections under load tests.
+    request_queue_size = 1024
+
+
+def make_server(port=8001, tokens=TOKENS, token_delay_ms=TOKEN_DELAY * 1000):
+    global TOKENS, TOKEN_DELAY
+    TOKENS = tokens
+    TOKEN_DELAY = token_delay_ms / 1000
+    return StubServer(("127.0.0.1", port), StubHandler)
+
+
+def run(port=8001, tokens=TOKENS, token_delay_ms=TOKEN_DELAY * 1000):
+    server = make_server(port, tokens, token_delay_ms)
+    print(f"Stub OpenAI server on http://127.0.0.1:{port}/v1 ({tokens} tokens, {token_delay_ms}ms/token)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    run(*args)
@@ -1,6 +1,47 @@
+import os
+import sys
 from django.apps import AppConfig
 
+# Heavy clients are created on first use; list any to start in background
+# threads at boot instead: "mongo", "embeddings", "llm".
+APP_WARMUP = [name.strip() for name in os.getenv("APP_WARMUP", "mongo").split(",") if name.strip()]
+# Resume queued and interrupted file ingestion jobs at boot instead of on the next upload.
+INGEST_AUTOSTART = os.getenv("INGEST_AUTOSTART", "1") != "0"
+
+
+def _serves_requests():
+    """False for manage.py commands other than runserver, and in runserver's autoreload parent."""
+    if os.path.basename(sys.argv[0]) != "manage.py":
+        return True  # WSGI / ASGI server
+    if sys.argv[1:2] != ["runserver"]:
+        return False
+    return os.environ.get("RUN_MAIN") == "true" or "--noreload" in sys.argv
+
 
 class ChatbotConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "chatbot"
+
+    def ready(self):
+        # Management commands (migrate, reembed_tenants, ...) don't need warm clients or background writers.
+        if not _serves_requests():
+            return
+        if "mongo" in APP_WARMUP:
+            # Connects and creates the profile indexes (idempotent).
+            from .profiles import profile_repository
+            profile_repository.warm_in_background()
+        if "embeddings" in APP_WARMUP:
+            from .embeddings import shared_embeddings
+            shared_embeddings.warm_in_background()
+        if "llm" in APP_WARMUP:
+            from .rag_pipeline import warm_llm_in_background
+            warm_llm_in_background()
+        if os.getenv("FIELD_LLM_PREWARM"):
+            from .llm_registry import field_llm_registry
+            field_llm_registry.warm_in_background()
+        # Replays profile writes journaled by processes that exited before flushing them.
+        from .profile_writes import profile_writes
+        profile_writes.start()
+        if INGEST_AUTOSTART:
+            from .ingest import ingest_queue
+            ingest_queue.start()
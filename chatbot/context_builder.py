@@ -0,0 +1,182 @@
+import os
+import threading
+from collections import deque
+
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500"))  # 0 = no limit
+RAG_CONTEXT_MIN_TRUNCATED_TOKENS = int(os.getenv("RAG_CONTEXT_MIN_TRUNCATED_TOKENS", "64"))
+# Longest overlap looked for between consecutive chunks; the file splitter uses 200 chars.
+RAG_CONTEXT_MAX_OVERLAP = int(os.getenv("RAG_CONTEXT_MAX_OVERLAP", "400"))
+# tiktoken encoding used to count tokens when installed; otherwise ~4 characters per token.
+RAG_CONTEXT_TOKENIZER = os.getenv("RAG_CONTEXT_TOKENIZER", "cl100k_base")
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(RAG_CONTEXT_TOKENIZER)
+                except Exception:
+                    _encoding = False
+    return _encoding
+
+
+def count_tokens(text):
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_tokens(text, max_tokens):
+    """`text` cut to at most `max_tokens`, on a word boundary when there is one."""
+    encoding = _get_encoding()
+    if encoding:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        text = encoding.decode(tokens[:max_tokens])
+    elif len(text) > max_tokens * CHARS_PER_TOKEN:
+        text = text[:max_tokens * CHARS_PER_TOKEN]
+    else:
+        return text
+    cut = text.rfind(" ")
+    return (text[:cut] if cut > len(text) // 2 else text).rstrip() + " ..."
+
+
+def _overlap(left, right, max_overlap=RAG_CONTEXT_MAX_OVERLAP):
+    """Length of the longest suffix of `left` that is a prefix of `right`."""
+    for size in range(min(len(left), len(right), max_overlap), 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _file_position(doc):
+    # Chunk indexes only line up within one upload of a file to one DB.
+    chunk = doc.get("chunk") or doc
+    if chunk.get("chunk_type") != "file_chunk" or chunk.get("chunk_index") is None:
+        return None
+    return (doc.get("folder_path"), doc.get("uid"), chunk.get("file_name"), chunk.get("upload_id")), chunk["chunk_index"]
+
+
+class ContextMetrics:
+    """Prompt token counts per request, for sizing RAG_CONTEXT_TOKEN_BUDGET."""
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=window)
+        self.counters = {
+            "requests": 0, "prompt_tokens": 0, "context_tokens": 0, "chunks_retrieved": 0,
+            "chunks_packed": 0, "duplicates_dropped": 0, "chunks_merged": 0, "truncated": 0, "over_budget": 0,
+        }
+
+    def record(self, prompt_tokens, packed):
+        with self.lock:
+            self.counters["requests"] += 1
+            self.counters["prompt_tokens"] += prompt_tokens
+            self.counters["context_tokens"] += packed.tokens
+            for name, value in packed.counts.items():
+                self.counters[name] += value
+            self.recent.append(prompt_tokens)
+
+    def stats(self):
+        with self.lock:
+            recent = sorted(self.recent)
+            requests = self.counters["requests"]
+            return {
+                **self.counters,
+                "avg_prompt_tokens": self.counters["prompt_tokens"] / requests if requests else 0.0,
+                "p50_prompt_tokens": recent[len(recent) // 2] if recent else 0,
+                "p95_prompt_tokens": recent[int(len(recent) * 0.95)] if recent else 0,
+                "tokenizer": RAG_CONTEXT_TOKENIZER if _get_encoding() else f"~{CHARS_PER_TOKEN} chars/token",
+            }
+
+
+context_metrics = ContextMetrics()
+
+
+class PackedContext:
+    def __init__(self, text, docs, tokens, counts):
+        self.text = text
+        self.docs = docs  # retrieved docs that made it into the context, best first
+        self.tokens = tokens
+        self.counts = counts
+
+
+def build_context(retrieved_docs, token_budget=RAG_CONTEXT_TOKEN_BUDGET):
+    """
+    Pack retrieved chunks into prompt context, best retrieval score first:
+    duplicate texts (and chunks contained in another) are dropped, adjacent
+    chunks of the same file are merged with their splitter overlap removed,
+    and blocks are added until `token_budget` is spent; the last block that
+    doesn't fit is truncated when enough budget is left for it to be useful.
+    """
+    docs = [doc for doc in retrieved_docs if doc.get("content")]
+    counts = {"chunks_retrieved": len(docs), "chunks_packed": 0, "duplicates_dropped": 0,
+              "chunks_merged": 0, "truncated": 0, "over_budget": 0}
+
+    unique = []  # (retrieval rank, doc)
+    for rank, doc in sorted(enumerate(docs), key=lambda item: len(item[1]["content"]), reverse=True):
+        text = doc["content"].strip()
+        container = next((kept for _, kept in unique if text in kept["content"]), None)
+        if container is None:
+            unique.append((rank, dict(doc)))
+        else:
+            # The kept chunk stands in for the dropped one, so it keeps the better score.
+            container["score"] = max(container.get("score", 0.0), doc.get("score", 0.0))
+            counts["duplicates_dropped"] += 1
+    unique = [doc for _, doc in sorted(unique, key=lambda item: item[0])]
+
+    # Blocks of consecutive chunks from one file; everything else stands alone.
+    blocks = []
+    by_file = {}
+    for doc in unique:
+        position = _file_position(doc)
+        if position is None:
+            blocks.append({"text": doc["content"].strip(), "docs": [doc], "score": doc.get("score", 0.0)})
+        else:
+            by_file.setdefault(position[0], []).append((position[1], doc))
+    for chunks in by_file.values():
+        chunks.sort(key=lambda item: item[0])
+        block = None
+        for index, doc in chunks:
+            text = doc["content"].strip()
+            if block is not None and index == block["last_index"] + 1:
+                overlap = _overlap(block["text"], text)
+                # No overlap means the split fell on a page / document boundary.
+                block["text"] += text[overlap:] if overlap else "\n" + text
+                block["docs"].append(doc)
+                block["score"] = max(block["score"], doc.get("score", 0.0))
+                counts["chunks_merged"] += 1
+            else:
+                block = {"text": text, "docs": [doc], "score": doc.get("score", 0.0)}
+                blocks.append(block)
+            block["last_index"] = index
+    blocks.sort(key=lambda b: b["score"], reverse=True)
+
+    parts, packed_docs, used = [], [], 0
+    separator = count_tokens("\n\n")
+    for block in blocks:
+        cost = count_tokens(block["text"]) + (separator if parts else 0)
+        text = block["text"]
+        if token_budget and used + cost > token_budget:
+            remaining = token_budget - used - (separator if parts else 0)
+            if remaining < RAG_CONTEXT_MIN_TRUNCATED_TOKENS:
+                counts["over_budget"] += len(block["docs"])
+                continue
+            text = truncate_tokens(text, remaining - count_tokens(" ..."))
+            cost = count_tokens(text) + (separator if parts else 0)
+            counts["truncated"] += 1
+        parts.append(text)
+        packed_docs.extend(block["docs"])
+        used += cost
+    counts["chunks_packed"] = len(packed_docs)
+    packed_docs.sort(key=lambda d: d.get("score", 0.0), reverse=True)
+    return PackedContext("\n\n".join(parts), packed_docs, used, counts)
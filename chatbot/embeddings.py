@@ -0,0 +1,97 @@
+import os
+import threading
+from .cache import TTLCache, normalize_query
+
+# Changing the model makes existing tenant DBs incompatible; re-embed them
+# with `python manage.py reembed_tenants` (see chatbot/reembed.py).
+EMBED_MODEL = os.getenv("EMBED_MODEL", "BAAI/bge-base-en-v1.5")  # or "sentence-transformers/all-MiniLM-L6-v2" for speed
+# "onnx" / "openvino" run the model without torch; pair with EMBED_MODEL_FILE
+# (e.g. "onnx/model_qint8_avx512.onnx") to use a quantized CPU export.
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+EMBED_MODEL_FILE = os.getenv("EMBED_MODEL_FILE")
+EMBED_DEVICE = os.getenv("EMBED_DEVICE", "cpu")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "4096"))
+QUERY_EMBED_CACHE_TTL = float(os.getenv("QUERY_EMBED_CACHE_TTL", "3600"))
+
+
+class SharedEmbeddings:
+    """
+    One embedding model per process, shared by every UserRAGVectorDB.
+    Implements the langchain Embeddings interface (embed_documents /
+    embed_query). langchain_huggingface and the model are loaded on first
+    use, so building a DB object (or importing this module) costs nothing
+    until text actually needs to be embedded.
+    """
+
+    def __init__(self, model_name=EMBED_MODEL, backend=EMBED_BACKEND, model_file=EMBED_MODEL_FILE,
+                 device=EMBED_DEVICE, batch_size=EMBED_BATCH_SIZE):
+        self.model_name = model_name
+        self.backend = backend
+        self.model_file = model_file
+        self.device = device
+        self.batch_size = batch_size
+        self._model = None
+        self._load_lock = threading.Lock()
+        # HF fast tokenizers raise "Already borrowed" when shared across threads.
+        self._encode_lock = threading.Lock()
+        self.query_cache = TTLCache(QUERY_EMBED_CACHE_SIZE, QUERY_EMBED_CACHE_TTL)
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def _get_model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+                    model_kwargs = {"device": self.device}
+                    if self.backend and self.backend != "torch":
+                        model_kwargs["backend"] = self.backend
+                        if self.model_file:
+                            model_kwargs["model_kwargs"] = {"file_name": self.model_file}
+                    self._model = HuggingFaceEmbeddings(
+                        model_name=self.model_name,
+                        model_kwargs=model_kwargs,
+                        encode_kwargs={"batch_size": self.batch_size},
+                    )
+        return self._model
+
+    def warmup(self):
+        """Load the model ahead of the first request."""
+        self._get_model()
+
+    def _warm(self):
+        try:
+            self.warmup()
+        except Exception as e:
+            print(f"Could not pre-warm embedding model '{self.model_name}': {e}")
+
+    def warm_in_background(self):
+        thread = threading.Thread(target=self._warm, name="embeddings-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        model = self._get_model()
+        with self._encode_lock:
+            return model.embed_documents(texts)
+
+    def embed_query(self, text):
+        # Only the cache key is normalized; the model sees the query as typed.
+        key = normalize_query(text)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            model = self._get_model()
+            with self._encode_lock:
+                vector = model.embed_query(text)
+            self.query_cache.set(key, vector)
+        return vector
+
+
+shared_embeddings = SharedEmbeddings()
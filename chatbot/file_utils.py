@@ -1,8 +1,61 @@
 import os
-from langchain_community.document_loaders import (
-    CSVLoader, UnstructuredExcelLoader, PyPDFLoader, Docx2txtLoader, TextLoader, UnstructuredFileLoader
-)
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+def _get_loader(file_path, ext):
+    # Loaders pull in langchain_community and the parsers; import them on first upload.
+    from langchain_community.document_loaders import (
+        CSVLoader, UnstructuredExcelLoader, PyPDFLoader, Docx2txtLoader, TextLoader, UnstructuredFileLoader
+    )
+    if ext == ".txt":
+        return TextLoader(file_path, autodetect_encoding=True)
+    elif ext == ".csv":
+        return CSVLoader(file_path)
+    elif ext in [".xls", ".xlsx"]:
+        return UnstructuredExcelLoader(file_path)
+    elif ext == ".docx":
+        return Docx2txtLoader(file_path)
+    elif ext == ".pdf":
+        return PyPDFLoader(file_path)
+    return UnstructuredFileLoader(file_path)
+
+def _iter_documents(file_path, ext):
+    """Yield loader documents one at a time (a PDF page, a CSV row, ...)."""
+    try:
+        for doc in _get_loader(file_path, ext).lazy_load():
+            yield doc
+    except Exception as e:
+        raise ValueError(f"Unsupported or unreadable file extension/type: {ext}. Details: {str(e)}")
+
+def iter_text_chunks_from_file(file_path, filename, chunk_size=1000, chunk_overlap=200):
+    """
+    Same chunks as extract_text_chunks_from_file, generated lazily: documents are
+    loaded and split one page / row at a time, so memory does not grow with file size.
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    ext = os.path.splitext(filename)[-1].lower()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    idx = 0
+    for doc in _iter_documents(file_path, ext):
+        for chunk in splitter.split_documents([doc]):
+            text = str(chunk.page_content).strip() if hasattr(chunk, "page_content") else str(chunk).strip()
+            yield {
+                "chunk_type": "file_chunk",
+                "file_name": filename,
+                "file_type": ext.replace('.', ''),
+                "chunk_index": idx,
+                "content": text
+            }
+            idx += 1
+
+def iter_chunk_batches(chunks, batch_size):
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 def extract_text_chunks_from_file(file_path, filename, chunk_size=1000, chunk_overlap=200):
     """
@@ -14,35 +67,4 @@ def extract_text_chunks_from_file(file_path, filename, chunk_size=1000, chunk_ov
       - chunk_index: index of the chunk
       - content: the text content of the chunk (string)
     """
-    ext = os.path.splitext(filename)[-1].lower()
-    try:
-        if ext == ".txt":
-            loader = TextLoader(file_path, autodetect_encoding=True)
-        elif ext == ".csv":
-            loader = CSVLoader(file_path)
-        elif ext in [".xls", ".xlsx"]:
-            loader = UnstructuredExcelLoader(file_path)
-        elif ext == ".docx":
-            loader = Docx2txtLoader(file_path)
-        elif ext == ".pdf":
-            loader = PyPDFLoader(file_path)
-        else:
-            loader = UnstructuredFileLoader(file_path)
-        docs = loader.load()
-    except Exception as e:
-        raise ValueError(f"Unsupported or unreadable file extension/type: {ext}. Details: {str(e)}")
-
-    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    chunks = splitter.split_documents(docs)
-
-    chunk_dicts = []
-    for idx, chunk in enumerate(chunks):
-        text = str(chunk.page_content).strip() if hasattr(chunk, "page_content") else str(chunk).strip()
-        chunk_dicts.append({
-            "chunk_type": "file_chunk",
-            "file_name": filename,
-            "file_type": ext.replace('.', ''),
-            "chunk_index": idx,
-            "content": text
-        })
-    return chunk_dicts
\ No newline at end of file
+    return list(iter_text_chunks_from_file(file_path, filename, chunk_size, chunk_overlap))
@@ -0,0 +1,251 @@
+"""
+FAISS index types for UserRAGVectorDB and when to use them.
+
+    flat    exact IndexFlatL2; best for small tenants
+    hnsw    IndexHNSWFlat graph; sub-linear search, exact vectors, ~2x memory
+    sq8     8-bit scalar quantizer; 4x smaller, brute-force search
+    ivfpq   IVF + product quantizer; ~30x smaller, sub-linear search, approximate
+
+RAG_INDEX_TYPE picks one for every DB, or "auto" (the default) to move a DB
+from flat to hnsw as it crosses RAG_HNSW_MIN_VECTORS, and to
+RAG_LARGE_INDEX_TYPE past RAG_IVFPQ_MIN_VECTORS. That defaults to hnsw:
+ivfpq trades recall (~0.75 recall@10 in benchmarks/bench_index_types.py)
+for memory, so it is opt-in. A shrinking DB only moves back down a tier
+once it falls below RAG_INDEX_DOWNGRADE_RATIO of that tier's threshold.
+Quantized types need training data, so new DBs start flat (or hnsw) and
+switch type when a compaction rebuilds their snapshot. sq8 and ivfpq keep
+their type from then on: they only hold approximations of the vectors, and
+an index rebuilt from those would lose recall for good. Re-embed
+(`manage.py reembed_tenants --force`) to change them.
+
+Vectors are addressed by chunk id rather than position, so deletes don't
+renumber the rest: IVF indexes store ids natively and the others are wrapped
+in an IndexIDMap2. Flat and hnsw indexes written before that are positional
+(id == position) until their next compaction.
+"""
+import os
+import math
+import numpy as np
+import faiss
+
+RAG_INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "auto")
+RAG_HNSW_MIN_VECTORS = int(os.getenv("RAG_HNSW_MIN_VECTORS", "20000"))
+RAG_IVFPQ_MIN_VECTORS = int(os.getenv("RAG_IVFPQ_MIN_VECTORS", "200000"))
+RAG_LARGE_INDEX_TYPE = os.getenv("RAG_LARGE_INDEX_TYPE", "hnsw")  # auto type past RAG_IVFPQ_MIN_VECTORS; "sq8" or "ivfpq" save memory
+RAG_INDEX_DOWNGRADE_RATIO = float(os.getenv("RAG_INDEX_DOWNGRADE_RATIO", "0.5"))
+RAG_HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+RAG_HNSW_EF_CONSTRUCTION = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "80"))
+RAG_HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+RAG_IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "32"))
+RAG_PQ_M = int(os.getenv("RAG_PQ_M", "96"))  # sub-quantizers; bge-base (768 dims) -> 8 dims, 96 bytes per vector
+
+INDEX_TYPES = ("flat", "hnsw", "sq8", "ivfpq")
+QUANTIZED_TYPES = ("sq8", "ivfpq")
+# IVF k-means wants ~39 training points per list; below this ivfpq falls back to hnsw.
+IVF_MIN_TRAIN_PER_LIST = 39
+
+
+def is_id_mapped(index):
+    """Whether search returns chunk ids rather than positions."""
+    index = faiss.downcast_index(index)
+    return isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2, faiss.IndexIVF))
+
+
+def _base(index):
+    """The index doing the work under an ID map."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def index_type(index):
+    """Name of an index's type, or None for no index."""
+    if index is None:
+        return None
+    index = _base(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "sq8"
+    return "flat"
+
+
+def _auto_tier(ntotal):
+    return 2 if ntotal >= RAG_IVFPQ_MIN_VECTORS else 1 if ntotal >= RAG_HNSW_MIN_VECTORS else 0
+
+
+def target_index_type(ntotal, configured=RAG_INDEX_TYPE, current=None):
+    """Index type a DB holding `ntotal` vectors, in a `current` type index, should be compacted into."""
+    if current in QUANTIZED_TYPES:
+        return current
+    kind = configured
+    if kind not in INDEX_TYPES:
+        tiers = ("flat", "hnsw", RAG_LARGE_INDEX_TYPE)
+        tier = _auto_tier(ntotal)
+        if current in tiers:
+            # Hysteresis: stay a tier up until the DB is well below its threshold.
+            tier = max(tier, min(tiers.index(current), _auto_tier(ntotal / RAG_INDEX_DOWNGRADE_RATIO)))
+        kind = tiers[tier]
+    if kind == "ivfpq" and ntotal < _ivf_lists(ntotal) * IVF_MIN_TRAIN_PER_LIST:
+        kind = "hnsw"
+    return kind
+
+
+def _ivf_lists(ntotal):
+    return max(1, min(65536, int(4 * math.sqrt(max(ntotal, 1)))))
+
+
+def _pq_m(dim):
+    m = min(RAG_PQ_M, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def configure(index):
+    """Apply search-time parameters; call after building or reading an index."""
+    if index is None:
+        return index
+    inner = _base(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = RAG_HNSW_EF_SEARCH
+    elif isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = RAG_IVF_NPROBE
+    return index
+
+
+def _new_base(kind, dim):
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, RAG_HNSW_M)
+        index.hnsw.efConstruction = RAG_HNSW_EF_CONSTRUCTION
+        return index
+    return faiss.IndexFlatL2(dim)
+
+
+def new_index(kind, dim):
+    """Empty ID-mapped index that accepts adds without training (flat or hnsw)."""
+    return configure(faiss.IndexIDMap2(_new_base(kind, dim)))
+
+
+def build_index(kind, vectors, ids):
+    """Build (and train, if needed) an ID-mapped index of `kind` holding `vectors` under `ids`."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    dim = vectors.shape[1]
+    if kind == "ivfpq":
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, _ivf_lists(len(vectors)), _pq_m(dim), 8)
+        index.train(vectors)
+    elif kind == "sq8":
+        index = faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit))
+        index.train(vectors)
+    else:
+        index = faiss.IndexIDMap2(_new_base(kind, dim))
+    add_vectors(index, vectors, ids)
+    return configure(index)
+
+
+def add_vectors(index, vectors, ids):
+    """Add vectors under their chunk ids (positional indexes take them in id order)."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    if is_id_mapped(index):
+        index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+    else:
+        index.add(vectors)
+
+
+def can_remove(index):
+    """Whether remove_ids() works in place; HNSW graphs have to be rebuilt instead."""
+    return is_id_mapped(index) and index_type(index) != "hnsw"
+
+
+def search_params(index, exclude_ids=None, include_ids=None):
+    """
+    SearchParameters that skip `exclude_ids` or only return `include_ids`,
+    carrying the type's own search settings. HNSW and IVF only look at part
+    of the index, so very selective filters can come back short there.
+    """
+    if include_ids is not None:
+        selector = faiss.IDSelectorBatch(np.fromiter(include_ids, dtype="int64", count=len(include_ids)))
+    else:
+        selector = faiss.IDSelectorNot(faiss.IDSelectorBatch(np.asarray(sorted(exclude_ids), dtype="int64")))
+    base = _base(index)
+    if isinstance(base, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+    elif isinstance(base, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=base.nprobe)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    # Keep the selector alive for as long as the parameters are.
+    params.selector = selector
+    return params
+
+
+def search_subset(index, vector, ids, k):
+    """
+    Exact search among `ids` only, by reconstructing their vectors; for small
+    subsets this beats filtering a scan of the whole index. Returns (distances,
+    ids) shaped like Index.search, or None when the index can't look up vectors
+    by id (IVF without a direct map).
+    """
+    if not is_id_mapped(index) or isinstance(_base(index), faiss.IndexIVF):
+        return None
+    ids = np.fromiter(ids, dtype="int64", count=len(ids))
+    distances = ((index.reconstruct_batch(ids) - vector) ** 2).sum(axis=1)
+    order = np.argsort(distances)[:k]
+    return distances[order][None, :], ids[order][None, :]
+
+
+def mmap_flag(kind):
+    """
+    faiss.read_index flag that maps an index of `kind` from disk instead of
+    copying it into RAM, or 0 when this FAISS build can't map it. Mapped
+    indexes are read-only: reload without the flag before adding vectors.
+    """
+    if kind == "ivfpq":
+        return getattr(faiss, "IO_FLAG_MMAP", 0)
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+def index_bytes(index):
+    """Approximate RAM held by an index that was built or read without mmap."""
+    if index is None:
+        return 0
+    inner = _base(index)
+    # IndexIDMap2 keeps an id list plus a reverse hash map.
+    id_map = index.ntotal * 24 if inner is not faiss.downcast_index(index) else 0
+    if isinstance(inner, faiss.IndexHNSW):
+        return id_map + index.ntotal * (inner.storage.sa_code_size() + inner.hnsw.nb_neighbors(0) * 4 * 2)
+    if isinstance(inner, faiss.IndexIVFPQ):
+        codebooks = inner.pq.M * inner.pq.ksub * inner.pq.dsub * 4
+        return id_map + index.ntotal * (inner.code_size + 8) + inner.nlist * index.d * 4 + codebooks
+    return id_map + index.ntotal * inner.sa_code_size()
+
+
+def reconstruct_all(index):
+    """
+    (ids, vectors) of everything stored. Exact for flat and hnsw; sq8 and
+    ivfpq only hold quantized codes, so theirs are approximations.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIVF):
+        invlists = index.invlists
+        ids = [
+            faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+            for list_no in range(index.nlist)
+            if invlists.list_size(list_no)
+        ]
+        ids = np.concatenate(ids) if ids else np.empty(0, dtype="int64")
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        try:
+            return ids, index.reconstruct_batch(ids)
+        finally:
+            index.set_direct_map_type(faiss.DirectMap.NoMap)
+    vectors = _base(index).reconstruct_n(0, index.ntotal)
+    if is_id_mapped(index):
+        ids = faiss.vector_to_array(index.id_map)
+    else:
+        ids = np.arange(index.ntotal, dtype="int64")
+    return ids, vectors
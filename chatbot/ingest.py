@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from . import rag_storage
+from .rag_client import BASE_FAISS_DIR, rag_db_manager
+from .file_utils import iter_text_chunks_from_file, iter_chunk_batches
+from .embeddings import shared_embeddings
+
+INGEST_DIR = os.getenv("INGEST_DIR", os.path.join(BASE_FAISS_DIR, "_ingest"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "256"))
+INGEST_POLL_SECONDS = float(os.getenv("INGEST_POLL_SECONDS", "2"))
+INGEST_STALE_SECONDS = float(os.getenv("INGEST_STALE_SECONDS", "600"))  # running jobs without progress are retried
+# Running jobs touch updated_at this often while a worker parses or embeds, so only jobs of a dead process go stale.
+INGEST_HEARTBEAT_SECONDS = float(os.getenv("INGEST_HEARTBEAT_SECONDS", "30"))
+
+JOB_FIELDS = (
+    "id", "status", "company_name", "uid", "field", "file_name",
+    "total_chunks", "processed_chunks", "added", "skipped", "error", "created_at", "updated_at",
+)
+
+
+# Run in the worker processes; each process loads its own copy of the embedding model once.
+def _parse_file(file_path, file_name, chunks_path):
+    """Stream the file's chunks to a JSONL spool file; returns the chunk count."""
+    count = 0
+    with open(chunks_path, "w", encoding="utf-8") as f:
+        for chunk in iter_text_chunks_from_file(file_path, file_name):
+            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def _embed_texts(texts):
+    return np.asarray(shared_embeddings.embed_documents(texts), dtype="float32")
+
+
+def _read_chunks(chunks_path, upload_id):
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        for line in f:
+            # Tells this upload's chunk indexes apart from an earlier upload of the same file.
+            yield dict(json.loads(line), upload_id=upload_id)
+
+
+class IngestQueue:
+    """
+    File ingestion jobs kept in a local SQLite table.
+    Uploads are spooled to disk and queued by any server process, but only
+    the one holding dispatch.lock runs dispatcher threads: they claim jobs,
+    run parsing and embedding in a process pool and append the vectors to the
+    user's DB. Other processes pick the new chunks up when they next use that
+    DB (see UserRAGDBManager.get_db) and take over dispatching once the lock
+    holder exits.
+    """
+
+    def __init__(self, base_dir=INGEST_DIR, workers=INGEST_WORKERS):
+        self.base_dir = base_dir
+        self.spool_dir = os.path.join(base_dir, "spool")
+        self.db_path = os.path.join(base_dir, "jobs.sqlite3")
+        self.workers = workers
+        self.pool = None
+        self.dispatch_lock = None  # fd of dispatch.lock once this process dispatches
+        self.started = False
+        self.start_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        os.makedirs(self.spool_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    company_name TEXT,
+                    uid TEXT,
+                    field TEXT,
+                    meta TEXT,
+                    file_name TEXT,
+                    file_path TEXT,
+                    total_chunks INTEGER DEFAULT 0,
+                    processed_chunks INTEGER DEFAULT 0,
+                    added INTEGER DEFAULT 0,
+                    skipped INTEGER DEFAULT 0,
+                    error TEXT,
+                    created_at REAL,
+                    updated_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def new_job_id(self):
+        return uuid.uuid4().hex
+
+    def spool_path(self, job_id, file_name):
+        return os.path.join(self.spool_dir, job_id + os.path.splitext(file_name)[-1].lower())
+
+    def enqueue(self, job_id, company_name, uid, field, meta, file_name, file_path):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, company_name, uid, field, meta, file_name, file_path, created_at, updated_at)"
+                " VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, company_name, uid, field, json.dumps(meta, ensure_ascii=False), file_name, file_path, now, now),
+            )
+        self.start()
+        self.wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _claim(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose heartbeat stopped were interrupted (crash or restart); run them again.
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued' WHERE status IN ('parsing', 'embedding') AND updated_at < ?",
+                    (time.time() - INGEST_STALE_SECONDS,),
+                )
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'parsing', updated_at = ? WHERE id = ?", (time.time(), row["id"])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return dict(row) if row else None
+
+    def start(self):
+        """Start waiting for dispatch.lock (at app start, see apps.py, or on first enqueue)."""
+        with self.start_lock:
+            if self.started:
+                return
+            self.started = True
+            threading.Thread(target=self._elect, name="ingest-elect", daemon=True).start()
+
+    def _elect(self):
+        # Blocks while another process dispatches; the OS drops its lock when it exits.
+        self.dispatch_lock = rag_storage.lock_file(os.path.join(self.base_dir, "dispatch.lock"))
+        with self.start_lock:
+            self.pool = self._new_pool()
+        for i in range(self.workers):
+            threading.Thread(target=self._dispatch, name=f"ingest-dispatch-{i}", daemon=True).start()
+
+    def _new_pool(self):
+        # spawn: forking a process that already runs torch/FAISS threads is unsafe.
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _run_in_pool(self, job_id, fn, *args):
+        pool = self.pool
+        try:
+            future = pool.submit(fn, *args)
+            while True:
+                try:
+                    return future.result(timeout=INGEST_HEARTBEAT_SECONDS)
+                except TimeoutError:
+                    self._update(job_id)  # heartbeat
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); replace the pool so later jobs still run.
+            with self.start_lock:
+                if self.pool is pool:
+                    self.pool = self._new_pool()
+            raise
+
+    def _dispatch(self):
+        while True:
+            try:
+                job = self._claim()
+            except Exception as e:
+                print(f"Ingest queue error: {e}")
+                job = None
+            if job is None:
+                self.wakeup.wait(INGEST_POLL_SECONDS)
+                self.wakeup.clear()
+                continue
+            try:
+                self._process(job)
+            except Exception as e:
+                self._update(job["id"], status="failed", error=str(e))
+            finally:
+                if job["file_path"] and os.path.exists(job["file_path"]):
+                    os.remove(job["file_path"])
+
+    def _process(self, job):
+        job_id = job["id"]
+        chunks_path = job["file_path"] + ".chunks.jsonl"
+        try:
+            try:
+                total = self._run_in_pool(job_id, _parse_file, job["file_path"], job["file_name"], chunks_path)
+            except Exception as e:
+                raise ValueError(f"File parsing error: {e}")
+            user_db = rag_db_manager.get_user_db(job["company_name"], job["uid"], job["field"])
+            meta = json.loads(job["meta"] or "{}")
+            added = skipped = 0
+            self._update(job_id, status="embedding", total_chunks=total)
+            # Fixed-size batches keep memory flat here and in the worker regardless of file size.
+            for chunks in iter_chunk_batches(_read_chunks(chunks_path, job_id), INGEST_EMBED_BATCH):
+                entries, texts, duplicates = user_db.new_entries([{"uid": job["uid"], "meta": meta, "chunks": chunks}])
+                skipped += duplicates
+                if entries:
+                    stored = user_db.append_embedded(entries, self._run_in_pool(job_id, _embed_texts, texts))
+                    added += stored
+                    skipped += len(entries) - stored
+                self._update(job_id, processed_chunks=added + skipped, added=added, skipped=skipped)
+            self._update(job_id, status="done")
+        finally:
+            if os.path.exists(chunks_path):
+                os.remove(chunks_path)
+
+
+ingest_queue = IngestQueue()
@@ -0,0 +1,96 @@
+import re
+import math
+import heapq
+from collections import Counter
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it me my of on or our q "
+    "so that the this to was we what when where which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+class KeywordIndex:
+    """
+    Inverted index with BM25 scoring over a user DB's chunk texts.
+    Documents are keyed by the chunk's vector id, so keyword and vector hits
+    refer to the same metadata entry.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> {doc_id: term frequency}
+        self.doc_lengths = {}  # doc_id -> number of tokens
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, doc_id, text):
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        length = sum(counts.values())
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+
+    def remove(self, doc_id, text):
+        """Remove a document; `text` must be what it was added with."""
+        if doc_id not in self.doc_lengths:
+            return
+        for term in set(tokenize(text)):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def search(self, query, top_k=3, allowed=None):
+        """
+        Return up to top_k (doc_id, bm25 score) pairs, best first, optionally
+        only among the doc ids in `allowed` (idf still counts every document).
+        """
+        n_docs = len(self.doc_lengths)
+        if not n_docs:
+            return []
+        avg_length = self.total_length / n_docs or 1
+        scores = {}
+        matched = sorted(
+            (self.postings[term] for term in set(tokenize(query)) if term in self.postings), key=len
+        )
+        for postings in matched:
+            if scores and len(postings) > n_docs / 2:
+                # Terms in most documents have near-zero idf; once rarer terms
+                # matched they barely change the ranking but dominate the cost.
+                break
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            if allowed is None:
+                hits = postings.items()
+            elif len(allowed) < len(postings):
+                hits = ((doc_id, postings[doc_id]) for doc_id in allowed if doc_id in postings)
+            else:
+                hits = ((doc_id, tf) for doc_id, tf in postings.items() if doc_id in allowed)
+            for doc_id, tf in hits:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def to_dict(self):
+        return {
+            "postings": {term: [[doc_id, tf] for doc_id, tf in docs.items()] for term, docs in self.postings.items()},
+            "doc_lengths": [[doc_id, length] for doc_id, length in self.doc_lengths.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls()
+        index.postings = {term: {doc_id: tf for doc_id, tf in docs} for term, docs in data["postings"].items()}
+        index.doc_lengths = {doc_id: length for doc_id, length in data["doc_lengths"]}
+        index.total_length = sum(index.doc_lengths.values())
+        return index
@@ -0,0 +1,200 @@
+import os
+import gc
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+FIELD_LLM_PATHS = {
+    "agriculture": r"E:\Finetuned LLMs\fine_tuned_agriculture_model\final_model",
+    "tourism": r"E:\Finetuned LLMs\fine_tuned_tourism_model\final_model",
+    "transport": r"E:\Finetuned LLMs\fine_tuned_transport_model\final_model",
+}
+FIELD_LLM_TOKENIZERS = {
+    "agriculture": r"E:\Finetuned LLMs\fine_tuned_agriculture_model\final_tokenizer",
+    "tourism": r"E:\Finetuned LLMs\fine_tuned_tourism_model\final_tokenizer",
+    "transport": r"E:\Finetuned LLMs\fine_tuned_transport_model\final_tokenizer",
+}
+
+FIELD_LLM_MAX_LOADED = int(os.getenv("FIELD_LLM_MAX_LOADED", "2"))
+FIELD_LLM_MEMORY_BUDGET_MB = int(os.getenv("FIELD_LLM_MEMORY_BUDGET_MB", "0"))  # 0 = no size limit
+FIELD_LLM_PREWARM = [f.strip() for f in os.getenv("FIELD_LLM_PREWARM", "").split(",") if f.strip()]
+FIELD_LLM_MAX_BATCH = int(os.getenv("FIELD_LLM_MAX_BATCH", "8"))
+FIELD_LLM_BATCH_WAIT_MS = float(os.getenv("FIELD_LLM_BATCH_WAIT_MS", "20"))
+
+
+class GenerationBatcher:
+    """
+    Micro-batches concurrent generate calls for one field.
+    The first waiting prompt opens a window of `max_wait_ms`; every prompt that
+    arrives in that window (up to `max_batch`) runs through the pipeline as a
+    single padded batch, and each caller gets its own output back.
+    """
+
+    def __init__(self, field, get_pipe, max_batch=FIELD_LLM_MAX_BATCH, max_wait_ms=FIELD_LLM_BATCH_WAIT_MS):
+        self.field = field
+        self.get_pipe = get_pipe
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.counters = {"requests": 0, "batches": 0}
+        self.thread = threading.Thread(target=self._run, name=f"field-llm-batch-{field}", daemon=True)
+        self.thread.start()
+
+    def submit(self, prompt, max_new_tokens=128):
+        future = Future()
+        self.queue.put((prompt, max_new_tokens, future))
+        return future
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+            for max_new_tokens, items in groups.items():
+                self._generate(items, max_new_tokens)
+
+    def _generate(self, items, max_new_tokens):
+        try:
+            llm_pipe = self.get_pipe(self.field)
+            outputs = llm_pipe(
+                [prompt for prompt, _, _ in items], max_new_tokens=max_new_tokens, batch_size=len(items)
+            )
+        except Exception as e:
+            for _, _, future in items:
+                future.set_exception(e)
+            return
+        self.counters["requests"] += len(items)
+        self.counters["batches"] += 1
+        for (_, _, future), output in zip(items, outputs):
+            future.set_result(output[0]["generated_text"])
+
+
+class FieldLLMRegistry:
+    """
+    Keeps fine-tuned field pipelines loaded between requests.
+    Pipelines are loaded once per field and evicted least-recently-used first
+    when either the model count or the memory budget is exceeded.
+    """
+
+    def __init__(self, model_paths=FIELD_LLM_PATHS, tokenizer_paths=FIELD_LLM_TOKENIZERS,
+                 max_loaded=FIELD_LLM_MAX_LOADED, memory_budget_mb=FIELD_LLM_MEMORY_BUDGET_MB):
+        self.model_paths = model_paths
+        self.tokenizer_paths = tokenizer_paths
+        self.max_loaded = max_loaded
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.loaded = OrderedDict()  # field -> (pipeline, size_bytes)
+        self.lock = threading.Lock()
+        self.field_locks = {}
+        self.counters = {"loads": 0, "hits": 0, "evictions": 0, "load_seconds": 0.0}
+        self.batchers = {}
+
+    def _field_lock(self, field):
+        with self.lock:
+            return self.field_locks.setdefault(field, threading.Lock())
+
+    def _load(self, field):
+        # transformers (and torch) take seconds to import; only pay for it when a model loads.
+        from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+
+        tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_paths[field])
+        model = AutoModelForCausalLM.from_pretrained(self.model_paths[field])
+        model.eval()
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        # Decoder-only models must be left-padded for batched generation.
+        tokenizer.padding_side = "left"
+        model.generation_config.pad_token_id = tokenizer.pad_token_id
+        llm_pipe = pipeline("text-generation", model=model, tokenizer=tokenizer, max_new_tokens=128)
+        return llm_pipe, model.get_memory_footprint()
+
+    def _evict_over_budget(self):
+        # Called with self.lock held; never evicts the most recently used entry.
+        evicted = False
+        while len(self.loaded) > 1 and (
+            (self.max_loaded and len(self.loaded) > self.max_loaded)
+            or (self.memory_budget and sum(size for _, size in self.loaded.values()) > self.memory_budget)
+        ):
+            self.loaded.popitem(last=False)
+            self.counters["evictions"] += 1
+            evicted = True
+        return evicted
+
+    def get(self, field):
+        """Return the text-generation pipeline for a field, or None if none is configured."""
+        if field not in self.model_paths or field not in self.tokenizer_paths:
+            return None
+        with self.lock:
+            if field in self.loaded:
+                self.loaded.move_to_end(field)
+                self.counters["hits"] += 1
+                return self.loaded[field][0]
+        with self._field_lock(field):
+            with self.lock:
+                if field in self.loaded:
+                    self.loaded.move_to_end(field)
+                    self.counters["hits"] += 1
+                    return self.loaded[field][0]
+            start = time.perf_counter()
+            llm_pipe, size = self._load(field)
+            with self.lock:
+                self.counters["loads"] += 1
+                self.counters["load_seconds"] += time.perf_counter() - start
+                self.loaded[field] = (llm_pipe, size)
+                evicted = self._evict_over_budget()
+        if evicted:
+            gc.collect()
+        return llm_pipe
+
+    def generate(self, field, prompt, max_new_tokens=128):
+        """
+        Generated text for one prompt, batched with concurrent prompts for the
+        same field. Returns None if no model is configured for the field.
+        """
+        if field not in self.model_paths or field not in self.tokenizer_paths:
+            return None
+        with self.lock:
+            batcher = self.batchers.get(field)
+            if batcher is None:
+                batcher = self.batchers[field] = GenerationBatcher(field, self.get)
+        return batcher.submit(prompt, max_new_tokens).result()
+
+    def warm(self, fields=None):
+        """Load pipelines ahead of the first request (defaults to FIELD_LLM_PREWARM)."""
+        for field in fields if fields is not None else FIELD_LLM_PREWARM:
+            try:
+                self.get(field)
+            except Exception as e:
+                print(f"Could not pre-warm LLM for field '{field}': {e}")
+
+    def warm_in_background(self, fields=None):
+        thread = threading.Thread(target=self.warm, args=(fields,), name="field-llm-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self.lock:
+            return {
+                **self.counters,
+                "loaded_fields": list(self.loaded),
+                "loaded_bytes": sum(size for _, size in self.loaded.values()),
+                "batching": {field: dict(batcher.counters) for field, batcher in self.batchers.items()},
+            }
+
+
+field_llm_registry = FieldLLMRegistry()
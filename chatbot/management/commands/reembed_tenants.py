@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.embeddings import EMBED_MODEL
+from chatbot.rag_client import BASE_FAISS_DIR
+from chatbot.reembed import REEMBED_BATCH_SIZE, REEMBED_WORKERS, reembed_all
+
+
+class Command(BaseCommand):
+    help = "Re-embed every tenant RAG DB with an embedding model (default: EMBED_MODEL); see chatbot/reembed.py."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", default=EMBED_MODEL, help="Embedding model to migrate to.")
+        parser.add_argument("--base-dir", default=BASE_FAISS_DIR)
+        parser.add_argument("--workers", type=int, default=REEMBED_WORKERS, help="Embedding processes.")
+        parser.add_argument("--batch-size", type=int, default=REEMBED_BATCH_SIZE, help="Chunks per worker task.")
+        parser.add_argument("--force", action="store_true", help="Also re-embed folders already on --model.")
+
+    def handle(self, *args, **options):
+        stats = reembed_all(
+            model_name=options["model"],
+            base_dir=options["base_dir"],
+            workers=options["workers"],
+            batch_size=options["batch_size"],
+            force=options["force"],
+            log=self.stdout.write,
+        )
+        if stats["failed"]:
+            raise CommandError(f"{stats['failed']} folders failed; run the command again to retry them.")
@@ -0,0 +1,326 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+
+META_STORE_FILE = "meta.sqlite3"
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+
+
+class MetaStore:
+    """
+    SQLite chunk metadata for one UserRAGVectorDB folder.
+    Chunk rows are keyed by their FAISS vector id, and the uid + meta dict
+    (name, contact, email, field) shared by a record's chunks is stored once
+    in tenant_meta instead of on every chunk. Deleted chunks stay as
+    tombstone rows (deleted = 1) until compaction drops their vectors.
+    Folders shared by several tenants (RAG_SHARED_FIELDS) also tag each
+    chunk with its tenant; per-tenant folders leave it NULL.
+    """
+
+    def __init__(self, folder, fsync=True):
+        self.path = os.path.join(folder, META_STORE_FILE)
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"PRAGMA synchronous={'FULL' if fsync else 'NORMAL'}")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tenant_meta (
+                id INTEGER PRIMARY KEY,
+                uid TEXT NOT NULL,
+                digest TEXT NOT NULL UNIQUE,
+                meta TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                meta_id INTEGER NOT NULL REFERENCES tenant_meta (id),
+                chunk_type TEXT,
+                file_name TEXT,
+                hash TEXT NOT NULL,
+                chunk TEXT NOT NULL,
+                question TEXT,
+                deleted INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS info (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE INDEX IF NOT EXISTS tenant_meta_uid ON tenant_meta (uid);
+            CREATE INDEX IF NOT EXISTS chunks_meta ON chunks (meta_id);
+            CREATE INDEX IF NOT EXISTS chunks_type ON chunks (chunk_type);
+            CREATE INDEX IF NOT EXISTS chunks_file ON chunks (file_name);
+            CREATE INDEX IF NOT EXISTS chunks_hash ON chunks (hash);
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(chunks)")}
+        if "question" not in columns:
+            self.conn.execute("ALTER TABLE chunks ADD COLUMN question TEXT")
+            self.conn.execute("UPDATE chunks SET question = json_extract(chunk, '$.question') WHERE chunk_type = 'qa'")
+        if "deleted" not in columns:
+            self.conn.execute("ALTER TABLE chunks ADD COLUMN deleted INTEGER NOT NULL DEFAULT 0")
+        if "tenant" not in columns:
+            self.conn.execute("ALTER TABLE chunks ADD COLUMN tenant TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_tenant ON chunks (tenant, hash)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_question ON chunks (question)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_deleted ON chunks (deleted) WHERE deleted = 1")
+        self.meta_ids = {}  # (uid, meta digest) -> tenant_meta id
+        self.meta_cache = {}  # tenant_meta id -> (uid, meta dict)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _meta_id(self, uid, meta):
+        text = _dumps(meta)
+        key = (uid, hashlib.sha1(text.encode("utf-8")).hexdigest())
+        meta_id = self.meta_ids.get(key)
+        if meta_id is None:
+            digest = hashlib.sha1(f"{uid}\0{text}".encode("utf-8")).hexdigest()
+            self.conn.execute(
+                "INSERT OR IGNORE INTO tenant_meta (uid, digest, meta) VALUES (?, ?, ?)", (uid, digest, text)
+            )
+            meta_id = self.conn.execute("SELECT id FROM tenant_meta WHERE digest = ?", (digest,)).fetchone()[0]
+            self.meta_ids[key] = meta_id
+        return meta_id
+
+    def _insert(self, ids, entries):
+        rows = []
+        for chunk_id, entry in zip(ids, entries):
+            chunk = entry.get("chunk", {})
+            rows.append((
+                int(chunk_id),
+                self._meta_id(entry.get("uid", ""), entry.get("meta", {})),
+                chunk.get("chunk_type"),
+                chunk.get("file_name"),
+                entry["hash"],
+                _dumps(chunk),
+                chunk.get("question") if chunk.get("chunk_type") == "qa" else None,
+                entry.get("tenant"),
+            ))
+        # Plain INSERT: an id handed out twice fails here instead of replacing another writer's chunk.
+        self.conn.executemany(
+            "INSERT INTO chunks (id, meta_id, chunk_type, file_name, hash, chunk, question, tenant)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        if rows:
+            # Ids are never reused, even after their rows are purged.
+            self._reserve(max(row[0] for row in rows) + 1)
+
+    def _reserve(self, next_id):
+        self.conn.execute(
+            "INSERT INTO info (key, value) VALUES ('next_id', ?)"
+            " ON CONFLICT (key) DO UPDATE SET value = MAX(CAST(value AS INTEGER), excluded.value)",
+            (int(next_id),),
+        )
+
+    def _transaction(self, work):
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                work()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                self.meta_ids.clear()
+                self.meta_cache.clear()
+                raise
+
+    def add(self, ids, entries):
+        """Insert entries ({uid, meta, chunk, hash}) under the given vector ids in one transaction."""
+        self._transaction(lambda: self._insert(ids, entries))
+
+    @property
+    def initialized(self):
+        """False until import_entries() has run once for this folder."""
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM info WHERE key = 'initialized'").fetchone() is not None
+
+    def import_entries(self, ids, entries):
+        """Load metadata from the pre-SQLite JSON layout, atomically, and mark the store initialized."""
+        def work():
+            self.conn.execute("DELETE FROM chunks")
+            self._insert(ids, entries)
+            self.conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('initialized', '1')")
+        self._transaction(work)
+
+    def get_info(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+
+    def set_info(self, key, value):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)", (key, value))
+
+    def _tenant_meta(self, meta_id):
+        item = self.meta_cache.get(meta_id)
+        if item is None:
+            uid, meta = self.conn.execute("SELECT uid, meta FROM tenant_meta WHERE id = ?", (meta_id,)).fetchone()
+            item = self.meta_cache[meta_id] = (uid, json.loads(meta))
+        return item
+
+    def _entry(self, row):
+        uid, meta = self._tenant_meta(row[1])
+        entry = {"uid": uid, "meta": meta, "chunk": json.loads(row[3]), "hash": row[2]}
+        if row[4] is not None:
+            entry["tenant"] = row[4]
+        return entry
+
+    def get(self, chunk_id):
+        """Entry for one vector id, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, meta_id, hash, chunk, tenant FROM chunks WHERE id = ? AND deleted = 0", (int(chunk_id),)
+            ).fetchone()
+            return self._entry(row) if row else None
+
+    def get_many(self, ids):
+        """{vector id: entry} for the ids that exist."""
+        ids = [int(chunk_id) for chunk_id in ids]
+        entries = {}
+        with self.lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT id, meta_id, hash, chunk, tenant FROM chunks"
+                    f" WHERE deleted = 0 AND id IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for row in rows:
+                    entries[row[0]] = self._entry(row)
+        return entries
+
+    def iter_entries(self, start=0):
+        """(vector id, entry) pairs in id order, from `start` on."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, meta_id, hash, chunk, tenant FROM chunks WHERE id >= ? AND deleted = 0 ORDER BY id", (start,)
+            ).fetchall()
+            return [(row[0], self._entry(row)) for row in rows]
+
+    def existing_hashes(self, hashes, tenant=None):
+        """The subset of content hashes already stored (for `tenant`)."""
+        hashes = list(hashes)
+        found = set()
+        with self.lock:
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT DISTINCT hash FROM chunks"
+                    f" WHERE deleted = 0 AND tenant IS ? AND hash IN ({','.join('?' * len(batch))})",
+                    [tenant] + batch,
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+    def ids_for(self, uid=None, chunk_type=None, file_name=None, question=None, tenant=None):
+        """Vector ids of live chunks matching every given filter."""
+        clauses, params = ["deleted = 0"], []
+        if tenant is not None:
+            clauses.append("tenant = ?")
+            params.append(tenant)
+        if uid is not None:
+            clauses.append("meta_id IN (SELECT id FROM tenant_meta WHERE uid = ?)")
+            params.append(uid)
+        if chunk_type is not None:
+            clauses.append("chunk_type = ?")
+            params.append(chunk_type)
+        if file_name is not None:
+            clauses.append("file_name = ?")
+            params.append(file_name)
+        if question is not None:
+            clauses.append("question = ?")
+            params.append(question)
+        with self.lock:
+            return [
+                row[0] for row in self.conn.execute(f"SELECT id FROM chunks WHERE {' AND '.join(clauses)} ORDER BY id", params)
+            ]
+
+    def known_ids(self, low, high):
+        """Ids in [low, high] that have a row, live or tombstoned."""
+        with self.lock:
+            return {
+                row[0] for row in self.conn.execute("SELECT id FROM chunks WHERE id BETWEEN ? AND ?", (int(low), int(high)))
+            }
+
+    def reserve_ids(self, next_id):
+        """Record that ids below `next_id` are spent, even if their rows are never written."""
+        with self.lock:
+            self._reserve(next_id)
+
+    def allocate_ids(self, count, low=0):
+        """
+        Hand out `count` never-used vector ids, none below `low`; returns the first.
+        BEGIN IMMEDIATE takes SQLite's write lock on the folder's database, so
+        processes sharing the folder never get the same ids.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                start = max(self._next_id(), int(low))
+                self._reserve(start + count)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            return start
+
+    def _next_id(self):
+        row = self.conn.execute("SELECT value FROM info WHERE key = 'next_id'").fetchone()
+        highest = self.conn.execute("SELECT COALESCE(MAX(id) + 1, 0) FROM chunks").fetchone()[0]
+        return max(int(row[0]) if row else 0, highest)
+
+    def next_id(self):
+        """First never-used vector id."""
+        with self.lock:
+            return self._next_id()
+
+    def data_version(self):
+        """Changes whenever another connection (process) commits to the database; this one's commits don't count."""
+        with self.lock:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM chunks WHERE deleted = 0").fetchone()[0]
+
+    def tombstone(self, ids):
+        """Mark live chunks deleted; returns {vector id: entry} for the ones that were live."""
+        entries = self.get_many(ids)
+        if entries:
+            def work():
+                self.conn.executemany("UPDATE chunks SET deleted = 1 WHERE id = ?", [(i,) for i in entries])
+            self._transaction(work)
+        return entries
+
+    def tombstoned_entries(self):
+        """(vector id, entry) pairs of deleted chunks whose vectors may still be in the index."""
+        with self.lock:
+            rows = self.conn.execute("SELECT id, meta_id, hash, chunk, tenant FROM chunks WHERE deleted = 1").fetchall()
+            return [(row[0], self._entry(row)) for row in rows]
+
+    def tenant_ids(self):
+        """{tenant: set of live vector ids} for chunks tagged with a tenant."""
+        tenants = {}
+        with self.lock:
+            for tenant, chunk_id in self.conn.execute(
+                "SELECT tenant, id FROM chunks WHERE deleted = 0 AND tenant IS NOT NULL"
+            ):
+                tenants.setdefault(tenant, set()).add(chunk_id)
+        return tenants
+
+    def purge(self, ids):
+        """Drop tombstone rows once their vectors are gone from the index."""
+        self._transaction(lambda: self.conn.executemany(
+            "DELETE FROM chunks WHERE id = ? AND deleted = 1", [(int(i),) for i in ids]
+        ))
+
+    def delete_from(self, chunk_id):
+        """Drop rows at or after a vector id (their vectors were lost in a crash)."""
+        with self.lock:
+            self.conn.execute("DELETE FROM chunks WHERE id >= ?", (int(chunk_id),))
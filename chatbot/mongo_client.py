@@ -1,5 +1,5 @@
 import os
-from pymongo import MongoClient
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -7,24 +7,62 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB = os.getenv("MONGO_DB", "ChatBot")
 MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "UserDetails")
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0"))  # 0 = no timeout
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))  # per process; 0 = unbounded
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "0"))  # 0 = keep idle connections
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0"))  # 0 = wait for a pooled connection
+
+# pymongo is imported and the client created on first use, so importing this
+# module (and booting Django) never waits on the driver or the server.
+_client = None
+_client_lock = threading.Lock()
+
+
+def client_options():
+    """MongoClient keyword arguments from the MONGO_* settings (0 leaves the driver default)."""
+    options = {
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "maxPoolSize": MONGO_MAX_POOL_SIZE or None,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+    }
+    if MONGO_SOCKET_TIMEOUT_MS:
+        options["socketTimeoutMS"] = MONGO_SOCKET_TIMEOUT_MS
+    if MONGO_MAX_IDLE_TIME_MS:
+        options["maxIdleTimeMS"] = MONGO_MAX_IDLE_TIME_MS
+    if MONGO_WAIT_QUEUE_TIMEOUT_MS:
+        options["waitQueueTimeoutMS"] = MONGO_WAIT_QUEUE_TIMEOUT_MS
+    return options
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not MONGO_URI:
+                    raise Exception("MONGO_URI not found in environment variables")
+                from pymongo import MongoClient
+                _client = MongoClient(MONGO_URI, **client_options())
+    return _client
+
+
+def get_db():
+    return get_client()[MONGO_DB]
+
+
+def get_collection():
+    return get_db()[MONGO_COLLECTION]
+
+
+def __getattr__(name):
+    # `client` and `db` used to be created at import time.
+    if name == "client":
+        return get_client()
+    if name == "db":
+        return get_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-if not MONGO_URI:
-    raise Exception("MONGO_URI not found in environment variables")
-
-client = MongoClient(MONGO_URI)
-db = client[MONGO_DB]
-collection = db[MONGO_COLLECTION]
-
-def test_connection():
-    try:
-        client.admin.command('ping')
-        return True
-    except Exception as e:
-        print(f"MongoDB connection error: {e}")
-        return False
-
-connected = test_connection()
-if connected:
-    print("MongoDB connection successful!")
-else:
-    print("Warning: MongoDB connection failed. Using fallback mode.")
\ No newline at end of file
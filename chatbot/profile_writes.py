@@ -0,0 +1,283 @@
+import os
+import glob
+import json
+import atexit
+import sqlite3
+import threading
+from .mongo_client import get_collection
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+PROFILE_WRITE_MODE = os.getenv("PROFILE_WRITE_MODE", "journaled")  # "sync", "buffered" or "journaled"
+PROFILE_FLUSH_INTERVAL = float(os.getenv("PROFILE_FLUSH_INTERVAL", "0.5"))  # seconds
+PROFILE_FLUSH_MAX_BATCH = int(os.getenv("PROFILE_FLUSH_MAX_BATCH", "500"))  # pending uids that trigger an early flush
+PROFILE_FLUSH_MAX_BACKOFF = float(os.getenv("PROFILE_FLUSH_MAX_BACKOFF", "30"))  # seconds between retries while Mongo fails
+# Each process journals to "<PROFILE_WRITE_JOURNAL>.<pid>".
+PROFILE_WRITE_JOURNAL = os.getenv(
+    "PROFILE_WRITE_JOURNAL",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "profile_writes.sqlite3"),
+)
+WRITE_MODES = ("sync", "buffered", "journaled")
+
+
+def _lock_owner(path):
+    """
+    Take the lock file beside journal `path`; returns its fd, or None while
+    another live process holds it. The OS drops the lock when its owner dies.
+    """
+    fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT)
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _remove_journal(path):
+    for name in (path, path + "-wal", path + "-shm"):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+class WriteJournal:
+    """
+    Local SQLite log of one process's profile writes that Mongo hasn't
+    acknowledged yet. Each write is committed (fsynced) before the request
+    returns and deleted once the bulk_write that carried it succeeds;
+    leftovers are replayed by the next process to start.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS writes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                uid TEXT NOT NULL,
+                fields TEXT NOT NULL,
+                upsert INTEGER NOT NULL
+            )
+        """)
+
+    def append(self, uid, fields, upsert):
+        return self.conn.execute(
+            "INSERT INTO writes (uid, fields, upsert) VALUES (?, ?, ?)", (uid, json.dumps(fields), int(upsert))
+        ).lastrowid
+
+    def pending(self):
+        """(seq, uid, fields, upsert) rows in write order."""
+        return [
+            (seq, uid, json.loads(fields), bool(upsert))
+            for seq, uid, fields, upsert in self.conn.execute("SELECT seq, uid, fields, upsert FROM writes ORDER BY seq")
+        ]
+
+    def discard_through(self, seq):
+        self.conn.execute("DELETE FROM writes WHERE seq <= ?", (seq,))
+
+    def empty(self):
+        return self.conn.execute("SELECT 1 FROM writes LIMIT 1").fetchone() is None
+
+    def close(self):
+        self.conn.close()
+
+
+class WriteBehindBuffer:
+    """
+    Coalesces onboarding profile writes per uid and sends them to Mongo as
+    one unordered bulk_write per flush, off the request path.
+
+    A flush runs every `flush_interval` seconds, as soon as `max_batch` uids
+    are pending, and at interpreter exit. Modes:
+
+        sync        write through: each call does its own bulk_write
+        buffered    in memory only; a crash loses up to one interval of writes
+        journaled   buffered, plus a local WriteJournal per process; at
+                    start, the journals of processes that are gone are
+                    replayed (see apps.py)
+
+    Failed flushes are merged back under any newer values and retried after
+    an interval that doubles with each consecutive failure, up to
+    PROFILE_FLUSH_MAX_BACKOFF. Writes are not visible to Mongo reads until they flush.
+    """
+
+    def __init__(self, get_collection=get_collection, mode=PROFILE_WRITE_MODE, flush_interval=PROFILE_FLUSH_INTERVAL,
+                 max_batch=PROFILE_FLUSH_MAX_BATCH, journal_path=PROFILE_WRITE_JOURNAL, max_backoff=PROFILE_FLUSH_MAX_BACKOFF):
+        if mode not in WRITE_MODES:
+            raise ValueError(f"Unknown profile write mode '{mode}', expected one of {WRITE_MODES}")
+        self.get_collection = get_collection
+        self.mode = mode
+        self.flush_interval = flush_interval
+        self.max_batch = max(1, max_batch)
+        self.max_backoff = max_backoff
+        self.failures = 0  # consecutive failed flushes
+        self.journal_path = journal_path
+        self.journal = None
+        self.journal_lock = None  # fd of this process's journal lock
+        self.pending = {}  # uid -> {"fields": dict, "upsert": bool}
+        self.last_seq = 0  # newest journal row folded into `pending`
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.closed = False
+        self.counters = {"writes": 0, "flushes": 0, "operations": 0, "errors": 0}
+
+    def start(self):
+        """Replay orphaned journals and start the flusher; runs at app start, or on the first write."""
+        with self.lock:
+            self._start()
+
+    def _start(self):
+        # Called with self.lock held.
+        if self.thread is not None or self.mode == "sync":
+            return
+        if self.mode == "journaled":
+            path = f"{self.journal_path}.{os.getpid()}"
+            self.journal_lock = _lock_owner(path)
+            if self.journal_lock is None:
+                raise RuntimeError(f"profile write journal {path} is locked by another process")
+            self.journal = WriteJournal(path)
+            # Rows left in our own file belong to an earlier process with the same pid.
+            for seq, uid, fields, upsert in self.journal.pending():
+                self._merge(uid, fields, upsert)
+                self.last_seq = seq
+            self._adopt_orphans(path)
+        self.thread = threading.Thread(target=self._run, name="profile-write-behind", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _adopt_orphans(self, own_path):
+        """Move the pending writes of journals whose process is gone into ours."""
+        # The bare path is the single shared journal of earlier versions.
+        paths = [self.journal_path] + glob.glob(glob.escape(self.journal_path) + ".*")
+        for path in paths:
+            if path == own_path or path.endswith(("-wal", "-shm", ".lock")) or not os.path.exists(path):
+                continue
+            fd = _lock_owner(path)
+            if fd is None:
+                continue  # a live process owns it
+            try:
+                orphan = WriteJournal(path)
+                writes = orphan.pending()
+                for _, uid, fields, upsert in writes:
+                    self.last_seq = self.journal.append(uid, fields, upsert)
+                    self._merge(uid, fields, upsert)
+                orphan.close()
+                _remove_journal(path)
+                if writes:
+                    print(f"Replayed {len(writes)} unflushed profile writes from {path}")
+            finally:
+                os.close(fd)
+            if os.path.exists(path + ".lock"):
+                os.remove(path + ".lock")
+
+    def _merge(self, uid, fields, upsert):
+        item = self.pending.setdefault(uid, {"fields": {}, "upsert": False})
+        item["fields"].update(fields)
+        item["upsert"] = item["upsert"] or upsert
+
+    def set(self, uid, fields, upsert=False):
+        """$set `fields` on the profile with this uid (creating it when `upsert`)."""
+        if self.mode == "sync":
+            self._write({uid: {"fields": dict(fields), "upsert": upsert}})
+            self.counters["writes"] += 1
+            return
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("profile write buffer is closed")
+            self._start()
+            if self.journal is not None:
+                self.last_seq = self.journal.append(uid, fields, upsert)
+            self._merge(uid, fields, upsert)
+            self.counters["writes"] += 1
+            full = len(self.pending) >= self.max_batch
+        if full and not self.failures:
+            self.wake.set()  # while Mongo fails, a full batch waits out the backoff
+
+    def _write(self, batch):
+        from pymongo import UpdateOne
+
+        operations = [
+            UpdateOne({"uid": uid}, {"$set": item["fields"]}, upsert=item["upsert"]) for uid, item in batch.items()
+        ]
+        self.get_collection().bulk_write(operations, ordered=False)
+        self.counters["flushes"] += 1
+        self.counters["operations"] += len(operations)
+
+    def flush(self):
+        """Send everything pending now; returns the number of uids written."""
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, {}
+                seq = self.last_seq
+            if not batch:
+                return 0
+            try:
+                self._write(batch)
+            except Exception as e:
+                if not self.failures:
+                    print(f"Profile write-behind flush of {len(batch)} profiles failed, retrying with backoff: {e}")
+                self.failures += 1
+                with self.lock:
+                    self.counters["errors"] += 1
+                    for uid, item in batch.items():
+                        newer = self.pending.get(uid)
+                        self.pending[uid] = item
+                        if newer:
+                            self._merge(uid, newer["fields"], newer["upsert"])
+                return 0
+            if self.failures:
+                print(f"Profile write-behind flushed again after {self.failures} failed attempts")
+                self.failures = 0
+            if self.journal is not None:
+                with self.lock:
+                    self.journal.discard_through(seq)
+            return len(batch)
+
+    def _retry_delay(self):
+        if not self.failures:
+            return self.flush_interval
+        return min(self.flush_interval * 2 ** min(self.failures, 32), max(self.max_backoff, self.flush_interval))
+
+    def _run(self):
+        while not self.closed:
+            self.wake.wait(self._retry_delay())
+            self.wake.clear()
+            if self.closed:
+                break
+            self.flush()
+
+    def close(self):
+        """Flush what is left and stop the flusher; registered with atexit."""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.wake.set()
+        self.flush()
+        if self.journal is not None:
+            with self.lock:
+                empty = self.journal.empty()
+                self.journal.close()
+                if empty:
+                    _remove_journal(self.journal.path)
+                os.close(self.journal_lock)
+                if empty:
+                    os.remove(self.journal.path + ".lock")
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, "mode": self.mode, "pending": len(self.pending)}
+
+
+profile_writes = WriteBehindBuffer()
@@ -0,0 +1,64 @@
+import os
+import threading
+from .mongo_client import get_collection
+from .profile_writes import profile_writes
+
+# Profile fields besides uid that get a (non-unique) index; every lookup by uid uses uid_unique.
+MONGO_PROFILE_INDEXES = [f.strip() for f in os.getenv("MONGO_PROFILE_INDEXES", "field").split(",") if f.strip()]
+
+
+class ProfileRepository:
+    """
+    Business-owner profiles in the UserDetails collection, keyed by uid.
+    Writes go through the write-behind buffer (chatbot.profile_writes).
+    """
+
+    def __init__(self, get_collection=get_collection, writes=profile_writes, indexed_fields=MONGO_PROFILE_INDEXES):
+        self.get_collection = get_collection
+        self.writes = writes
+        self.indexed_fields = indexed_fields
+        self.indexes_ready = False
+        self.lock = threading.Lock()
+
+    def ensure_indexes(self):
+        """Create the uid (unique) and MONGO_PROFILE_INDEXES indexes if missing; safe to run on every start."""
+        from pymongo import ASCENDING, IndexModel
+        from pymongo.errors import OperationFailure
+
+        models = [IndexModel([("uid", ASCENDING)], name="uid_unique", unique=True)]
+        models += [IndexModel([(field, ASCENDING)], name=f"{field}_1") for field in self.indexed_fields if field != "uid"]
+        collection = self.get_collection()
+        ready = True
+        with self.lock:
+            for model in models:
+                try:
+                    # A no-op when an identical index exists.
+                    collection.create_indexes([model])
+                except OperationFailure as e:
+                    # e.g. duplicate uids, or the same keys indexed under another name or options.
+                    print(f"Could not create profile index '{model.document['name']}': {e}")
+                    ready = False
+            self.indexes_ready = ready
+        return ready
+
+    def warm(self):
+        """Connect and create indexes ahead of the first request."""
+        try:
+            self.ensure_indexes()
+            print("MongoDB connection successful!")
+        except Exception as e:
+            print(f"Warning: MongoDB connection failed ({e}). Using fallback mode.")
+
+    def warm_in_background(self):
+        thread = threading.Thread(target=self.warm, name="mongo-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def create(self, uid, **fields):
+        self.writes.set(uid, fields, upsert=True)
+
+    def update(self, uid, **fields):
+        self.writes.set(uid, fields)
+
+
+profile_repository = ProfileRepository()
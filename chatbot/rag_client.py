@@ -1,176 +1,967 @@
 import os
 import json
 import re
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import faiss
+from . import rag_storage, index_types
+from .keyword_index import KeywordIndex
+from .meta_store import MetaStore
+from .retrieval import hybrid_retrieve
+from .embeddings import EMBED_MODEL, shared_embeddings
 
 BASE_FAISS_DIR = r"E:\RAGDB"
 os.makedirs(BASE_FAISS_DIR, exist_ok=True)
-EMBED_MODEL = "BAAI/bge-base-en-v1.5"  # or "all-MiniLM-L6-v2" for speed
+RAG_COMPACT_EVERY = int(os.getenv("RAG_COMPACT_EVERY", "500"))  # appended or deleted chunks before a snapshot is rewritten
+RAG_FSYNC = os.getenv("RAG_FSYNC", "1") != "0"
+RAG_RESIDENT_BUDGET_MB = int(os.getenv("RAG_RESIDENT_BUDGET_MB", "4096"))  # 0 = keep every DB loaded
+RAG_INDEX_MMAP = os.getenv("RAG_INDEX_MMAP", "1") != "0"
+# Keyword postings take roughly this many times their JSON size in RAM.
+META_MEMORY_FACTOR = 3
+# Model behind DBs written before the embedding model was recorded.
+LEGACY_EMBED_MODEL = "BAAI/bge-base-en-v1.5"
+# Keep one DB per field (<field>/_shared) holding every tenant, instead of one per tenant.
+RAG_SHARED_FIELDS = os.getenv("RAG_SHARED_FIELDS", "0") != "0"
+# Tenant filters select a sliver of a shared index; graph and IVF search only
+# visit part of it and can miss that sliver, so shared DBs scan (flat or sq8).
+RAG_SHARED_INDEX_TYPE = os.getenv("RAG_SHARED_INDEX_TYPE", "flat")
+# Every compaction rewrites the whole snapshot, so big shared DBs compact less often.
+RAG_SHARED_COMPACT_EVERY = int(os.getenv("RAG_SHARED_COMPACT_EVERY", "20000"))
+# Tenants with at most this many chunks are ranked exactly from their own vectors.
+RAG_SHARED_EXACT_MAX = int(os.getenv("RAG_SHARED_EXACT_MAX", "4096"))
+SHARED_FOLDER = "_shared"
+
+_compaction_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-compaction")
 
 def sanitize_folder_name(name):
     if not name:
         return "unknown"
     return re.sub(r'[^A-Za-z0-9_\-]', '', name.replace(" ", "_"))
 
+def folder_db(folder_path, embeddings=None, on_resize=None):
+    """UserRAGVectorDB for a folder, with the index type and compaction interval of shared field DBs where it is one."""
+    if os.path.basename(folder_path) == SHARED_FOLDER:
+        return UserRAGVectorDB(
+            folder_path, embeddings, on_resize=on_resize,
+            index_kind=RAG_SHARED_INDEX_TYPE, compact_every=RAG_SHARED_COMPACT_EVERY,
+        )
+    return UserRAGVectorDB(folder_path, embeddings, on_resize=on_resize)
+
+
 class UserRAGDBManager:
-    def __init__(self, base_dir=BASE_FAISS_DIR):
+    """
+    Hands out one UserRAGVectorDB per folder. DBs load their data on first use;
+    once the estimated RAM of loaded DBs exceeds RAG_RESIDENT_BUDGET_MB the
+    least recently used ones are unloaded (their objects, and so their
+    versions, stay cached and reload transparently). A loaded DB that another
+    worker process has written since it was read is reloaded before get_db()
+    hands it out.
+    """
+
+    def __init__(self, base_dir=BASE_FAISS_DIR, embeddings=shared_embeddings, resident_budget_mb=RAG_RESIDENT_BUDGET_MB,
+                 shared_fields=RAG_SHARED_FIELDS):
         self.base_dir = base_dir
+        self.embeddings = embeddings
+        self.shared_fields = shared_fields
         os.makedirs(self.base_dir, exist_ok=True)
-        self.cache = {}
+        self.cache = {}  # folder path -> UserRAGVectorDB
+        self.lock = threading.Lock()
+        self.resident_budget = resident_budget_mb * 1024 * 1024
+        self.resident = OrderedDict()  # folder path -> estimated bytes of loaded DBs, least recently used first
+        self.counters = {"loads": 0, "evictions": 0, "busy_skips": 0}
 
-    def get_user_folder(self, company_name, uid, field=None):
+    def user_folder_path(self, company_name, uid, field=None):
         field_folder = sanitize_folder_name(field) if field else "general"
         user_folder = f"{sanitize_folder_name(company_name)}_{uid}"
-        folder_path = os.path.join(self.base_dir, field_folder, user_folder)
+        return os.path.join(self.base_dir, field_folder, user_folder)
+
+    def get_user_folder(self, company_name, uid, field=None):
+        folder_path = self.user_folder_path(company_name, uid, field)
         os.makedirs(folder_path, exist_ok=True)
         return folder_path
 
+    def get_db(self, folder_path):
+        db = self.cache.get(folder_path)
+        if db is None:
+            with self.lock:
+                db = self.cache.get(folder_path)
+                if db is None:
+                    db = folder_db(folder_path, self.embeddings, on_resize=self._resized)
+                    self.cache[folder_path] = db
+        elif db.loaded and not db.refresh():
+            self._touch(db, db.resident_bytes())
+        return db
+
+    def _resized(self, db):
+        # Called by a DB after it loads or grows.
+        self._touch(db, db.resident_bytes())
+
+    def _touch(self, db, size):
+        # Sizes are computed before taking self.lock: DB locks may be held by
+        # threads waiting for it, so only non-blocking unloads happen below.
+        with self.lock:
+            if db.folder_path not in self.resident:
+                self.counters["loads"] += 1
+            self.resident[db.folder_path] = size
+            self.resident.move_to_end(db.folder_path)
+            if not self.resident_budget:
+                return
+            total = sum(self.resident.values())
+            for folder_path in list(self.resident)[:-1]:
+                if total <= self.resident_budget:
+                    break
+                if self.cache[folder_path].unload(blocking=False):
+                    total -= self.resident.pop(folder_path)
+                    self.counters["evictions"] += 1
+                else:
+                    self.counters["busy_skips"] += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                **self.counters,
+                "known_dbs": len(self.cache),
+                "resident_dbs": len(self.resident),
+                "resident_bytes": sum(self.resident.values()),
+                "resident_budget_bytes": self.resident_budget,
+                "mapped_dbs": sum(1 for path in self.resident if self.cache[path].mapped_path),
+            }
+
+    def shared_folder_path(self, field=None):
+        return os.path.join(self.base_dir, sanitize_folder_name(field) if field else "general", SHARED_FOLDER)
+
     def get_user_db(self, company_name, uid, field=None):
-        key = (company_name, uid, field)
-        if key not in self.cache:
-            folder = self.get_user_folder(company_name, uid, field)
-            self.cache[key] = UserRAGVectorDB(folder)
-        return self.cache[key]
-    
+        folder_path = self.user_folder_path(company_name, uid, field)
+        if self.shared_fields:
+            shared_path = self.shared_folder_path(field)
+            os.makedirs(shared_path, exist_ok=True)
+            return TenantView(self.get_db(shared_path), os.path.basename(folder_path), folder_path)
+        if folder_path not in self.cache and not os.path.isdir(folder_path):
+            os.makedirs(folder_path, exist_ok=True)
+        return self.get_db(folder_path)
+
     def get_all_user_dbs(self, company_name, uid):
         """
         Return all UserRAGVectorDBs for a user (across all field folders).
+        Field folders are listed on every call, so ones another process created are included.
         """
-        dbs = []
         company_folder_prefix = f"{sanitize_folder_name(company_name)}_{uid}"
+        if self.shared_fields:
+            views = []
+            for field_folder in os.listdir(self.base_dir):
+                shared_path = os.path.join(self.base_dir, field_folder, SHARED_FOLDER)
+                if os.path.isdir(shared_path):
+                    view = TenantView(
+                        self.get_db(shared_path),
+                        company_folder_prefix,
+                        os.path.join(self.base_dir, field_folder, company_folder_prefix),
+                    )
+                    if view.has_vectors():
+                        views.append(view)
+            return views
+        dbs = []
         for field_folder in os.listdir(self.base_dir):
             path = os.path.join(self.base_dir, field_folder, company_folder_prefix)
             if os.path.isdir(path):
-                dbs.append(UserRAGVectorDB(path))
+                dbs.append(self.get_db(path))
         return dbs
 
+def chunk_text(chunk):
+    """Text that gets embedded for a stored chunk."""
+    if chunk.get("chunk_type") == "qa":
+        text = f"Q: {chunk.get('question', '')}\nA: {chunk.get('answer', '')}"
+    elif chunk.get("chunk_type") == "file_chunk":
+        content = chunk.get("content", "")
+        if isinstance(content, dict):
+            content = content.get("content", "")
+        text = content if isinstance(content, str) else str(content)
+    else:
+        text = json.dumps(chunk, ensure_ascii=False)
+    if not isinstance(text, str):
+        text = str(text)
+    return text
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
 class UserRAGVectorDB:
-    def __init__(self, folder_path):
+    """
+    Per-user FAISS index plus chunk metadata; MetaStore rows and vectors share
+    a chunk id, which results report as "chunk_global_index".
+    Writes are appended to segment files and folded into a snapshot by a
+    background compaction every RAG_COMPACT_EVERY chunks; see rag_storage.
+    Deleted chunks are tombstoned (skipped by searches) until that compaction
+    drops their vectors. A shared field DB tags chunks with their tenant and
+    the tenant= arguments restrict reads and writes to one of them; see TenantView.
+    Several processes may write one folder: loads, appends and the manifest
+    swap of a compaction hold its FolderLock, and a process reloads the folder
+    before writing when another one has changed it since it was read.
+    Nothing is read from disk until the DB is first used, and unload() drops
+    the in-memory state again. Snapshot indexes are memory-mapped when
+    RAG_INDEX_MMAP is on and copied into RAM only once the DB is written to.
+    """
+
+    def __init__(self, folder_path, embeddings=None, on_resize=None, index_kind=None, compact_every=RAG_COMPACT_EVERY):
         self.folder_path = folder_path
+        # Pre-segment layout (langchain FAISS.save_local + one JSON array); read until the first compaction.
         self.db_path = os.path.join(folder_path, "faiss_index")
         self.meta_path = os.path.join(folder_path, "faiss_meta.json")
-        self.embeddings = HuggingFaceEmbeddings(model_name=EMBED_MODEL)
+        self.embeddings = embeddings or shared_embeddings
+        self.lock = threading.RLock()
+        self.compact_lock = threading.Lock()
+        self.folder_lock = rag_storage.FolderLock(folder_path)  # taken after self.lock, never before it
+        self.disk_stamp = None  # _disk_stamp() as of the last load
         self.index = None
-        self.meta = []
-        self.load()
+        self.store = None
+        self.keywords = KeywordIndex()
+        self.generation = 0
+        self.segment_records = 0
+        self.next_id = 0
+        self.tombstones = set()  # deleted chunk ids whose vectors are still in self.index
+        self._search_params = None  # faiss SearchParameters skipping self.tombstones
+        self.compaction_pending = False
+        self.version = 0  # bumped on every write; keys the retrieval caches
+        self.on_resize = on_resize  # called after the DB loads or grows; see UserRAGDBManager
+        self.loaded = False
+        self.mapped_path = None  # index file backing a memory-mapped self.index
+        self.keyword_bytes = 0
+        self.embed_model = None  # model the stored vectors came from; None until the first write
+        self.index_kind = index_kind  # overrides RAG_INDEX_TYPE
+        self.compact_every = compact_every
+        self.tenant_ids = {}  # tenant -> live chunk ids, for shared DBs
+        self.tenant_versions = {}  # tenant -> write count; keys that tenant's caches
+        self._tenant_params = {}  # tenant -> faiss SearchParameters selecting its ids
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with self.lock:
+                if self.loaded:
+                    return
+                self.load()
+            if self.on_resize:
+                self.on_resize(self)
 
     def load(self):
-        if os.path.exists(self.db_path):
-            self.index = FAISS.load_local(self.db_path, self.embeddings, allow_dangerous_deserialization=True)
-            if os.path.exists(self.meta_path):
-                with open(self.meta_path, "r", encoding="utf-8") as f:
-                    self.meta = json.load(f)
-        else:
+        with self.lock, self.folder_lock:
             self.index = None
-            self.meta = []
+            self.mapped_path = None
+            keywords = None
+            manifest = rag_storage.read_manifest(self.folder_path)
+            if manifest:
+                self.generation = manifest["generation"]
+                if manifest.get("snapshot"):
+                    io_flags = index_types.mmap_flag(manifest.get("index_type", "flat")) if RAG_INDEX_MMAP else 0
+                    self.index, keywords = rag_storage.read_snapshot(
+                        self.folder_path, manifest["snapshot"], io_flags=io_flags
+                    )
+                    if io_flags:
+                        self.mapped_path = rag_storage.snapshot_index_path(self.folder_path, manifest["snapshot"])
+            else:
+                self.generation = 0
+                legacy_index = os.path.join(self.db_path, "index.faiss")
+                if os.path.exists(legacy_index):
+                    self.index = faiss.read_index(legacy_index)
+            index_types.configure(self.index)
+            self.keyword_bytes = rag_storage.keywords_bytes(self.folder_path, manifest)
+
+            if self.store is None:
+                self.store = MetaStore(self.folder_path, fsync=RAG_FSYNC)
+            if not self.store.initialized:
+                self._import_json_metadata(manifest)
+            # Positional snapshots (written before ID mapping) hold ids 0..ntotal-1.
+            snapshot_next_id = self.index.ntotal if self.index is not None else 0
+            if manifest and "next_id" in manifest:
+                snapshot_next_id = manifest["next_id"]
+
+            # Vectors whose metadata rows were never committed are a torn write.
+            stored = self.store.next_id()
+            vectors_next_id = snapshot_next_id
+            seen_next_id = stored  # above every id handed out, including torn ones
+            self.segment_records = 0
+            torn = False
+            for generation in rag_storage.list_segments(self.folder_path):
+                if generation < self.generation:
+                    continue  # already in the snapshot; left behind by an interrupted cleanup
+                ids, vectors, segment_torn = rag_storage.read_segment(self.folder_path, generation)
+                if len(ids):
+                    seen_next_id = max(seen_next_id, int(ids.max()) + 1)
+                ids, vectors, dropped = self._committed(ids, vectors)
+                segment_torn = segment_torn or dropped
+                if len(ids):
+                    self._add_vectors(vectors, ids)
+                    self.segment_records += len(ids)
+                    vectors_next_id = max(vectors_next_id, int(ids.max()) + 1)
+                self.generation = generation
+                torn = torn or segment_torn
+            if torn:
+                # Never append after a partially written batch.
+                self.generation += 1
+            if stored > vectors_next_id:
+                # Metadata committed for vectors that never reached disk (RAG_FSYNC=0 crash).
+                self.store.delete_from(vectors_next_id)
+            # Ids are never reused: torn vectors stay in their segment, so their
+            # ids must not be handed out again.
+            self.next_id = seen_next_id
+            if seen_next_id > stored:
+                self.store.reserve_ids(seen_next_id)
+
+            if keywords is not None:
+                self.keywords = KeywordIndex.from_dict(keywords)
+                start = snapshot_next_id
+            else:
+                self.keywords = KeywordIndex()
+                start = 0
+            for chunk_id, entry in self.store.iter_entries(start):
+                self.keywords.add(chunk_id, chunk_text(entry.get("chunk", {})))
+            self.tombstones = set()
+            for chunk_id, entry in self.store.tombstoned_entries():
+                self.keywords.remove(chunk_id, chunk_text(entry.get("chunk", {})))
+                self.tombstones.add(chunk_id)
+            self._search_params = None
+            self.tenant_ids = self.store.tenant_ids()
+            self._tenant_params = {}
+
+            self.embed_model = (manifest or {}).get("embed_model") or self.store.get_info("embed_model")
+            if self.embed_model is None and self.index is not None:
+                self.embed_model = LEGACY_EMBED_MODEL
+            mismatch = self._model_mismatch()
+            if mismatch:
+                print(f"{mismatch}; vector search and writes are disabled until then.")
+            self.disk_stamp = self._disk_stamp()
+            self.loaded = True
+
+    def _disk_stamp(self):
+        # Changed by another process's MetaStore commit or manifest swap, not by our own commits.
+        return self.store.data_version(), self._manifest_stamp()
+
+    def _manifest_stamp(self):
+        try:
+            stat = os.stat(os.path.join(self.folder_path, rag_storage.MANIFEST_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def refresh(self):
+        """Reload a loaded DB that another process changed since it was read; returns whether it did."""
+        with self.lock:
+            if not self.loaded or self._disk_stamp() == self.disk_stamp:
+                return False
+            with self.folder_lock:
+                reloaded = self._reload_if_stale()
+        if reloaded and self.on_resize:
+            self.on_resize(self)
+        return reloaded
+
+    def _reload_if_stale(self):
+        """Reload if another process changed the folder since it was read; needs self.lock and self.folder_lock."""
+        if self._disk_stamp() == self.disk_stamp:
+            return False
+        self.load()
+        self.version += 1
+        for tenant in set(self.tenant_versions) | set(self.tenant_ids):
+            self.tenant_versions[tenant] = self.tenant_versions.get(tenant, 0) + 1
+        return True
+
+    def _committed(self, ids, vectors):
+        """(ids, vectors, dropped) keeping only segment vectors whose MetaStore row was committed."""
+        if not len(ids):
+            return ids, vectors, False
+        known = self.store.known_ids(ids.min(), ids.max())
+        committed = np.fromiter((int(i) in known for i in ids), dtype=bool, count=len(ids))
+        if committed.all():
+            return ids, vectors, False
+        return ids[committed], vectors[committed], True
+
+    def _embeddings_model(self):
+        return getattr(self.embeddings, "model_name", EMBED_MODEL)
+
+    def _model_mismatch(self):
+        """Why the running embedding model can't be used with this DB's vectors, or None."""
+        if self.embed_model and self.embed_model != self._embeddings_model():
+            return (
+                f"RAG DB {self.folder_path} was embedded with {self.embed_model}, not {self._embeddings_model()}; "
+                "run `python manage.py reembed_tenants` to migrate it"
+            )
+        return None
+
+    def _import_json_metadata(self, manifest):
+        """One-time move of metadata from the JSON layouts (snapshot meta.json, segment .jsonl, faiss_meta.json) into the MetaStore."""
+        entries = []
+        if manifest and manifest.get("snapshot"):
+            entries = rag_storage.read_snapshot_entries(self.folder_path, manifest["snapshot"])
+        elif os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        ids = list(range(len(entries)))
+        for generation in rag_storage.list_segments(self.folder_path):
+            if generation < self.generation:
+                continue
+            segment_ids, _, _ = rag_storage.read_segment(self.folder_path, generation)
+            segment_entries = rag_storage.read_segment_entries(self.folder_path, generation)
+            count = min(len(segment_ids), len(segment_entries))
+            ids.extend(int(i) for i in segment_ids[:count])
+            entries.extend(segment_entries[:count])
+        for entry in entries:
+            entry.setdefault("hash", content_hash(chunk_text(entry.get("chunk", {}))))
+        self.store.import_entries(ids, entries)
+
+    def unload(self, blocking=True):
+        """
+        Drop the index and keyword index from memory and close the metadata
+        store; the next use reloads them. Returns False (and keeps everything)
+        if `blocking` is off and the DB is busy.
+        """
+        if not self.compact_lock.acquire(blocking=blocking):
+            return False
+        try:
+            if not self.lock.acquire(blocking=blocking):
+                return False
+            try:
+                self.index = None
+                self.keywords = KeywordIndex()
+                self.tombstones = set()
+                self._search_params = None
+                self.tenant_ids = {}
+                self._tenant_params = {}
+                if self.store is not None:
+                    self.store.close()
+                    self.store = None
+                self.mapped_path = None
+                self.keyword_bytes = 0
+                self.loaded = False
+                return True
+            finally:
+                self.lock.release()
+        finally:
+            self.compact_lock.release()
+
+    def resident_bytes(self):
+        """Estimated RAM held by the loaded DB; mapped index pages belong to the OS page cache and aren't counted."""
+        with self.lock:
+            if not self.loaded:
+                return 0
+            index_size = 0 if self.mapped_path else index_types.index_bytes(self.index)
+            return index_size + self.keyword_bytes * META_MEMORY_FACTOR
+
+    def has_vectors(self, tenant=None):
+        with self.lock:
+            self.ensure_loaded()
+            if tenant is not None:
+                return bool(self.tenant_ids.get(tenant))
+            return self.index is not None and self.index.ntotal > len(self.tombstones)
+
+    def _make_writable(self):
+        # Mapped indexes can't grow; swap in an in-RAM copy read from the same file.
+        if self.mapped_path:
+            self.index = index_types.configure(faiss.read_index(self.mapped_path))
+            self.mapped_path = None
+
+    def _add_vectors(self, vectors, ids):
+        if self.index is None:
+            self.index = index_types.new_index(self._target_index_type(len(vectors)), vectors.shape[1])
+        self._make_writable()
+        index_types.add_vectors(self.index, vectors, ids)
+
+    def _target_index_type(self, ntotal, current=None):
+        if self.index_kind:
+            return index_types.target_index_type(ntotal, self.index_kind, current)
+        return index_types.target_index_type(ntotal, current=current)
+
+    def _add_keywords(self, ids, entries):
+        for chunk_id, entry in zip(ids, entries):
+            text = chunk_text(entry.get("chunk", {}))
+            self.keywords.add(int(chunk_id), text)
+            self.keyword_bytes += len(text)
+
+    def _schedule_compaction(self):
+        if self.segment_records + len(self.tombstones) >= self.compact_every and not self.compaction_pending:
+            self.compaction_pending = True
+            _compaction_executor.submit(self._compact_in_background)
 
     def save(self):
-        if self.index:
-            self.index.save_local(self.db_path)
-        with open(self.meta_path, "w", encoding="utf-8") as f:
-            json.dump(self.meta, f, indent=2, ensure_ascii=False)
+        """Write a full snapshot now instead of waiting for the next compaction."""
+        self.compact()
 
-    def add_records(self, records):
-        from langchain.schema import Document  # local import to avoid cyclic
-        docs = []
-        meta_list = []
+    def compact(self):
+        """
+        Fold all appended segments into a new snapshot and swap it in atomically,
+        dropping the vectors of tombstoned chunks. If the DB has outgrown its
+        index type (see index_types), the index predates ID mapping, or it is an
+        HNSW graph with deletions, the snapshot is rebuilt and replaces the
+        in-memory index as well.
+        """
+        with self.compact_lock:
+            with self.lock, self.folder_lock:
+                self.compaction_pending = False
+                self.ensure_loaded()
+                # The snapshot must cover every chunk below next_id, including other processes' ones.
+                self._reload_if_stale()
+                if self.index is None:
+                    return
+                dead = set(self.tombstones)
+                kind = self._target_index_type(self.index.ntotal - len(dead), index_types.index_type(self.index))
+                migrate = (
+                    kind != index_types.index_type(self.index)
+                    or not index_types.is_id_mapped(self.index)
+                    or (dead and not index_types.can_remove(self.index))
+                )
+                if not migrate and not dead and self.segment_records == 0 and rag_storage.read_manifest(self.folder_path):
+                    return
+                generation = self.generation + 1
+                if migrate:
+                    self._make_writable()
+                    ids, vectors = index_types.reconstruct_all(self.index)
+                else:
+                    if dead:
+                        self._make_writable()
+                    index = faiss.clone_index(self.index)
+                keywords = self.keywords.to_dict()
+                next_id = self.next_id
+                manifest_stamp = self._manifest_stamp()
+                # New appends go to a fresh segment that the snapshot won't cover.
+                self.generation = generation
+                self.segment_records = 0
+            dead_ids = np.asarray(sorted(dead), dtype="int64")
+            if migrate:
+                live = ~np.isin(ids, dead_ids)
+                index = index_types.build_index(kind, vectors[live], ids[live])
+            elif dead:
+                index.remove_ids(dead_ids)
+            # Not under self.lock: threads holding it may be waiting for the folder lock.
+            with self.folder_lock:
+                if self._manifest_stamp() != manifest_stamp:
+                    # Another process compacted the folder meanwhile; its snapshot stands.
+                    return
+                self._carry_over(generation, next_id)
+                snapshot = rag_storage.write_snapshot(
+                    self.folder_path, generation, index, keywords=keywords, fsync=RAG_FSYNC
+                )
+                manifest = {
+                    "generation": generation,
+                    "snapshot": snapshot,
+                    "index_type": index_types.index_type(index),
+                    "next_id": next_id,
+                    "embed_model": self.embed_model,
+                }
+                rag_storage.write_manifest(self.folder_path, manifest, fsync=RAG_FSYNC)
+                if dead:
+                    self.store.purge(dead_ids)
+                rag_storage.remove_compacted(self.folder_path, manifest, legacy_paths=(self.db_path, self.meta_path))
+                stamp = self._disk_stamp()
+            with self.lock:
+                if stamp[0] == self.disk_stamp[0]:
+                    # Only our own manifest changed; nothing to reload.
+                    self.disk_stamp = stamp
+                self.generation = max(self.generation, generation)
+                if migrate:
+                    # Vectors appended while the new index was being built went to the new segment.
+                    tail_ids, tail_vectors, _ = rag_storage.read_segment(self.folder_path, generation)
+                    tail_ids, tail_vectors, _ = self._committed(tail_ids, tail_vectors)
+                    if len(tail_ids):
+                        index_types.add_vectors(index, tail_vectors, tail_ids)
+                    self.index = index
+                    self._search_params = None
+                    self._tenant_params = {}
+                elif dead:
+                    self.index.remove_ids(dead_ids)
+                if dead:
+                    self.tombstones -= dead
+                    self._search_params = None
+
+    def _carry_over(self, generation, next_id):
+        """
+        Copy chunks that other processes appended, after compaction took its
+        copy of the index, to segments the new snapshot replaces into segment
+        `generation`; needs self.folder_lock.
+        """
+        for old in rag_storage.list_segments(self.folder_path):
+            if old >= generation:
+                continue
+            ids, vectors, _ = rag_storage.read_segment(self.folder_path, old)
+            later = ids >= next_id
+            if later.any():
+                ids, vectors, _ = self._committed(ids[later], vectors[later])
+                if len(ids):
+                    rag_storage.append_segment(self.folder_path, generation, ids, vectors, fsync=RAG_FSYNC)
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception as e:
+            print(f"RAG compaction failed for {self.folder_path}: {e}")
+
+    def new_entries(self, records, tenant=None):
+        """
+        Turn records into metadata entries for chunks not stored yet.
+        Returns (entries, texts, skipped) where skipped counts chunks whose
+        content hash is already in the DB (for `tenant`) or repeated within `records`.
+        """
+        candidates = []
         for record in records:
             chunks = record.get("chunks")
             if chunks is None and "chunk" in record:
                 chunks = [record["chunk"]]
-            if not chunks:
+            for chunk in chunks or []:
+                text = chunk_text(chunk)
+                candidates.append((record, chunk, text, content_hash(text)))
+        with self.lock:
+            self.ensure_loaded()
+            stored = self.store.existing_hashes((digest for _, _, _, digest in candidates), tenant=tenant)
+        entries = []
+        texts = []
+        skipped = 0
+        seen = set()
+        for record, chunk, text, digest in candidates:
+            if digest in stored or digest in seen:
+                skipped += 1
                 continue
-            for i, chunk in enumerate(chunks):
-                if chunk.get("chunk_type") == "qa":
-                    text = f"Q: {chunk.get('question', '')}\nA: {chunk.get('answer', '')}"
-                elif chunk.get("chunk_type") == "file_chunk":
-                    content = chunk.get("content", "")
-                    if isinstance(content, dict):
-                        content = content.get("content", "")
-                    text = content if isinstance(content, str) else str(content)
-                else:
-                    text = json.dumps(chunk, ensure_ascii=False)
-                if not isinstance(text, str):
-                    text = str(text)
-                doc = Document(
-                    page_content=text,
-                    metadata={
-                        "uid": record["uid"],
-                        **record["meta"],
-                        **chunk,
-                        "chunk_global_index": len(self.meta) + i,
-                    }
-                )
-                docs.append(doc)
-                meta_list.append({
-                    "uid": record["uid"],
-                    "meta": record["meta"],
-                    "chunk": chunk,
-                })
-        if docs:
-            if not self.index:
-                self.index = FAISS.from_documents(docs, self.embeddings)
+            seen.add(digest)
+            entry = {
+                "uid": record["uid"],
+                "meta": record["meta"],
+                "chunk": chunk,
+                "hash": digest,
+            }
+            if tenant is not None:
+                entry["tenant"] = tenant
+            entries.append(entry)
+            texts.append(text)
+        return entries, texts, skipped
+
+    def append_embedded(self, entries, vectors):
+        """Store entries from new_entries() with their vectors; returns how many were added."""
+        with self.lock:
+            self.ensure_loaded()
+            added = self._append(entries, vectors)
+        if added and self.on_resize:
+            self.on_resize(self)
+        return added
+
+    def _append(self, entries, vectors):
+        with self.folder_lock:
+            return self._append_locked(entries, np.asarray(vectors, dtype="float32"))
+
+    def _append_locked(self, entries, vectors):
+        # Another process may have written the folder; append after its chunks and segment generation.
+        self._reload_if_stale()
+        # Another writer may have stored the same content since new_entries() ran.
+        stored = set()
+        for tenant in {entry.get("tenant") for entry in entries}:
+            hashes = (entry["hash"] for entry in entries if entry.get("tenant") == tenant)
+            stored.update((tenant, digest) for digest in self.store.existing_hashes(hashes, tenant=tenant))
+        keep = [i for i, entry in enumerate(entries) if (entry.get("tenant"), entry["hash"]) not in stored]
+        if len(keep) != len(entries):
+            entries = [entries[i] for i in keep]
+            vectors = vectors[keep]
+        if not entries:
+            return 0
+        self._check_writable(vectors)
+        if self.embed_model is None:
+            self.embed_model = self._embeddings_model()
+            self.store.set_info("embed_model", self.embed_model)
+        start = self.store.allocate_ids(len(entries), self.next_id)
+        ids = np.arange(start, start + len(entries), dtype="int64")
+        # Vectors first: on load, vectors without committed metadata are dropped as torn.
+        rag_storage.append_segment(self.folder_path, self.generation, ids, vectors, fsync=RAG_FSYNC)
+        self.store.add(ids, entries)
+        self.next_id = max(self.next_id, start + len(entries))
+        self._add_vectors(vectors, ids)
+        self._add_keywords(ids, entries)
+        self._update_tenants(ids, entries, added=True)
+        self.segment_records += len(entries)
+        self.version += 1
+        self._schedule_compaction()
+        return len(entries)
+
+    def _check_writable(self, vectors):
+        # Before anything reaches the segment: a stored batch that doesn't fit the index makes the folder unloadable.
+        mismatch = self._model_mismatch()
+        if mismatch:
+            raise RuntimeError(mismatch)
+        if self.index is not None and vectors.shape[1] != self.index.d:
+            raise ValueError(f"{vectors.shape[1]}-dim vectors can't be added to {self.folder_path} ({self.index.d}-dim)")
+
+    def _update_tenants(self, ids, entries, added):
+        for chunk_id, entry in zip(ids, entries):
+            tenant = entry.get("tenant")
+            if tenant is None:
+                continue
+            tenant_ids = self.tenant_ids.setdefault(tenant, set())
+            if added:
+                tenant_ids.add(int(chunk_id))
             else:
-                self.index.add_documents(docs)
-            self.meta.extend(meta_list)
-        self.save()
+                tenant_ids.discard(int(chunk_id))
+            self.tenant_versions[tenant] = self.tenant_versions.get(tenant, 0) + 1
+            self._tenant_params.pop(tenant, None)
 
-    def search(self, query, top_k=3):
+    def delete(self, chunk_ids=None, **filters):
+        """
+        Delete chunks by id (a result's "chunk_global_index"), by MetaStore.ids_for
+        filters (uid, chunk_type, file_name, question, tenant) or by ids that also
+        match the filters; returns how many were deleted.
+        """
+        if chunk_ids is None and not filters:
+            raise ValueError("delete() needs chunk_ids or a filter")
+        with self.lock:
+            self.ensure_loaded()
+            if chunk_ids is None:
+                chunk_ids = self.store.ids_for(**filters)
+            elif filters:
+                chunk_ids = set(self.store.ids_for(**filters)).intersection(int(i) for i in chunk_ids)
+            return self._delete(chunk_ids)
+
+    def _delete(self, chunk_ids):
+        deleted = self.store.tombstone(chunk_ids)
+        if not deleted:
+            return 0
+        for chunk_id, entry in deleted.items():
+            text = chunk_text(entry.get("chunk", {}))
+            self.keywords.remove(chunk_id, text)
+            self.keyword_bytes = max(0, self.keyword_bytes - len(text))
+        self.tombstones.update(deleted)
+        self._search_params = None
+        self._update_tenants(deleted.keys(), deleted.values(), added=False)
+        self.version += 1
+        self._schedule_compaction()
+        return len(deleted)
+
+    def entries(self, **filters):
+        """Stored entries matching MetaStore.ids_for filters, oldest first."""
+        with self.lock:
+            self.ensure_loaded()
+            ids = self.store.ids_for(**filters)
+            entries = self.store.get_many(ids)
+        return [entries[chunk_id] for chunk_id in ids if chunk_id in entries]
+
+    def upsert(self, uid, meta, question, answer, tenant=None):
+        """
+        Store a Q/A chunk, replacing the uid's current answers to `question`.
+        meta=None keeps the meta of the answer being replaced. Returns added/deleted counts.
+        """
+        chunk = {"chunk_type": "qa", "question": question, "answer": answer}
+        text = chunk_text(chunk)
+        digest = content_hash(text)
+        with self.lock:
+            self.ensure_loaded()
+            current = self.store.get_many(self.store.ids_for(uid=uid, question=question, tenant=tenant))
+            if meta is None:
+                meta = current[max(current)]["meta"] if current else {}
+            if len(current) == 1:
+                (entry,) = current.values()
+                if entry["hash"] == digest and entry["meta"] == meta:
+                    return {"added": 0, "deleted": 0}
+        vectors = np.asarray(self.embeddings.embed_documents([text]), dtype="float32")
+        entry = {"uid": uid, "meta": meta, "chunk": chunk, "hash": digest}
+        if tenant is not None:
+            entry["tenant"] = tenant
+        with self.lock:
+            self.ensure_loaded()
+            self._check_writable(vectors)
+            deleted = self._delete(self.store.ids_for(uid=uid, question=question, tenant=tenant))
+            added = self._append([entry], vectors)
+        if self.on_resize:
+            self.on_resize(self)
+        return {"added": added, "deleted": deleted}
+
+    def add_records(self, records, tenant=None):
+        """Embed and store only chunks whose content isn't stored yet; returns added/skipped counts."""
+        entries, texts, skipped = self.new_entries(records, tenant=tenant)
+        added = 0
+        if entries:
+            added = self.append_embedded(entries, self.embeddings.embed_documents(texts))
+        return {"added": added, "skipped": skipped + len(entries) - added}
+
+    def live_chunks(self):
+        """(next_id, chunk ids, texts) of every stored chunk, for replace_embeddings()."""
+        with self.lock, self.folder_lock:
+            self.ensure_loaded()
+            self._reload_if_stale()
+            ids, texts = [], []
+            for chunk_id, entry in self.store.iter_entries():
+                ids.append(chunk_id)
+                texts.append(chunk_text(entry.get("chunk", {})))
+            return self.store.next_id(), ids, texts
+
+    def replace_embeddings(self, next_id, ids, vectors, embed_model):
+        """
+        Swap in a snapshot of `vectors` (one per id from live_chunks()) computed
+        with `embed_model`. Raises RuntimeError if any process added or deleted
+        chunks since live_chunks() ran; the old snapshot stays in place until the
+        manifest switches.
+        """
+        vectors = np.asarray(vectors, dtype="float32")
+        ids = np.asarray(ids, dtype="int64")
+        with self.compact_lock, self.lock, self.folder_lock:
+            self.ensure_loaded()
+            # Other processes only append under the folder lock, so nothing can land between this check and the swap.
+            if self._reload_if_stale() or self.store.next_id() != next_id:
+                raise RuntimeError(f"{self.folder_path} changed while it was being re-embedded")
+            dead = np.asarray(sorted(self.tombstones), dtype="int64")
+            live = ~np.isin(ids, dead)
+            index = None
+            if live.any():
+                index = index_types.build_index(self._target_index_type(int(live.sum())), vectors[live], ids[live])
+            generation = self.generation + 1
+            manifest = {"generation": generation, "snapshot": None, "next_id": self.next_id, "embed_model": embed_model}
+            if index is not None:
+                manifest["snapshot"] = rag_storage.write_snapshot(
+                    self.folder_path, generation, index, keywords=self.keywords.to_dict(), fsync=RAG_FSYNC
+                )
+                manifest["index_type"] = index_types.index_type(index)
+            rag_storage.write_manifest(self.folder_path, manifest, fsync=RAG_FSYNC)
+            self.store.set_info("embed_model", embed_model)
+            self.store.purge(dead)
+            self.index = index
+            self.mapped_path = None
+            self.generation = generation
+            self.segment_records = 0
+            self.tombstones = set()
+            self._search_params = None
+            self._tenant_params = {}
+            self.embed_model = embed_model
+            self.version += 1
+            for tenant in self.tenant_ids:
+                self.tenant_versions[tenant] = self.tenant_versions.get(tenant, 0) + 1
+            rag_storage.remove_compacted(self.folder_path, manifest, legacy_paths=(self.db_path, self.meta_path))
+        if self.on_resize:
+            self.on_resize(self)
+
+    def _results(self, chunk_ids):
+        """Search results for chunk ids, in order; deleted or unknown ids are skipped."""
+        entries = self.store.get_many(chunk_ids)
+        return [self._result(chunk_id, entries[chunk_id]) for chunk_id in chunk_ids if chunk_id in entries]
+
+    def _result(self, chunk_id, entry):
+        chunk = entry.get("chunk", {})
+        meta = entry.get("meta", {})
+        return {
+            "uid": entry["uid"],
+            **meta,
+            **chunk,
+            "meta": meta,
+            "chunk": chunk,
+            "chunk_global_index": chunk_id,
+            "content": chunk_text(chunk),
+        }
+
+    def search(self, query, top_k=3, tenant=None):
         # Vector search
-        if not self.index:
+        if not self.has_vectors(tenant) or top_k < 1:
             return []
-        results = self.index.similarity_search(query, k=top_k)
-        output = []
-        for r in results:
-            result = dict(r.metadata)
-            result["content"] = getattr(r, "page_content", None) or result.get("chunk", {}).get("content", "") or ""
-            if "name" not in result:
-                result["name"] = result.get("meta", {}).get("name")
-            if "field" not in result:
-                result["field"] = result.get("meta", {}).get("field")
-            output.append(result)
-        return output
+        return self.search_by_vector(self.embeddings.embed_query(query), top_k, tenant=tenant)
 
-    def keyword_search(self, query, top_k=3):
-        """Simple keyword search in meta and content."""
-        found = []
-        q = query.lower()
-        for entry in self.meta:
-            chunk = entry.get("chunk", {})
-            content = ""
-            if chunk.get("chunk_type") == "qa":
-                content = f"{chunk.get('question','')} {chunk.get('answer','')}"
-            elif chunk.get("chunk_type") == "file_chunk":
-                content = chunk.get("content", "")
+    def search_by_vector(self, vector, top_k=3, tenant=None):
+        """Vector search with an already embedded query."""
+        if top_k < 1:
+            return []
+        vector = np.asarray([vector], dtype="float32")
+        with self.lock:
+            self.ensure_loaded()
+            # Vectors from another model (or of another size) can't be compared; see load().
+            if self.index is None or self._model_mismatch() or vector.shape[1] != self.index.d:
+                return []
+            found = None
+            if tenant is not None:
+                tenant_ids = self.tenant_ids.get(tenant)
+                k = min(top_k, len(tenant_ids or ()))
+                if k < 1:
+                    return []
+                if len(tenant_ids) <= RAG_SHARED_EXACT_MAX:
+                    found = index_types.search_subset(self.index, vector, tenant_ids, k)
+                params = self._tenant_params.get(tenant)
+                if found is None and params is None:
+                    params = self._tenant_params[tenant] = index_types.search_params(self.index, include_ids=tenant_ids)
             else:
-                content = json.dumps(chunk, ensure_ascii=False)
-            # Check for keyword hit
-            if q in content.lower():
-                found.append({
-                    "uid": entry["uid"],
-                    "meta": entry["meta"],
-                    "chunk": chunk,
-                    "content": content
-                })
-            if len(found) >= top_k:
-                break
-        return found
+                k = min(top_k, self.index.ntotal - len(self.tombstones))
+                if k < 1:
+                    return []
+                if self.tombstones and self._search_params is None:
+                    self._search_params = index_types.search_params(self.index, exclude_ids=self.tombstones)
+                params = self._search_params if self.tombstones else None
+            distances, ids = found if found is not None else self.index.search(vector, k, params=params)
+            distance_of = {int(i): float(d) for d, i in zip(distances[0], ids[0]) if i >= 0}
+            results = self._results(list(distance_of))
+        for result in results:
+            result["distance"] = distance_of[result["chunk_global_index"]]
+        return results
 
-    def hybrid_search(self, query, top_k=3):
-        """Combine vector and keyword search, deduplicate, prefer keyword hits."""
-        vector_results = self.search(query, top_k=top_k)
-        keyword_results = self.keyword_search(query, top_k=top_k)
-        # Deduplicate by content
-        seen = set()
-        results = []
-        for r in keyword_results + vector_results:
-            key = str(r.get("content"))
-            if key not in seen:
-                results.append(r)
-                seen.add(key)
-            if len(results) >= top_k:
-                break
+    def keyword_search(self, query, top_k=3, tenant=None):
+        """BM25 keyword search over the DB's inverted index."""
+        with self.lock:
+            self.ensure_loaded()
+            allowed = None if tenant is None else self.tenant_ids.get(tenant, ())
+            hits = dict(self.keywords.search(query, top_k=top_k, allowed=allowed))
+            results = self._results(list(hits))
+        for result in results:
+            result["keyword_score"] = hits[result["chunk_global_index"]]
         return results
 
+    def hybrid_search(self, query, top_k=3):
+        """Combine vector and keyword search with reciprocal rank fusion; results carry a "score"."""
+        return hybrid_retrieve([self], query, top_k=top_k)
+
+
+class TenantView:
+    """
+    One tenant's part of a shared field DB (RAG_SHARED_FIELDS), with the
+    UserRAGVectorDB methods the app uses. folder_path is the tenant's would-be
+    per-tenant folder, so caches and pipelines key it exactly as before.
+    """
+
+    def __init__(self, db, tenant, folder_path):
+        self.db = db
+        self.tenant = tenant
+        self.folder_path = folder_path
+
+    @property
+    def embeddings(self):
+        return self.db.embeddings
+
+    @property
+    def version(self):
+        return self.db.tenant_versions.get(self.tenant, 0)
+
+    def has_vectors(self):
+        return self.db.has_vectors(self.tenant)
+
+    def search(self, query, top_k=3):
+        return self.db.search(query, top_k, tenant=self.tenant)
+
+    def search_by_vector(self, vector, top_k=3):
+        return self.db.search_by_vector(vector, top_k, tenant=self.tenant)
+
+    def keyword_search(self, query, top_k=3):
+        return self.db.keyword_search(query, top_k, tenant=self.tenant)
+
+    def hybrid_search(self, query, top_k=3):
+        return hybrid_retrieve([self], query, top_k=top_k)
+
+    def new_entries(self, records):
+        return self.db.new_entries(records, tenant=self.tenant)
+
+    def append_embedded(self, entries, vectors):
+        return self.db.append_embedded(entries, vectors)
+
+    def add_records(self, records):
+        return self.db.add_records(records, tenant=self.tenant)
+
+    def upsert(self, uid, meta, question, answer):
+        return self.db.upsert(uid, meta, question, answer, tenant=self.tenant)
+
+    def delete(self, chunk_ids=None, **filters):
+        if chunk_ids is None and not filters:
+            raise ValueError("delete() needs chunk_ids or a filter")
+        return self.db.delete(chunk_ids, tenant=self.tenant, **filters)
+
+    def entries(self, **filters):
+        return self.db.entries(tenant=self.tenant, **filters)
+
+    def compact(self):
+        self.db.compact()
+
+    save = compact
+
 rag_db_manager = UserRAGDBManager()
\ No newline at end of file
@@ -1,13 +1,56 @@
 import os
 import re
+import time
+import asyncio
+import weakref
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
 from .rag_client import rag_db_manager
-from langchain_openai import ChatOpenAI
+from .retrieval import hybrid_retrieve
+from .embeddings import shared_embeddings
+from .semantic_cache import semantic_cache
+from .context_builder import build_context, count_tokens, context_metrics
 
 load_dotenv()
 
+RAG_PIPELINE_CACHE_SIZE = int(os.getenv("RAG_PIPELINE_CACHE_SIZE", "1024"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+RAG_ASYNC_WORKERS = int(os.getenv("RAG_ASYNC_WORKERS", "8"))
+# Chunks retrieved per question; build_context packs them into RAG_CONTEXT_TOKEN_BUDGET.
+RAG_CONTEXT_CANDIDATES = int(os.getenv("RAG_CONTEXT_CANDIDATES", "3"))
+
+_llm = None
+_llm_lock = threading.Lock()
+# httpx.AsyncClient connections belong to the loop that opened them, so async
+# views get one client per event loop (a single one under a real ASGI server).
+# Under WSGI each async view runs on a loop of its own; its client is closed
+# with close_async_llm() when the request is done.
+_async_llms = weakref.WeakKeyDictionary()  # loop -> (ChatOpenAI, httpx.AsyncClient)
+# Retrieval (FAISS, BM25, query embedding) is CPU-bound; async views run it
+# here so the event loop stays free and CPU work is bounded to a few threads.
+_rag_executor = ThreadPoolExecutor(max_workers=RAG_ASYNC_WORKERS, thread_name_prefix="rag-async")
+_pipelines = OrderedDict()  # (company_name, uid, field) -> RAGPipeline
+_pipelines_lock = threading.Lock()
+
+NO_DATA_ANSWER = "No data found for this user"
+
+# Plain str.format template; langchain's PromptTemplate rendered it the same
+# way but cost its import on every boot.
+PROMPT = """
+    Use the following pieces of context to answer the question at the end.
+    If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+    Context:
+    {context}
+
+    Question: {question}
+
+    Answer:
+    """
+
 def clean_answer(text):
     if not isinstance(text, str):
         return text
@@ -19,85 +62,234 @@ def clean_answer(text):
     text = text.strip()
     return text
 
-def create_rag_pipeline(company_name, uid, field=None):
-    all_dbs = rag_db_manager.get_all_user_dbs(company_name, uid)
-    if field:
-        field_db = rag_db_manager.get_user_db(company_name, uid, field)
-        all_dbs = [field_db] + [db for db in all_dbs if db.folder_path != field_db.folder_path]
+# langchain_openai and httpx are imported when the first client is built, not at boot.
+def _http_limits():
+    import httpx
 
-    has_data = any(db.index for db in all_dbs)
-    if not has_data:
-        return lambda q: {"answer": "No data found for this user", "sources": []}
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    )
+
+def _new_llm(**client_kwargs):
+    from langchain_openai import ChatOpenAI
 
-    llm = ChatOpenAI(
+    return ChatOpenAI(
         model="mistralai/mistral-7b-instruct",
         api_key=os.getenv("OPENAI_API_KEY"),
         base_url=os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1"),
         temperature=0.7,
+        **client_kwargs
     )
 
-    def hybrid_retrieve(query, top_k=3):
-        results = []
-        for db in all_dbs:
-            results.extend(db.hybrid_search(query, top_k=top_k))
-        seen = set()
-        deduped = []
-        for r in results:
-            key = r.get("content", "")
-            if key not in seen:
-                deduped.append(r)
-                seen.add(key)
-        return deduped[:top_k]
-
-    template = """
-    Use the following pieces of context to answer the question at the end.
-    If you don't know the answer, just say that you don't know, don't try to make up an answer.
+def get_llm():
+    """Process-wide ChatOpenAI client; its HTTP connection pool is reused across requests."""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                import httpx
 
-    Context:
-    {context}
+                _llm = _new_llm(http_client=httpx.Client(limits=_http_limits()))
+    return _llm
 
-    Question: {question}
+def get_async_llm():
+    """ChatOpenAI client for ainvoke/astream, pooled per running event loop."""
+    loop = asyncio.get_running_loop()
+    entry = _async_llms.get(loop)
+    if entry is None:
+        import httpx
 
-    Answer:
+        client = httpx.AsyncClient(limits=_http_limits())
+        entry = _async_llms[loop] = (_new_llm(http_async_client=client), client)
+    return entry[0]
+
+async def close_async_llm():
+    """Close the running loop's client, for loops that end with the request (async views under WSGI)."""
+    entry = _async_llms.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        await entry[1].aclose()
+
+def iterate_in_new_loop(events):
     """
-    PROMPT = PromptTemplate(
-        template=template,
-        input_variables=["context", "question"]
-    )
+    Iterate an async generator from sync code, one item at a time, on an event
+    loop of its own that is closed (with its LLM client) once the generator is.
+    Under WSGI, Django reads an async iterator to the end before sending any of it.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(events.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(events.aclose())
+        loop.run_until_complete(close_async_llm())
+        loop.close()
 
-    def answer_question(question):
-        retrieved_docs = hybrid_retrieve(question, top_k=3)
-        if not retrieved_docs:
-            return {"answer": "No data found for this user", "sources": []}
+def warm_llm():
+    """Import langchain_openai and build the shared client ahead of the first request."""
+    try:
+        get_llm()
+    except Exception as e:
+        print(f"Could not pre-warm the LLM client: {e}")
+
+def warm_llm_in_background():
+    thread = threading.Thread(target=warm_llm, name="llm-warmup", daemon=True)
+    thread.start()
+    return thread
+
+async def run_in_rag_executor(func, *args):
+    """Run blocking RAG work (retrieval, DB writes) off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(_rag_executor, func, *args)
 
-        context = "\n\n".join([r["content"] for r in retrieved_docs if r.get("content")])
+def create_rag_pipeline(company_name, uid, field=None):
+    key = (company_name, uid, field)
+    with _pipelines_lock:
+        pipeline = _pipelines.get(key)
+        if pipeline is not None:
+            _pipelines.move_to_end(key)
+            return pipeline
+    pipeline = RAGPipeline(company_name, uid, field)
+    with _pipelines_lock:
+        _pipelines[key] = pipeline
+        while len(_pipelines) > RAG_PIPELINE_CACHE_SIZE:
+            _pipelines.popitem(last=False)
+    return pipeline
+
+def _message_text(result):
+    if isinstance(result, str):
+        return result
+    elif hasattr(result, "content"):
+        return result.content or ""
+    return ""
+
+def _cached_events(result):
+    yield "sources", result["sources"]
+    yield "token", {"text": result["answer"]}
+    yield "done", {"answer": result["answer"]}
+
+class RAGPipeline:
+    """
+    Answers questions over all of a user's field DBs.
+    DBs are resolved through rag_db_manager on every call: the manager caches
+    the user's folder list and DB objects, so new writes are seen immediately
+    without rebuilding the pipeline.
+    """
+
+    def __init__(self, company_name, uid, field=None):
+        self.company_name = company_name
+        self.uid = uid
+        self.field = field
+
+    def user_dbs(self):
+        all_dbs = rag_db_manager.get_all_user_dbs(self.company_name, self.uid)
+        if self.field:
+            field_db = rag_db_manager.get_user_db(self.company_name, self.uid, self.field)
+            all_dbs = [field_db] + [db for db in all_dbs if db.folder_path != field_db.folder_path]
+        return all_dbs
+
+    def retrieve(self, question, top_k=3):
+        all_dbs = self.user_dbs()
+        if not any(db.has_vectors() for db in all_dbs):
+            return []
+        return hybrid_retrieve(all_dbs, question, top_k=top_k)
+
+    def build_prompt(self, question, retrieved_docs):
+        """Return (prompt string, sources) for the retrieved chunks that fit the context budget."""
+        packed = build_context(retrieved_docs)
         sources = [
             {
                 "content": r["content"],
-                "metadata": r.get("meta", {})
+                "metadata": r.get("meta", {}),
+                "score": r["score"]
             }
-            for r in retrieved_docs
+            for r in packed.docs
         ]
+        prompt = PROMPT.format(context=packed.text, question=question)
+        context_metrics.record(count_tokens(prompt), packed)
+        return prompt, sources
 
-        llm_input = {
-            "context": context,
-            "question": question
-        }
+    def data_version(self, dbs=None):
+        """Identifies the data an answer was produced from; any write to a user DB changes it."""
+        return tuple((db.folder_path, db.version) for db in (dbs if dbs is not None else self.user_dbs()))
+
+    def _cache_lookup(self, question):
+        """Return (cache key, cached result or None) for the semantic answer cache."""
+        if not semantic_cache.enabled:
+            return None, None
+        key = (shared_embeddings.embed_query(question), self.data_version())
+        return key, semantic_cache.get((self.company_name, self.uid, self.field), *key)
 
-        prompt_str = PROMPT.format(**llm_input)
-        result = llm.invoke(prompt_str)
+    def _cache_store(self, key, result, started):
+        if key is not None and result["sources"]:
+            semantic_cache.set((self.company_name, self.uid, self.field), *key, result, time.perf_counter() - started)
 
-        if isinstance(result, str):
-            answer = result
-        elif hasattr(result, "content"):
-            answer = result.content
-        else:
-            answer = ""
-        answer = clean_answer(answer)
+    def _prepare(self, question):
+        retrieved_docs = self.retrieve(question, top_k=RAG_CONTEXT_CANDIDATES)
+        if not retrieved_docs:
+            return None, []
+        return self.build_prompt(question, retrieved_docs)
+
+    def __call__(self, question):
+        cache_key, cached = self._cache_lookup(question)
+        if cached is not None:
+            return cached
+        started = time.perf_counter()
+        prompt_str, sources = self._prepare(question)
+        if prompt_str is None:
+            return {"answer": NO_DATA_ANSWER, "sources": []}
+        answer = clean_answer(_message_text(get_llm().invoke(prompt_str)))
+        result = {
+            "answer": answer,
+            "sources": sources
+        }
+        self._cache_store(cache_key, result, started)
+        return result
 
-        return {
+    async def acall(self, question):
+        """Async __call__: retrieval runs on the RAG executor, the LLM call awaits on the event loop."""
+        cache_key, cached = await run_in_rag_executor(self._cache_lookup, question)
+        if cached is not None:
+            return cached
+        started = time.perf_counter()
+        prompt_str, sources = await run_in_rag_executor(self._prepare, question)
+        if prompt_str is None:
+            return {"answer": NO_DATA_ANSWER, "sources": []}
+        answer = clean_answer(_message_text(await get_async_llm().ainvoke(prompt_str)))
+        result = {
             "answer": answer,
             "sources": sources
         }
+        self._cache_store(cache_key, result, started)
+        return result
 
-    return answer_question
\ No newline at end of file
+    async def astream(self, question):
+        """
+        Yield (event, data) pairs: ("sources", [...]) once retrieval is done,
+        ("token", {"text": ...}) for each LLM delta as it arrives, and finally
+        ("done", {"answer": ...}) with the cleaned full answer.
+        A semantic cache hit is sent as a single token.
+        """
+        cache_key, cached = await run_in_rag_executor(self._cache_lookup, question)
+        if cached is not None:
+            for event in _cached_events(cached):
+                yield event
+            return
+        started = time.perf_counter()
+        prompt_str, sources = await run_in_rag_executor(self._prepare, question)
+        if prompt_str is None:
+            yield "sources", []
+            yield "done", {"answer": NO_DATA_ANSWER}
+            return
+        yield "sources", sources
+        parts = []
+        async for chunk in get_async_llm().astream(prompt_str):
+            text = _message_text(chunk)
+            if text:
+                parts.append(text)
+                yield "token", {"text": text}
+        answer = clean_answer("".join(parts))
+        self._cache_store(cache_key, {"answer": answer, "sources": sources}, started)
+        yield "done", {"answer": answer}
@@ -0,0 +1,289 @@
+"""
+On-disk layout of a UserRAGVectorDB folder:
+
+    manifest.json              {"generation": G, "snapshot": "snapshot-G", "index_type": T,
+                                "next_id": I, "embed_model": M}
+    snapshot-G/index.faiss     compacted FAISS index (type T, see index_types) covering every segment < G
+    snapshot-G/keywords.json   BM25 inverted index over the same chunks (ids below I)
+    segment-N.vec              append-only vector batches for generation N >= G
+    meta.sqlite3               chunk metadata keyed by vector id (see meta_store)
+
+M is the embedding model every vector in the folder came from.
+
+Older folders may still hold snapshot-G/meta.json and segment-N.jsonl; their
+metadata is imported into meta.sqlite3 on first load and the files go away
+with the next compaction.
+
+Appends only ever touch the current segment files. Compaction writes a new
+snapshot directory, then atomically swaps manifest.json to point at it, then
+deletes what the new snapshot covers, so a crash at any step leaves either the
+old or the new state readable.
+
+Processes sharing a folder take FolderLock (folder.lock) around loads, appends
+and the manifest swap with its cleanup, so none of them reads a half-switched
+folder or appends to a segment that is about to be deleted.
+"""
+import os
+import json
+import shutil
+import struct
+import threading
+import numpy as np
+import faiss
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "folder.lock"
+SEGMENT_MAGIC = b"RSEG"
+SEGMENT_HEADER = struct.Struct("<4sII")  # magic, vector count, dimension
+
+
+def _fsync_dir(path):
+    # Directory fsync makes renames durable on POSIX; not available on Windows.
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _fsync_file(path):
+    with open(path, "rb+") as f:
+        os.fsync(f.fileno())
+
+
+class FolderLock:
+    """
+    Exclusive lock on a DB folder, held across processes through an flock on
+    folder.lock and reentrant within the owning thread. The OS drops it when
+    its owner dies.
+    """
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, LOCK_FILE)
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.fd = None
+
+    def __enter__(self):
+        self.lock.acquire()
+        if self.depth == 0:
+            try:
+                self.fd = lock_file(self.path)
+            except BaseException:
+                self.lock.release()
+                raise
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if self.depth == 0:
+            os.close(self.fd)  # releases the flock
+            self.fd = None
+        self.lock.release()
+
+
+def lock_file(path):
+    """Open `path` and block until this fd holds an exclusive lock on it; closing the fd releases it."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK gives up after 10 seconds
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def atomic_write_json(path, obj, fsync=True):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if fsync:
+        _fsync_dir(os.path.dirname(path))
+
+
+def read_manifest(folder):
+    path = os.path.join(folder, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(folder, manifest, fsync=True):
+    atomic_write_json(os.path.join(folder, MANIFEST_FILE), manifest, fsync=fsync)
+
+
+def segment_paths(folder, generation):
+    base = os.path.join(folder, f"segment-{generation}")
+    return base + ".vec", base + ".jsonl"
+
+
+def list_segments(folder):
+    generations = set()
+    for name in os.listdir(folder):
+        if name.startswith("segment-") and (name.endswith(".vec") or name.endswith(".jsonl")):
+            number = name[len("segment-"):].rsplit(".", 1)[0]
+            if number.isdigit():
+                generations.add(int(number))
+    return sorted(generations)
+
+
+def append_segment(folder, generation, ids, vectors, fsync=True):
+    """Append one batch of vectors to a segment."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    ids = np.ascontiguousarray(ids, dtype="int64")
+    vec_path, _ = segment_paths(folder, generation)
+    header = SEGMENT_HEADER.pack(SEGMENT_MAGIC, len(ids), vectors.shape[1])
+    with open(vec_path, "ab") as f:
+        f.write(header + ids.tobytes() + vectors.tobytes())
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+
+
+def read_segment(folder, generation):
+    """
+    Read a segment's vectors back as (ids, vectors, torn).
+    A batch cut short by a crash is dropped and reported through `torn`, so the
+    caller can start a fresh segment instead of appending after garbage.
+    """
+    vec_path, _ = segment_paths(folder, generation)
+    id_parts, vector_parts = [], []
+    torn = False
+    if os.path.exists(vec_path):
+        with open(vec_path, "rb") as f:
+            data = f.read()
+        pos = 0
+        while pos < len(data):
+            if pos + SEGMENT_HEADER.size > len(data):
+                torn = True
+                break
+            magic, count, dim = SEGMENT_HEADER.unpack_from(data, pos)
+            body = pos + SEGMENT_HEADER.size
+            end = body + count * 8 + count * dim * 4
+            if magic != SEGMENT_MAGIC or end > len(data):
+                torn = True
+                break
+            id_parts.append(np.frombuffer(data, dtype="int64", count=count, offset=body))
+            vector_parts.append(
+                np.frombuffer(data, dtype="float32", count=count * dim, offset=body + count * 8).reshape(count, dim)
+            )
+            pos = end
+
+    ids = np.concatenate(id_parts) if id_parts else np.empty(0, dtype="int64")
+    vectors = np.concatenate(vector_parts) if vector_parts else np.empty((0, 0), dtype="float32")
+    return ids, vectors, torn
+
+
+def read_segment_entries(folder, generation):
+    """Metadata entries of a segment written before meta.sqlite3 existed; complete lines only."""
+    _, meta_path = segment_paths(folder, generation)
+    entries = []
+    if os.path.exists(meta_path):
+        with open(meta_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                entries.append(json.loads(line))
+    return entries
+
+
+def write_snapshot(folder, generation, index, keywords=None, fsync=True):
+    name = f"snapshot-{generation}"
+    final_path = os.path.join(folder, name)
+    tmp_path = final_path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    index_path = os.path.join(tmp_path, "index.faiss")
+    faiss.write_index(index, index_path)
+    if keywords is not None:
+        with open(os.path.join(tmp_path, "keywords.json"), "w", encoding="utf-8") as f:
+            json.dump(keywords, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+    if fsync:
+        _fsync_file(index_path)
+    shutil.rmtree(final_path, ignore_errors=True)
+    os.replace(tmp_path, final_path)
+    if fsync:
+        _fsync_dir(folder)
+    return name
+
+
+def snapshot_index_path(folder, name):
+    return os.path.join(folder, name, "index.faiss")
+
+
+def read_snapshot(folder, name, io_flags=0):
+    """
+    Return (index, keywords); keywords is None for snapshots written without one.
+    Pass FAISS io_flags (e.g. index_types.mmap_flag) to map the index instead of reading it.
+    """
+    path = os.path.join(folder, name)
+    index = faiss.read_index(snapshot_index_path(folder, name), io_flags)
+    keywords = None
+    keywords_path = os.path.join(path, "keywords.json")
+    if os.path.exists(keywords_path):
+        with open(keywords_path, "r", encoding="utf-8") as f:
+            keywords = json.load(f)
+    return index, keywords
+
+
+def read_snapshot_entries(folder, name):
+    """Metadata entries of a snapshot written before meta.sqlite3 existed."""
+    path = os.path.join(folder, name, "meta.json")
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def keywords_bytes(folder, manifest):
+    """On-disk size of the snapshot's keyword index, which a loaded DB keeps in memory."""
+    if not manifest or not manifest.get("snapshot"):
+        return 0
+    path = os.path.join(folder, manifest["snapshot"], "keywords.json")
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def remove_compacted(folder, manifest, legacy_paths=()):
+    """Delete segments, snapshots and legacy files superseded by `manifest`."""
+    for generation in list_segments(folder):
+        if generation < manifest["generation"]:
+            for path in segment_paths(folder, generation):
+                if os.path.exists(path):
+                    os.remove(path)
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if name.startswith("snapshot-") and name != manifest.get("snapshot"):
+            shutil.rmtree(path, ignore_errors=True)
+    for path in legacy_paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
@@ -1,32 +1,18 @@
-from rag_client import rag_db_manager
+from chatbot.rag_client import rag_db_manager
 
 def update_user_answer(company_name, uid, question_to_update, new_answer, field=None):
     # Load the user's vector DB
     user_db = rag_db_manager.get_user_db(company_name, uid, field)
-    if not user_db.meta or not user_db.meta[0]["json"].get("answers"):
-        print("No data found for this user.")
-        return False
-
-    # Get the user's current JSON data
-    user_data = user_db.meta[0]["json"]
-    answers = user_data.get("answers", {})
-    if question_to_update not in answers:
+    current = user_db.entries(uid=uid, question=question_to_update)
+    if not current:
         print(f"Question not found in user's answers: {question_to_update}")
         return False
+    print(f"Old answer: {current[-1]['chunk'].get('answer')}")
 
-    # Update the specific answer
-    print(f"Old answer: {answers[question_to_update]}")
-    answers[question_to_update] = new_answer
-    print(f"New answer: {answers[question_to_update]}")
-
-    # Save updated data and re-encode embedding
-    user_db.update_json(user_data)
-    print("Update complete.")
-
-    # (Optional) Show the new answers
-    print("\nUpdated Answers:")
-    for q, a in answers.items():
-        print(f"  Q: {q}\n  A: {a}")
+    # Replace the old Q/A chunk; only this one chunk is re-embedded
+    result = user_db.upsert(uid, None, question_to_update, new_answer)
+    print(f"New answer: {new_answer}")
+    print(f"Update complete ({result['deleted']} replaced, {result['added']} added).")
     return True
 
 def main():
@@ -46,4 +32,4 @@ def main():
         print("\nUser answer was NOT updated.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
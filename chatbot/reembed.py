@@ -0,0 +1,116 @@
+"""
+Re-embed every tenant DB under BASE_FAISS_DIR with another embedding model.
+
+    EMBED_MODEL=sentence-transformers/all-MiniLM-L6-v2 python manage.py reembed_tenants
+
+Chunk texts come from each folder's MetaStore; batches of REEMBED_BATCH_SIZE
+are embedded by a pool of worker processes (each with its own copy of the
+model), several tenants at a time. A folder's new index is written as a new
+snapshot beside the current one and swapped in by the manifest write, so an
+interrupted run leaves every DB readable; running again skips folders already
+on the target model. The server may keep running: a folder that any process
+writes to while its chunks are being embedded fails and is retried on the
+next run. Once a folder is swapped, a server still on the old model stops
+searching and writing its vectors until it runs with the new EMBED_MODEL.
+"""
+import os
+import time
+from collections import deque
+import multiprocessing
+import numpy as np
+from .embeddings import EMBED_MODEL, SharedEmbeddings
+from .rag_client import BASE_FAISS_DIR, folder_db
+
+REEMBED_WORKERS = int(os.getenv("REEMBED_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+REEMBED_BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", "512"))
+
+_worker_embeddings = None
+
+
+def _init_worker(model_name, threads):
+    global _worker_embeddings
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _worker_embeddings = SharedEmbeddings(model_name=model_name)
+
+
+def _embed_batch(texts):
+    return np.asarray(_worker_embeddings.embed_documents(texts), dtype="float32")
+
+
+def tenant_folders(base_dir=BASE_FAISS_DIR):
+    """Every <field>/<company>_<uid> folder that holds a DB."""
+    markers = ("manifest.json", "meta.sqlite3", "faiss_index")
+    for field in sorted(os.listdir(base_dir)):
+        field_path = os.path.join(base_dir, field)
+        if not os.path.isdir(field_path):
+            continue
+        for tenant in sorted(os.listdir(field_path)):
+            path = os.path.join(field_path, tenant)
+            if os.path.isdir(path) and any(os.path.exists(os.path.join(path, m)) for m in markers):
+                yield path
+
+
+def reembed_all(model_name=EMBED_MODEL, base_dir=BASE_FAISS_DIR, workers=REEMBED_WORKERS,
+                batch_size=REEMBED_BATCH_SIZE, force=False, log=print):
+    """Re-embed every tenant folder not yet on `model_name`; returns counts and throughput."""
+    embeddings = SharedEmbeddings(model_name=model_name)  # only its name is used here
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    stats = {"folders": 0, "chunks": 0, "skipped": 0, "failed": 0}
+    pending = deque()  # (db, next_id, ids, batch results, started), oldest first
+    in_flight = 0
+    started = time.perf_counter()
+
+    def finish(item):
+        db, next_id, ids, results, folder_started = item
+        try:
+            vectors = np.concatenate([r.get() for r in results]) if results else np.empty((0, 0), "float32")
+            db.replace_embeddings(next_id, ids, vectors, model_name)
+        except Exception as e:
+            stats["failed"] += 1
+            log(f"{os.path.relpath(db.folder_path, base_dir)}: failed: {e}")
+        else:
+            stats["folders"] += 1
+            stats["chunks"] += len(ids)
+            seconds = time.perf_counter() - folder_started
+            log(f"{os.path.relpath(db.folder_path, base_dir)}: {len(ids)} chunks in {seconds:.1f}s")
+        db.unload()
+        return len(results)
+
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers, initializer=_init_worker, initargs=(model_name, threads)) as pool:
+        for folder in tenant_folders(base_dir):
+            db = folder_db(folder, embeddings)
+            try:
+                db.ensure_loaded()
+                if db.embed_model is None or (db.embed_model == model_name and not force):
+                    stats["skipped"] += 1
+                    db.unload()
+                    continue
+                next_id, ids, texts = db.live_chunks()
+            except Exception as e:
+                stats["failed"] += 1
+                log(f"{os.path.relpath(folder, base_dir)}: failed: {e}")
+                continue
+            results = [
+                pool.apply_async(_embed_batch, (texts[i:i + batch_size],)) for i in range(0, len(texts), batch_size)
+            ]
+            pending.append((db, next_id, ids, results, time.perf_counter()))
+            in_flight += len(results)
+            # Keep the pool busy without holding every tenant's texts at once.
+            while pending and in_flight > workers * 4:
+                in_flight -= finish(pending.popleft())
+        while pending:
+            finish(pending.popleft())
+
+    seconds = time.perf_counter() - started
+    stats["seconds"] = round(seconds, 1)
+    stats["chunks_per_second"] = round(stats["chunks"] / seconds, 1) if seconds else 0.0
+    log(
+        f"Re-embedded {stats['chunks']} chunks in {stats['folders']} folders with {model_name} in {seconds:.1f}s "
+        f"({stats['chunks_per_second']} chunks/s); {stats['skipped']} skipped, {stats['failed']} failed"
+    )
+    return stats
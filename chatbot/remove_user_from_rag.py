@@ -1,41 +1,37 @@
-import os
-import faiss
-import numpy as np
-import json
-from sentence_transformers import SentenceTransformer
-
-DB_PATH = os.path.join(os.path.dirname(__file__), "faiss_index.bin")
-META_PATH = os.path.join(os.path.dirname(__file__), "faiss_meta.json")
-EMBED_MODEL = "all-MiniLM-L6-v2"  # or whatever you use
-
-uid_to_delete = "d7e6b28f-3bfa-480a-b8a7-96b50ed5adc9"  # <-- change to your target UID
-
-# 1. Load metadata
-with open(META_PATH, "r") as f:
-    meta = json.load(f)
-
-# 2. Filter out the entry to delete
-new_meta = [entry for entry in meta if entry["uid"] != uid_to_delete]
-deleted = len(meta) - len(new_meta)
-if not deleted:
-    print(f"UID {uid_to_delete} not found in FAISS meta.")
-else:
-    print(f"Deleted {deleted} entry with UID {uid_to_delete}")
-
-# 3. Recompute embeddings for remaining entries
-model = SentenceTransformer(EMBED_MODEL)
-all_jsons = [entry["json"] for entry in new_meta]
-doc_strs = [json.dumps(j, ensure_ascii=False) for j in all_jsons]
-if doc_strs:
-    embeddings = model.encode(doc_strs)
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(np.array(embeddings).astype("float32"))
-else:
-    index = faiss.IndexFlatL2(384)  # Empty index
-
-# 4. Save new index and metadata
-faiss.write_index(index, DB_PATH)
-with open(META_PATH, "w") as f:
-    json.dump(new_meta, f, indent=2)
-
-print("Rebuilt and saved new FAISS index and metadata.")
\ No newline at end of file
+"""
+Delete every chunk stored for a user from all of their RAG DBs.
+
+    python -m chatbot.remove_user_from_rag <company_name> <uid>
+
+Chunks are tombstoned right away and their vectors are dropped by the next
+compaction, which this script runs so the removal is on disk when it exits.
+"""
+import sys
+from chatbot.rag_client import rag_db_manager
+
+
+def remove_user(company_name, uid):
+    deleted = 0
+    for db in rag_db_manager.get_all_user_dbs(company_name, uid):
+        count = db.delete(uid=uid)
+        if count:
+            db.compact()
+            print(f"Deleted {count} chunks from {db.folder_path}")
+        deleted += count
+    return deleted
+
+
+def main():
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+    company_name, uid = sys.argv[1:]
+    deleted = remove_user(company_name, uid)
+    if not deleted:
+        print(f"UID {uid} not found in any RAG DB for {company_name}.")
+    else:
+        print(f"Deleted {deleted} chunks for UID {uid}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from .cache import TTLCache, normalize_query
+
+RAG_SEARCH_WORKERS = int(os.getenv("RAG_SEARCH_WORKERS", "8"))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "4096"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))
+
+# FAISS releases the GIL while searching, so per-DB searches overlap in threads.
+_search_executor = ThreadPoolExecutor(max_workers=RAG_SEARCH_WORKERS, thread_name_prefix="rag-search")
+# Keyed by each DB's write version, so any add_records makes older entries unreachable.
+retrieval_cache = TTLCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
+
+
+def reciprocal_rank_fusion(ranked_lists, top_k, k=RAG_RRF_K):
+    """
+    Merge ranked result lists into one, deduplicated by content.
+    Each result scores sum(1 / (k + rank)) over the lists it appears in.
+    """
+    fused = {}
+    for results in ranked_lists:
+        for rank, result in enumerate(results, start=1):
+            key = result.get("content", "")
+            if key not in fused:
+                fused[key] = dict(result, score=0.0)
+            else:
+                fused[key].update({name: value for name, value in result.items() if name not in fused[key]})
+            fused[key]["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda r: r["score"], reverse=True)[:top_k]
+
+
+def hybrid_retrieve(dbs, query, top_k=3):
+    """
+    Vector + BM25 retrieval across several user DBs.
+    The query is embedded once and every DB is searched concurrently; vector
+    hits are ranked by distance and keyword hits by BM25 across all DBs, then
+    the two rankings are merged with reciprocal rank fusion.
+    """
+    dbs = [db for db in dbs if db.has_vectors()]
+    if not dbs or top_k < 1:
+        return []
+    cache_key = (tuple((db.folder_path, db.version) for db in dbs), normalize_query(query), top_k)
+    cached = retrieval_cache.get(cache_key)
+    if cached is not None:
+        return [dict(r) for r in cached]
+    fetch_k = top_k * 2
+    vector = dbs[0].embeddings.embed_query(query)
+    futures = [
+        (_search_executor.submit(db.search_by_vector, vector, fetch_k), _search_executor.submit(db.keyword_search, query, fetch_k))
+        for db in dbs
+    ]
+    vector_hits = []
+    keyword_hits = []
+    for db, (vector_future, keyword_future) in zip(dbs, futures):
+        # Chunk ids and file chunk indexes are per DB; the context builder keys on the folder too.
+        vector_hits.extend(dict(r, folder_path=db.folder_path) for r in vector_future.result())
+        keyword_hits.extend(dict(r, folder_path=db.folder_path) for r in keyword_future.result())
+    vector_hits.sort(key=lambda r: r["distance"])
+    keyword_hits.sort(key=lambda r: r["keyword_score"], reverse=True)
+    results = reciprocal_rank_fusion([keyword_hits[:fetch_k], vector_hits[:fetch_k]], top_k)
+    retrieval_cache.set(cache_key, results)
+    return [dict(r) for r in results]
@@ -0,0 +1,111 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_PER_TENANT = int(os.getenv("SEMANTIC_CACHE_PER_TENANT", "256"))
+SEMANTIC_CACHE_MAX_TENANTS = int(os.getenv("SEMANTIC_CACHE_MAX_TENANTS", "1024"))
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype="float32")
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """
+    Per-tenant cache of LLM answers keyed by question embedding.
+    A lookup hits when a stored question is within `threshold` cosine
+    similarity of the new one and was answered from the same data version
+    (the tenant's DB versions), so new uploads never serve stale answers.
+    """
+
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, ttl=SEMANTIC_CACHE_TTL,
+                 per_tenant=SEMANTIC_CACHE_PER_TENANT, max_tenants=SEMANTIC_CACHE_MAX_TENANTS):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.per_tenant = per_tenant
+        self.max_tenants = max_tenants
+        self.tenants = OrderedDict()  # tenant -> OrderedDict(entry id -> entry)
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+    @property
+    def enabled(self):
+        return self.per_tenant > 0 and self.max_tenants > 0
+
+    def get(self, tenant, vector, version):
+        """Return the cached result for the closest matching question, or None."""
+        if not self.enabled:
+            return None
+        vector = _unit(vector)
+        now = time.monotonic()
+        with self.lock:
+            entries = self.tenants.get(tenant)
+            if entries:
+                for entry_id in [i for i, e in entries.items() if e["expires_at"] <= now or e["version"] != version]:
+                    del entries[entry_id]
+            if not entries:
+                self.misses += 1
+                return None
+            self.tenants.move_to_end(tenant)
+            ids = list(entries)
+            similarities = np.stack([entries[i]["vector"] for i in ids]) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            entry = entries[ids[best]]
+            entries.move_to_end(ids[best])
+            self.hits += 1
+            self.latency_saved += entry["latency"]
+            return entry["result"]
+
+    def set(self, tenant, vector, version, result, latency):
+        """Store a result; `latency` is what producing it cost, counted as saved on each hit."""
+        if not self.enabled:
+            return
+        with self.lock:
+            entries = self.tenants.setdefault(tenant, OrderedDict())
+            self.tenants.move_to_end(tenant)
+            self.next_id += 1
+            entries[self.next_id] = {
+                "vector": _unit(vector),
+                "version": version,
+                "expires_at": time.monotonic() + self.ttl,
+                "result": result,
+                "latency": latency,
+            }
+            while len(entries) > self.per_tenant:
+                entries.popitem(last=False)
+            while len(self.tenants) > self.max_tenants:
+                self.tenants.popitem(last=False)
+
+    def clear(self, tenant=None):
+        with self.lock:
+            if tenant is None:
+                self.tenants.clear()
+            else:
+                self.tenants.pop(tenant, None)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "tenants": len(self.tenants),
+                "entries": sum(len(entries) for entries in self.tenants.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "latency_saved_seconds": round(self.latency_saved, 3),
+            }
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,71 @@
+"""
+Session engine that keeps conversation state in the "sessions" cache and
+writes it to the database only at checkpoints (SESSION_BACKEND=checkpoint).
+
+Every chat turn updates the session; with the database engine that is a
+SQLite write per request, and SQLite serializes writers. Here a save goes to
+the cache, and the database copy is refreshed only when:
+
+    - the session is created (or its key cycled),
+    - an onboarding milestone changes (SESSION_CHECKPOINT_KEYS),
+    - SESSION_CHECKPOINT_EVERY saves or SESSION_CHECKPOINT_SECONDS have
+      passed since the last checkpoint, or
+    - a view asks for one with checkpoint(request.session).
+
+If the cache loses a session (eviction, restart, or another worker with its
+own in-process cache) it is reloaded from the last checkpoint. Use a shared
+cache (SESSION_CACHE_LOCATION=redis://...) when running several workers.
+"""
+import os
+import time
+import hashlib
+import json
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+SESSION_CHECKPOINT_KEYS = [
+    k.strip() for k in os.getenv(
+        "SESSION_CHECKPOINT_KEYS",
+        "uid,company_name,field,contact,email,llm_data_active,dual_agents_prompt,dual_agents_ready",
+    ).split(",") if k.strip()
+]
+SESSION_CHECKPOINT_EVERY = int(os.getenv("SESSION_CHECKPOINT_EVERY", "20"))  # saves; 0 = no limit
+SESSION_CHECKPOINT_SECONDS = float(os.getenv("SESSION_CHECKPOINT_SECONDS", "300"))  # 0 = no limit
+
+CHECKPOINT_KEY = "_checkpoint"  # {"at": epoch seconds, "saves": cache-only saves since, "digest": milestones}
+
+
+def checkpoint(session):
+    """Persist `session` to the database on its next save (no-op for other engines)."""
+    session.checkpoint_requested = True
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = "chatbot.session_backend"
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self.checkpoint_requested = False
+
+    def _milestones(self, session):
+        values = [session.get(key) for key in SESSION_CHECKPOINT_KEYS]
+        return hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _checkpoint_due(self, session, state):
+        return (
+            self.checkpoint_requested
+            or not state
+            or state.get("digest") != self._milestones(session)
+            or (SESSION_CHECKPOINT_EVERY and state.get("saves", 0) + 1 >= SESSION_CHECKPOINT_EVERY)
+            or (SESSION_CHECKPOINT_SECONDS and time.time() - state.get("at", 0) >= SESSION_CHECKPOINT_SECONDS)
+        )
+
+    def save(self, must_create=False):
+        session = self._get_session(no_load=must_create)
+        state = session.get(CHECKPOINT_KEY)
+        if self.session_key is None or must_create or self._checkpoint_due(session, state):
+            session[CHECKPOINT_KEY] = {"at": int(time.time()), "saves": 0, "digest": self._milestones(session)}
+            super().save(must_create)
+            self.checkpoint_requested = False
+            return
+        state["saves"] = state.get("saves", 0) + 1
+        self._cache.set(self.cache_key, session, self.get_expiry_age())
@@ -1,3 +1,554 @@
-from django.test import TestCase
+import os
+import shutil
+import sqlite3
+import asyncio
+import hashlib
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipIf
+import numpy as np
+from django.test import RequestFactory, SimpleTestCase
 
-# Create your tests here.
+from . import index_types, ingest, rag_pipeline, rag_storage, views
+from .retrieval import hybrid_retrieve, reciprocal_rank_fusion
+from .context_builder import build_context
+from .embeddings import SharedEmbeddings
+from .keyword_index import KeywordIndex
+from .profile_writes import WriteBehindBuffer, WriteJournal, _lock_owner
+from .semantic_cache import SemanticCache
+from .rag_client import (
+    RAG_SHARED_COMPACT_EVERY, RAG_SHARED_INDEX_TYPE, SHARED_FOLDER, UserRAGDBManager, UserRAGVectorDB, folder_db,
+)
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+DIM = 8
+
+
+class FakeEmbeddings:
+    """Deterministic vectors per text, so tests don't load a model."""
+
+    model_name = "test-model"
+
+    def __init__(self, dim=DIM, model_name=None):
+        self.dim = dim
+        if model_name:
+            self.model_name = model_name
+
+    def embed_query(self, text):
+        seed = int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).standard_normal(self.dim).astype("float32").tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def record(text, uid="u1"):
+    return {"uid": uid, "meta": {"name": "Acme"}, "chunk": {"chunk_type": "file_chunk", "content": text}}
+
+
+class RAGDBTestCase(SimpleTestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="ragdb_test_")
+        self.embeddings = FakeEmbeddings()
+        self.dbs = []
+
+    def tearDown(self):
+        for db in self.dbs:
+            db.unload()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def open_db(self, **kwargs):
+        db = UserRAGVectorDB(self.folder, self.embeddings, **kwargs)
+        self.dbs.append(db)
+        return db
+
+    def restart(self, db):
+        db.unload()
+        db = self.open_db()
+        db.ensure_loaded()
+        return db
+
+    def contents(self, results):
+        return [result["content"] for result in results]
+
+
+class SegmentTests(RAGDBTestCase):
+    def test_appends_survive_restart(self):
+        db = self.open_db()
+        self.assertEqual(db.add_records([record("apple"), record("cherry")])["added"], 2)
+        db = self.restart(db)
+        self.assertEqual(db.index.ntotal, 2)
+        self.assertEqual(self.contents(db.search("apple", top_k=1)), ["apple"])
+        self.assertEqual(db.add_records([record("apple")]), {"added": 0, "skipped": 1})
+
+    def test_compaction_keeps_ids(self):
+        db = self.open_db()
+        db.add_records([record("apple"), record("cherry")])
+        ids = {r["content"]: r["chunk_global_index"] for r in db.search("apple", top_k=2)}
+        db.compact()
+        db = self.restart(db)
+        self.assertEqual(rag_storage.list_segments(self.folder), [])
+        self.assertEqual({r["content"]: r["chunk_global_index"] for r in db.search("apple", top_k=2)}, ids)
+
+
+class TombstoneTests(RAGDBTestCase):
+    def test_deleted_chunks_are_not_returned(self):
+        db = self.open_db()
+        db.add_records([record("apple"), record("cherry")])
+        apple = db.search("apple", top_k=1)[0]["chunk_global_index"]
+        self.assertEqual(db.delete([apple]), 1)
+        self.assertNotIn("apple", self.contents(db.search("apple", top_k=2)))
+        self.assertEqual(db.keyword_search("apple"), [])
+        db = self.restart(db)
+        self.assertNotIn("apple", self.contents(db.search("apple", top_k=2)))
+        db.compact()
+        self.assertEqual(db.index.ntotal, 1)
+        self.assertEqual(db.tombstones, set())
+
+
+class CrashRecoveryTests(RAGDBTestCase):
+    def tear_write(self, db, text):
+        """A crash after the vectors reached the segment but before their MetaStore rows committed."""
+        ids = np.arange(db.next_id, db.next_id + 1, dtype="int64")
+        vectors = np.asarray([self.embeddings.embed_query(text)], dtype="float32")
+        rag_storage.append_segment(self.folder, db.generation, ids, vectors)
+        return int(ids[0])
+
+    def test_torn_vectors_are_dropped(self):
+        db = self.open_db()
+        db.add_records([record("apple"), record("cherry")])
+        self.tear_write(db, "stale")
+        db = self.restart(db)
+        self.assertEqual(db.index.ntotal, 2)
+        self.assertNotIn("stale", self.contents(db.search("stale", top_k=2)))
+
+    def test_torn_ids_are_not_reused(self):
+        db = self.open_db()
+        db.add_records([record("apple"), record("cherry")])
+        torn_id = self.tear_write(db, "stale")
+        db = self.restart(db)
+        db.add_records([record("banana")])
+        banana = db.search("banana", top_k=1)[0]["chunk_global_index"]
+        self.assertGreater(banana, torn_id)
+        for _ in range(2):
+            db = self.restart(db)
+            self.assertEqual(db.index.ntotal, 3)
+            self.assertGreater(db.next_id, banana)
+            stale = self.embeddings.embed_query("stale")
+            for result in db.search_by_vector(stale, top_k=3):
+                self.assertGreater(result["distance"], 0.0)
+            self.assertEqual(self.contents(db.search("banana", top_k=1)), ["banana"])
+
+
+class EmbeddingModelTests(RAGDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.embeddings = FakeEmbeddings(dim=16, model_name="model-a")
+        db = self.open_db()
+        db.add_records([record("apple"), record("cherry")])
+        db.unload()
+
+    def test_other_model_can_not_write_or_search(self):
+        self.embeddings = FakeEmbeddings(dim=8, model_name="model-b")
+        db = self.open_db()
+        with self.assertRaises(RuntimeError):
+            db.add_records([record("banana")])
+        with self.assertRaises(RuntimeError):
+            db.upsert("u1", None, "Q?", "A")
+        self.assertEqual(db.search("apple"), [])
+        self.assertEqual(self.contents(db.keyword_search("apple")), ["apple"])
+        db = self.restart(db)
+        self.assertEqual(db.index.ntotal, 2)
+
+    def test_vectors_of_another_size_are_refused(self):
+        self.embeddings = FakeEmbeddings(dim=8, model_name="model-a")
+        db = self.open_db()
+        with self.assertRaises(ValueError):
+            db.add_records([record("banana")])
+        db = self.restart(db)
+        self.assertEqual(db.index.ntotal, 2)
+        self.assertEqual(len(db.entries()), 2)
+
+
+class FolderDBTests(RAGDBTestCase):
+    def test_shared_folders_keep_their_index_settings(self):
+        shared = folder_db(os.path.join(self.folder, SHARED_FOLDER), self.embeddings)
+        self.assertEqual(shared.index_kind, RAG_SHARED_INDEX_TYPE)
+        self.assertEqual(shared.compact_every, RAG_SHARED_COMPACT_EVERY)
+        self.assertIsNone(folder_db(self.folder, self.embeddings).index_kind)
+
+
+class ConcurrentWriterTests(RAGDBTestCase):
+    def test_writers_on_one_folder_get_distinct_ids(self):
+        first, second = self.open_db(), self.open_db()
+        first.ensure_loaded()
+        second.ensure_loaded()
+        first.add_records([record("apple")])
+        second.add_records([record("banana")])
+        self.assertEqual(second.index.ntotal, 2)
+        self.assertEqual(self.contents(second.search("apple", top_k=1)), ["apple"])
+        db = self.restart(first)
+        self.assertEqual(db.index.ntotal, 2)
+        for text in ("apple", "banana"):
+            self.assertEqual(self.contents(db.search(text, top_k=1)), [text])
+
+    def test_compaction_keeps_chunks_another_writer_appends_meanwhile(self):
+        first, second = self.open_db(index_kind="hnsw"), self.open_db(index_kind="hnsw")
+        first.add_records([record("apple"), record("durian")])
+        second.add_records([record("banana")])
+        # HNSW can't drop vectors in place, so compaction rebuilds the index.
+        first.delete([first.search("durian", top_k=1)[0]["chunk_global_index"]])
+        build_index = index_types.build_index
+
+        def build_while_second_writes(*args):
+            second.add_records([record("cherry")])
+            return build_index(*args)
+
+        with mock.patch.object(index_types, "build_index", side_effect=build_while_second_writes):
+            first.compact()
+        db = self.restart(first)
+        self.assertEqual(db.index.ntotal, 3)
+        for text in ("apple", "banana", "cherry"):
+            self.assertEqual(self.contents(db.search(text, top_k=1)), [text])
+
+    def test_reembedding_fails_when_another_writer_appends_meanwhile(self):
+        reembedder, server = self.open_db(), self.open_db()
+        server.add_records([record("apple")])
+        next_id, ids, texts = reembedder.live_chunks()
+        server.add_records([record("banana")])
+        other = FakeEmbeddings(model_name="model-b")
+        with self.assertRaises(RuntimeError):
+            reembedder.replace_embeddings(next_id, ids, other.embed_documents(texts), other.model_name)
+        db = self.restart(server)
+        self.assertEqual(db.embed_model, self.embeddings.model_name)
+        self.assertEqual(db.index.ntotal, 2)
+
+    def test_an_id_can_not_be_stored_twice(self):
+        db = self.open_db()
+        db.add_records([record("apple")])
+        (entry,) = db.entries()
+        with self.assertRaises(sqlite3.IntegrityError):
+            db.store.add([0], [dict(entry, hash="other")])
+        self.assertEqual(self.contents(db.search("apple", top_k=1)), ["apple"])
+
+
+class ManagerTests(RAGDBTestCase):
+    def open_manager(self):
+        return UserRAGDBManager(base_dir=self.folder, embeddings=self.embeddings, shared_fields=False)
+
+    def test_workers_see_each_others_writes(self):
+        first, second = self.open_manager(), self.open_manager()
+        first.get_user_db("Acme", "u1").add_records([record("apple")])
+        db = second.get_user_db("Acme", "u1")
+        self.assertEqual(self.contents(db.search("apple", top_k=1)), ["apple"])
+        version = db.version
+        first.get_user_db("Acme", "u1").add_records([record("banana")])
+        db = second.get_user_db("Acme", "u1")
+        self.assertGreater(db.version, version)
+        self.assertEqual(self.contents(db.search("banana", top_k=1)), ["banana"])
+        self.assertEqual(len(second.get_all_user_dbs("Acme", "u1")), 1)
+        first.get_user_db("Acme", "u1", field="sales").add_records([record("cherry")])
+        self.assertEqual(len(second.get_all_user_dbs("Acme", "u1")), 2)
+        self.dbs.extend(first.cache.values())
+        self.dbs.extend(second.cache.values())
+
+
+class IngestQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp(prefix="ingest_test_")
+        self.queue = ingest.IngestQueue(base_dir=self.base_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.base_dir, ignore_errors=True)
+
+    def add_job(self, status, updated_at):
+        with self.queue._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, file_name, created_at, updated_at) VALUES (?, ?, 'a.pdf', ?, ?)",
+                (status, status, updated_at, updated_at),
+            )
+
+    def test_interrupted_jobs_are_claimed_again(self):
+        now = time.time()
+        self.add_job("parsing", now - ingest.INGEST_STALE_SECONDS - 1)
+        self.add_job("embedding", now)
+        self.assertEqual(self.queue._claim()["id"], "parsing")
+        self.assertIsNone(self.queue._claim())
+        self.assertEqual(self.queue.get("embedding")["status"], "embedding")
+
+    def test_running_jobs_heartbeat(self):
+        self.add_job("parsing", 0)
+        self.queue.pool = ThreadPoolExecutor(1)
+        self.addCleanup(self.queue.pool.shutdown)
+        with mock.patch.object(ingest, "INGEST_HEARTBEAT_SECONDS", 0.01):
+            self.assertEqual(self.queue._run_in_pool("parsing", lambda: time.sleep(0.1) or 7), 7)
+        self.assertGreater(self.queue.get("parsing")["updated_at"], time.time() - 1)
+
+    def test_one_process_dispatches(self):
+        other = ingest.IngestQueue(base_dir=self.base_dir)
+        with mock.patch.object(ingest.IngestQueue, "_new_pool"), mock.patch.object(ingest.IngestQueue, "_dispatch"):
+            self.queue._elect()
+            waiting = threading.Thread(target=other._elect)
+            waiting.start()
+            waiting.join(0.2)
+            self.assertIsNone(other.pool)
+            os.close(self.queue.dispatch_lock)  # the dispatching process exits
+            waiting.join(5)
+        self.assertIsNotNone(other.pool)
+        os.close(other.dispatch_lock)
+
+
+@skipIf(mongomock is None, "mongomock is not installed")
+class WriteBehindBufferTests(SimpleTestCase):
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp(prefix="profile_writes_test_")
+        self.journal_path = os.path.join(self.journal_dir, "profile_writes.sqlite3")
+        self.collection = mongomock.MongoClient().db.UserDetails
+        self.down = False
+        self.buffers = []
+
+    def tearDown(self):
+        for buffer in self.buffers:
+            buffer.close()
+        shutil.rmtree(self.journal_dir, ignore_errors=True)
+
+    def get_collection(self):
+        if self.down:
+            raise ConnectionError("mongo is down")
+        return self.collection
+
+    def new_buffer(self, mode="journaled"):
+        # A long interval so only the test's own flush() calls write.
+        buffer = WriteBehindBuffer(self.get_collection, mode=mode, flush_interval=3600, journal_path=self.journal_path)
+        self.buffers.append(buffer)
+        return buffer
+
+    def profile(self, uid):
+        return self.collection.find_one({"uid": uid}, {"_id": 0})
+
+    def crash(self, buffer):
+        """Stop `buffer` the way a killed process would: nothing flushed, journal left behind."""
+        buffer.closed = True
+        buffer.wake.set()
+        buffer.journal.close()
+        os.close(buffer.journal_lock)
+        self.buffers.remove(buffer)
+
+    def test_writes_to_a_profile_are_coalesced(self):
+        buffer = self.new_buffer("buffered")
+        buffer.set("u1", {"uid": "u1", "name": "Acme"}, upsert=True)
+        buffer.set("u1", {"contact": "0700"})
+        buffer.set("u1", {"contact": "0711"})
+        buffer.set("u2", {"uid": "u2", "name": "Other"}, upsert=True)
+        self.assertIsNone(self.profile("u1"))
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.stats()["flushes"], 1)
+        self.assertEqual(buffer.stats()["operations"], 2)
+        self.assertEqual(self.profile("u1"), {"uid": "u1", "name": "Acme", "contact": "0711"})
+        self.assertEqual(self.profile("u2"), {"uid": "u2", "name": "Other"})
+
+    def test_failed_flush_is_retried_under_newer_values(self):
+        buffer = self.new_buffer("buffered")
+        buffer.set("u1", {"uid": "u1", "name": "Acme", "email": "old@example.com"}, upsert=True)
+        self.down = True
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.stats()["errors"], 1)
+        buffer.set("u1", {"email": "new@example.com"})
+        self.down = False
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(self.profile("u1"), {"uid": "u1", "name": "Acme", "email": "new@example.com"})
+        self.assertEqual(buffer.stats()["pending"], 0)
+
+    def test_failures_back_off_and_are_logged_once(self):
+        buffer = WriteBehindBuffer(self.get_collection, mode="buffered", flush_interval=3600, max_backoff=20000)
+        self.buffers.append(buffer)
+        buffer.set("u1", {"uid": "u1", "name": "Acme"}, upsert=True)
+        self.down = True
+        delays = []
+        with mock.patch("builtins.print") as log:
+            for _ in range(4):
+                buffer.flush()
+                delays.append(buffer._retry_delay())
+            self.assertEqual(log.call_count, 1)
+            self.down = False
+            self.assertEqual(buffer.flush(), 1)
+            self.assertEqual(log.call_count, 2)
+        self.assertEqual(delays, [7200, 14400, 20000, 20000])
+        self.assertEqual(buffer._retry_delay(), 3600)
+
+    def test_journal_of_a_dead_process_is_replayed(self):
+        self.down = True
+        buffer = self.new_buffer()
+        buffer.set("u1", {"uid": "u1", "name": "Acme"}, upsert=True)
+        buffer.set("u1", {"field": "tourism"})
+        self.crash(buffer)
+        # The crashed process had another pid.
+        os.rename(buffer.journal.path, f"{self.journal_path}.1")
+        self.down = False
+        survivor = self.new_buffer()
+        survivor.start()
+        self.assertEqual(survivor.stats()["pending"], 1)
+        self.assertFalse(os.path.exists(f"{self.journal_path}.1"))
+        self.assertEqual(survivor.flush(), 1)
+        self.assertEqual(self.profile("u1"), {"uid": "u1", "name": "Acme", "field": "tourism"})
+        survivor.close()
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_journal_of_a_live_process_is_left_alone(self):
+        live_path = f"{self.journal_path}.1"
+        live = WriteJournal(live_path)
+        live.append("u1", {"name": "Acme"}, True)
+        lock = _lock_owner(live_path)  # held as the live process would
+        self.addCleanup(os.close, lock)
+        self.addCleanup(live.close)
+        buffer = self.new_buffer()
+        buffer.start()
+        self.assertEqual(buffer.stats()["pending"], 0)
+        self.assertEqual(len(live.pending()), 1)
+
+
+class QueryEmbeddingCacheTests(SimpleTestCase):
+    def test_query_is_embedded_as_typed(self):
+        embeddings = SharedEmbeddings(model_name="test-model")
+        model = embeddings._model = mock.Mock()
+        model.embed_query.return_value = [0.5]
+        self.assertEqual(embeddings.embed_query("  What is  BGE? "), [0.5])
+        model.embed_query.assert_called_once_with("  What is  BGE? ")
+        self.assertEqual(embeddings.embed_query("what is bge?"), [0.5])
+        self.assertEqual(model.embed_query.call_count, 1)
+
+
+class KeywordIndexTests(SimpleTestCase):
+    def test_exact_terms_outrank_a_paraphrase(self):
+        index = KeywordIndex()
+        index.add(0, "Open the account page and pick a new login secret if you forgot the old one.")
+        index.add(1, "Reset your password from the account page.")
+        index.add(2, "Invoices are emailed on the first day of every month.")
+        index.add(3, "Support answers within one business day.")
+        results = index.search("how do I reset my password", top_k=3)
+        self.assertEqual([doc_id for doc_id, _ in results], [1])
+        results = index.search("reset password account page", top_k=3)
+        self.assertEqual([doc_id for doc_id, _ in results], [1, 0])
+        self.assertGreater(results[0][1], results[1][1])
+
+
+class RetrievalTests(RAGDBTestCase):
+    def test_hits_name_their_db(self):
+        db = self.open_db()
+        db.add_records([record("apple"), record("cherry")])
+        results = hybrid_retrieve([db], "apple", top_k=2)
+        self.assertEqual([r["folder_path"] for r in results], [self.folder, self.folder])
+
+    def test_fusion_ranks_a_doc_found_by_both_retrievers_first(self):
+        keyword_hits = [{"content": "apple", "keyword_score": 3.0}, {"content": "banana", "keyword_score": 1.0}]
+        vector_hits = [{"content": "cherry", "distance": 0.1}, {"content": "apple", "distance": 0.2}]
+        fused = reciprocal_rank_fusion([keyword_hits, vector_hits], top_k=3, k=60)
+        self.assertEqual([r["content"] for r in fused], ["apple", "cherry", "banana"])
+        self.assertAlmostEqual(fused[0]["score"], 1 / 61 + 1 / 62)
+        self.assertEqual((fused[0]["keyword_score"], fused[0]["distance"]), (3.0, 0.2))
+        self.assertEqual(len(reciprocal_rank_fusion([keyword_hits, vector_hits], top_k=2)), 2)
+
+
+def file_chunk(text, index, folder_path="/rag/general/acme_u1", score=0.5):
+    chunk = {"chunk_type": "file_chunk", "file_name": "a.pdf", "chunk_index": index, "content": text}
+    return {"uid": "u1", "folder_path": folder_path, "chunk": chunk, **chunk, "score": score}
+
+
+class ContextBuilderTests(SimpleTestCase):
+    def test_adjacent_chunks_merge_only_within_one_db(self):
+        packed = build_context([file_chunk("first part", 0), file_chunk("second part", 1)])
+        self.assertEqual(packed.counts["chunks_merged"], 1)
+        packed = build_context([file_chunk("first part", 0), file_chunk("second part", 1, "/rag/sales/acme_u1")])
+        self.assertEqual(packed.counts["chunks_merged"], 0)
+        self.assertEqual(packed.text.count("\n\n"), 1)
+
+    def test_dropped_duplicate_keeps_its_score(self):
+        whole = file_chunk("apples and cherries", 0, score=0.2)
+        contained = file_chunk("apples", 7, score=0.9)
+        packed = build_context([contained, whole, file_chunk("bananas", 3, score=0.5)])
+        self.assertEqual(packed.counts["duplicates_dropped"], 1)
+        self.assertEqual([doc["content"] for doc in packed.docs], ["apples and cherries", "bananas"])
+        self.assertEqual(packed.docs[0]["score"], 0.9)
+        self.assertEqual(whole["score"], 0.2)
+
+
+class SemanticCacheTests(RAGDBTestCase):
+    def test_similar_question_hits(self):
+        cache = SemanticCache(threshold=0.95)
+        cache.set("t1", [1.0, 0.0], 1, {"answer": "A"}, 0.5)
+        self.assertEqual(cache.get("t1", [1.0, 0.1], 1), {"answer": "A"})  # cosine 0.995
+        self.assertIsNone(cache.get("t2", [1.0, 0.1], 1))
+        self.assertEqual(cache.stats()["latency_saved_seconds"], 0.5)
+
+    def test_dissimilar_question_misses(self):
+        cache = SemanticCache(threshold=0.95)
+        cache.set("t1", [1.0, 0.0], 1, {"answer": "A"}, 0.5)
+        self.assertIsNone(cache.get("t1", [1.0, 0.4], 1))  # cosine 0.93
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_writes_to_the_tenant_db_invalidate_answers(self):
+        cache = SemanticCache(threshold=0.95)
+        db = self.open_db()
+        db.add_records([record("apple")])
+        vector = self.embeddings.embed_query("what is an apple?")
+        cache.set("t1", vector, (db.folder_path, db.version), {"answer": "A"}, 0.5)
+        self.assertEqual(cache.get("t1", vector, (db.folder_path, db.version)), {"answer": "A"})
+        db.add_records([record("banana")])
+        self.assertIsNone(cache.get("t1", vector, (db.folder_path, db.version)))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+
+@mock.patch.multiple(index_types, RAG_HNSW_MIN_VECTORS=10, RAG_IVFPQ_MIN_VECTORS=1000, RAG_LARGE_INDEX_TYPE="ivfpq")
+class IndexTypeTests(SimpleTestCase):
+    def test_auto_moves_down_only_well_below_the_threshold(self):
+        self.assertEqual(index_types.target_index_type(12, "auto"), "hnsw")
+        self.assertEqual(index_types.target_index_type(9, "auto", current="hnsw"), "hnsw")
+        self.assertEqual(index_types.target_index_type(5, "auto", current="hnsw"), "hnsw")
+        self.assertEqual(index_types.target_index_type(4, "auto", current="hnsw"), "flat")
+        self.assertEqual(index_types.target_index_type(12, "auto", current="flat"), "hnsw")
+
+    def test_quantized_indexes_keep_their_type(self):
+        self.assertEqual(index_types.target_index_type(30000, "auto", current="hnsw"), "ivfpq")
+        self.assertEqual(index_types.target_index_type(10, "auto", current="ivfpq"), "ivfpq")
+        self.assertEqual(index_types.target_index_type(10, "flat", current="sq8"), "sq8")
+
+    def test_large_tier_defaults_to_hnsw(self):
+        with mock.patch.object(index_types, "RAG_LARGE_INDEX_TYPE", "hnsw"):
+            self.assertEqual(index_types.target_index_type(5000, "auto"), "hnsw")
+
+
+class StreamingTests(SimpleTestCase):
+    def test_sync_iteration_runs_one_event_at_a_time_and_closes_the_client(self):
+        client = mock.AsyncMock()
+        produced = []
+
+        async def events():
+            rag_pipeline._async_llms[asyncio.get_running_loop()] = (object(), client)
+            for i in range(3):
+                produced.append(i)
+                yield i
+
+        iterator = rag_pipeline.iterate_in_new_loop(events())
+        self.assertEqual(next(iterator), 0)
+        self.assertEqual(produced, [0])
+        self.assertEqual(list(iterator), [1, 2])
+        client.aclose.assert_awaited_once()
+
+    def test_wsgi_responses_stream_with_a_sync_iterator(self):
+        class Pipeline:
+            async def astream(self, query):
+                yield "sources", []
+                yield "token", {"text": "Hi"}
+                yield "done", {"answer": "Hi"}
+
+        request = RequestFactory().post("/rag/", {"stream": True}, content_type="application/json")
+        response = views.stream_rag_answer(request, Pipeline(), "hello", include_sources=False)
+        self.assertFalse(response.is_async)
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertEqual(chunks, ['event: token\ndata: {"text": "Hi"}\n\n', 'event: done\ndata: {"answer": "Hi"}\n\n'])
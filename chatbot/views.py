@@ -2,28 +2,18 @@ import os
 import re
 import json
 import uuid
-import tempfile
 import markdown
 from django.shortcuts import render
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from .mongo_client import collection
+from django.core.files.move import file_move_safe
+from django.core.handlers.asgi import ASGIRequest
+from .profiles import profile_repository
+from .session_backend import checkpoint
 from .rag_client import rag_db_manager
-from .file_utils import extract_text_chunks_from_file
-from .rag_pipeline import create_rag_pipeline
-
-from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
-
-FIELD_LLM_PATHS = {
-    "agriculture": r"E:\Finetuned LLMs\fine_tuned_agriculture_model\final_model",
-    "tourism": r"E:\Finetuned LLMs\fine_tuned_tourism_model\final_model",
-    "transport": r"E:\Finetuned LLMs\fine_tuned_transport_model\final_model",
-}
-FIELD_LLM_TOKENIZERS = {
-    "agriculture": r"E:\Finetuned LLMs\fine_tuned_agriculture_model\final_tokenizer",
-    "tourism": r"E:\Finetuned LLMs\fine_tuned_tourism_model\final_tokenizer",
-    "transport": r"E:\Finetuned LLMs\fine_tuned_transport_model\final_tokenizer",
-}
+from .ingest import ingest_queue
+from .rag_pipeline import create_rag_pipeline, run_in_rag_executor, close_async_llm, iterate_in_new_loop
+from .llm_registry import field_llm_registry
 
 TREE_PATH = os.path.join(os.path.dirname(__file__), 'question_tree.json')
 with open(TREE_PATH, 'r') as f:
@@ -40,15 +30,39 @@ def get_user_meta(session):
         "field": session.get("field"),
     }
 
-def get_finetuned_llm(field):
-    path = FIELD_LLM_PATHS.get(field)
-    tokenizer_path = FIELD_LLM_TOKENIZERS.get(field)
-    if not path or not tokenizer_path:
-        return None
-    tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
-    model = AutoModelForCausalLM.from_pretrained(path)
-    llm_pipe = pipeline("text-generation", model=model, tokenizer=tokenizer, max_new_tokens=128)
-    return llm_pipe
+def wants_stream(request, data):
+    return bool(data.get("stream")) or "text/event-stream" in request.headers.get("Accept", "")
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+async def _sse_events(events, include_sources=True):
+    try:
+        async for event, payload in events:
+            if event == "sources" and not include_sources:
+                continue
+            yield _sse(event, payload)
+    except Exception as e:
+        yield _sse("error", {"error": str(e)})
+
+def stream_rag_answer(request, rag_pipeline, query, include_sources=True):
+    """Server-Sent Events response: sources first, then LLM tokens as they arrive, then the final answer."""
+    events = _sse_events(rag_pipeline.astream(query), include_sources)
+    if not isinstance(request, ASGIRequest):
+        # WSGI buffers async iterators whole, so hand it a sync one that still yields per token.
+        events = iterate_in_new_loop(events)
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+async def answer_query(request, rag_pipeline, query):
+    try:
+        return await rag_pipeline.acall(query)
+    finally:
+        if not isinstance(request, ASGIRequest):
+            # This event loop ends with the request under WSGI; don't leave its HTTP client open.
+            await close_async_llm()
 
 @csrf_exempt
 def chatbot_api(request):
@@ -71,8 +85,7 @@ def chatbot_api(request):
 
     if action == "name":
         generated_uid = str(uuid.uuid4())
-        user_data = {"uid": generated_uid, "name": name}
-        collection.insert_one(user_data)
+        profile_repository.create(generated_uid, name=name)
         session["uid"] = generated_uid
         session["name"] = name
         session["company_name"] = name
@@ -89,7 +102,7 @@ def chatbot_api(request):
             return JsonResponse({"error": "Missing uid or contact"}, status=400)
         if not re.match(r'^(\+94\d{9}|0\d{9})$', contact):
             return JsonResponse({"error": "Invalid contact number"}, status=400)
-        collection.update_one({"uid": uid}, {"$set": {"contact": contact}})
+        profile_repository.update(uid, contact=contact)
         session["contact"] = contact
         session.modified = True
         return JsonResponse({"message": "Contact saved!"})
@@ -99,7 +112,7 @@ def chatbot_api(request):
             return JsonResponse({"error": "Missing uid or email"}, status=400)
         if not re.match(r'^[\w\.-]+@[\w\.-]+\.\w+$', email):
             return JsonResponse({"error": "Invalid email address"}, status=400)
-        collection.update_one({"uid": uid}, {"$set": {"email": email}})
+        profile_repository.update(uid, email=email)
         session["email"] = email
         session.modified = True
         buttons = [
@@ -114,7 +127,7 @@ def chatbot_api(request):
             return JsonResponse({"error": "Missing uid or field"}, status=400)
         if field_selected not in QUESTION_TREE:
             return JsonResponse({"error": "Invalid field selected"}, status=400)
-        collection.update_one({"uid": uid}, {"$set": {"field": field_selected}})
+        profile_repository.update(uid, field=field_selected)
         session["field"] = field_selected
         session.modified = True
         first_question = QUESTION_TREE[field_selected][0]
@@ -166,6 +179,7 @@ def chatbot_api(request):
             if "answers" in session:
                 del session["answers"]
             session.modified = True
+            checkpoint(session)
             return JsonResponse({
                 "message": "Do you want to add company data in files?",
                 "show_file_upload": True
@@ -234,14 +248,14 @@ def chatbot_api(request):
             session['llm_data_active'] = False
             session["dual_agents_prompt"] = True
             session.modified = True
+            checkpoint(session)
             return JsonResponse({
                 "message": "Thanks for your responses! Your advanced data has been saved.",
                 "dual_agents_prompt": True,
             })
-        llm_pipe = get_finetuned_llm(field)
-        if not llm_pipe:
+        llm_output = field_llm_registry.generate(field, user_message, max_new_tokens=128)
+        if llm_output is None:
             return JsonResponse({"error": f"No LLM found for field '{field}'"}, status=500)
-        llm_output = llm_pipe(user_message, max_new_tokens=128)[0]['generated_text']
         answer_only = llm_output
         if user_message in llm_output:
             answer_only = llm_output.split(user_message, 1)[-1].strip(" :\n")
@@ -299,37 +313,35 @@ def chatbot_file_upload(request):
         return JsonResponse({"error": "No file uploaded"}, status=400)
 
     uploaded_file = request.FILES["file"]
-    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-        for chunk in uploaded_file.chunks():
-            tmp.write(chunk)
-        file_path = tmp.name
-
-    try:
-        file_chunks = extract_text_chunks_from_file(file_path, uploaded_file.name)
-    except Exception as e:
-        os.remove(file_path)
-        return JsonResponse({"error": f"File parsing error: {str(e)}"}, status=500)
-    os.remove(file_path)
-
-    user_db = rag_db_manager.get_user_db(company_name, uid, field_val)
-    meta = get_user_meta(request.session)
-
-    prev_chunks = []
-    if user_db.meta and user_db.meta[0].get("chunks"):
-        prev_chunks = user_db.meta[0]["chunks"]
-
-    prev_chunks.extend(file_chunks)
-
-    user_db.add_records([{
-        "uid": uid,
-        "meta": meta,
-        "chunks": prev_chunks
-    }])
-
-    return JsonResponse({"next_action": "file_uploaded"})
+    job_id = ingest_queue.new_job_id()
+    file_path = ingest_queue.spool_path(job_id, uploaded_file.name)
+    if hasattr(uploaded_file, "temporary_file_path"):
+        # Large uploads are already on disk; move them instead of copying.
+        file_move_safe(uploaded_file.temporary_file_path(), file_path, allow_overwrite=True)
+    else:
+        with open(file_path, "wb") as f:
+            for chunk in uploaded_file.chunks():
+                f.write(chunk)
+
+    # Parsing and embedding run in the ingest worker pool; poll status_url for progress.
+    ingest_queue.enqueue(
+        job_id, company_name, uid, field_val, get_user_meta(request.session), uploaded_file.name, file_path
+    )
+    return JsonResponse({
+        "next_action": "file_uploaded",
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/chat/api/upload-status/{job_id}/"
+    }, status=202)
+
+def chatbot_upload_status(request, job_id):
+    job = ingest_queue.get(job_id)
+    if not job:
+        return JsonResponse({"error": "Unknown job id"}, status=404)
+    return JsonResponse(job)
 
 @csrf_exempt
-def chatbot_rag_query(request):
+async def chatbot_rag_query(request):
     if request.method != "POST":
         return JsonResponse({"error": "Only POST method allowed"}, status=405)
 
@@ -347,14 +359,16 @@ def chatbot_rag_query(request):
         return JsonResponse({"error": "Missing company_name, uid, or query"}, status=400)
 
     rag_pipeline = create_rag_pipeline(company_name, uid, field)
-    result = rag_pipeline(query)
+    if wants_stream(request, data):
+        return stream_rag_answer(request, rag_pipeline, query)
+    result = await answer_query(request, rag_pipeline, query)
     return JsonResponse({
         "answer": result["answer"],
         "sources": result["sources"]
     })
 
 @csrf_exempt
-def business_owner_agent_api(request, company_name, uid):
+async def business_owner_agent_api(request, company_name, uid):
     if request.method != "POST":
         return JsonResponse({"error": "Only POST allowed"}, status=405)
     try:
@@ -368,29 +382,24 @@ def business_owner_agent_api(request, company_name, uid):
         if not query:
             return JsonResponse({"error": "Missing query"}, status=400)
         rag_pipeline = create_rag_pipeline(company_name, uid, field)
-        result = rag_pipeline(query)
+        if wants_stream(request, data):
+            return stream_rag_answer(request, rag_pipeline, query)
+        result = await answer_query(request, rag_pipeline, query)
         return JsonResponse({"answer": result["answer"], "sources": result["sources"]})
     elif action == "update":
         field_name = data.get("field")
         value = data.get("value")
         if not (field and field_name and value):
             return JsonResponse({"error": "Missing update parameters"}, status=400)
-        user_db = rag_db_manager.get_user_db(company_name, uid, field)
-        user_db.add_records([{
-            "uid": uid,
-            "meta": {},
-            "chunks": [{
-                "chunk_type": "qa",
-                "question": f"UPDATE FIELD: {field_name}",
-                "answer": value
-            }]
-        }])
+        user_db = await run_in_rag_executor(rag_db_manager.get_user_db, company_name, uid, field)
+        # Replaces the previous value, so stale answers stop being retrieved.
+        await run_in_rag_executor(user_db.upsert, uid, None, f"UPDATE FIELD: {field_name}", value)
         return JsonResponse({"message": f"Field '{field_name}' updated with value: {value}"})
     else:
         return JsonResponse({"error": "Unknown action"}, status=400)
 
 @csrf_exempt
-def client_agent_api(request, company_name, uid):
+async def client_agent_api(request, company_name, uid):
     if request.method != "POST":
         return JsonResponse({"error": "Only POST allowed"}, status=405)
     try:
@@ -402,7 +411,10 @@ def client_agent_api(request, company_name, uid):
     if not query:
         return JsonResponse({"error": "Missing query"}, status=400)
     rag_pipeline = create_rag_pipeline(company_name, uid, field)
-    result = rag_pipeline(query)
+    if wants_stream(request, data):
+        # The customer agent never exposes raw sources, streamed or not.
+        return stream_rag_answer(request, rag_pipeline, query, include_sources=False)
+    result = await answer_query(request, rag_pipeline, query)
     return JsonResponse({"answer": result["answer"]})
 
 # ---- HTML DOWNLOAD VIEW ----
@@ -59,4 +59,32 @@ DATABASES = {
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
-]
\ No newline at end of file
+]
+# Session storage for onboarding / chat state:
+#   db          Django's database engine; every request reads and writes db.sqlite3
+#   checkpoint  cache, written to the database only at checkpoints (chatbot/session_backend.py)
+#   cache       cache only; sessions are lost on eviction or restart
+#   cookie      signed, compressed cookie; state travels with each request (browsers cap it near 4 KB)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "db")
+SESSION_ENGINE = {
+    "db": "django.contrib.sessions.backends.db",
+    "checkpoint": "chatbot.session_backend",
+    "cache": "django.contrib.sessions.backends.cache",
+    "cookie": "django.contrib.sessions.backends.signed_cookies",
+}[SESSION_BACKEND]
+SESSION_CACHE_ALIAS = "sessions"
+
+# In-process and bounded unless SESSION_CACHE_LOCATION points at Redis; run
+# several workers with checkpoint/cache sessions only on a shared cache.
+SESSION_CACHE_LOCATION = os.getenv("SESSION_CACHE_LOCATION", "")
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "sessions": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": SESSION_CACHE_LOCATION,
+    } if SESSION_CACHE_LOCATION.startswith(("redis://", "rediss://")) else {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "chatbot-sessions",
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000"))},
+    },
+}